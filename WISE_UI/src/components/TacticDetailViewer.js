@@ -1,5 +1,5 @@
-import React, { useState, useEffect } from 'react';
-import tacticsData from '../tacticsData.json';
+import React, { useState } from 'react';
+import useTacticDetails from '../hooks/useTacticDetails';
 import {
   LightbulbIcon, Target, AlertTriangle, XCircle, CheckCircle,
   Eye, MessageCircle, Users, Clock, Shield,
@@ -119,23 +119,14 @@ function renderCitations(citationIds = [], allCitations = []) {
 }
 
 const TacticDetailViewer = ({ tacticId, tacticData }) => {
-  const [tactic, setTactic] = useState(null);
   const [activeTab, setActiveTab] = useState('overview');
+  // If direct tactic data is provided, use it; otherwise fetch it from the backend by ID
+  const { tactic: fetchedTactic, error } = useTacticDetails(tacticData ? null : tacticId);
+  const tactic = tacticData || fetchedTactic;
 
-  useEffect(() => {
-    // If direct tactic data is provided, use it
-    if (tacticData) {
-      setTactic(tacticData);
-      return;
-    }
-    
-    // Otherwise, load from tacticsData using ID
-    if (tacticId) {
-      const selectedTactic = tacticsData.find(t => t.id === tacticId);
-      setTactic(selectedTactic);
-    }
-  }, [tacticId, tacticData]);
-
+  if (error) {
+    return <div className="p-4">Could not load tactic details: {error}</div>;
+  }
   if (!tactic) {
     return <div className="p-4">Loading tactic details...</div>;
   }
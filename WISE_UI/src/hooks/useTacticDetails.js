@@ -0,0 +1,54 @@
+import { useState, useEffect } from 'react';
+
+const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
+
+// Details already fetched (or being fetched) in this session, by tactic id.
+// The browser revalidates repeat requests with the ETag, so this only saves the round trip.
+const tacticCache = new Map();
+
+function fetchTactic(tacticId) {
+  if (!tacticCache.has(tacticId)) {
+    const request = fetch(`${API_URL}/api/tactics/${tacticId}`)
+      .then((response) => {
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return response.json();
+      })
+      .catch((err) => {
+        tacticCache.delete(tacticId); // Let a later render retry
+        throw err;
+      });
+    tacticCache.set(tacticId, request);
+  }
+  return tacticCache.get(tacticId);
+}
+
+// Loads the full learning material for one tactic from the backend on demand,
+// instead of bundling every tactic's details into the app.
+export default function useTacticDetails(tacticId) {
+  const [tactic, setTactic] = useState(null);
+  const [error, setError] = useState(null);
+
+  useEffect(() => {
+    if (!tacticId) {
+      return undefined;
+    }
+    let cancelled = false;
+    setTactic(null);
+    setError(null);
+    fetchTactic(tacticId)
+      .then((data) => {
+        if (!cancelled) setTactic(data);
+      })
+      .catch((err) => {
+        console.error(`[useTacticDetails] Failed to load tactic ${tacticId}:`, err);
+        if (!cancelled) setError(err.message || 'Could not load tactic details.');
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [tacticId]);
+
+  return { tactic, error };
+}
@@ -0,0 +1,216 @@
+# WISE_backend/app/admission.py
+
+"""
+Admission control in front of the analysis pipeline.
+
+Limits how many analyses run at once, both globally and per API key (by its
+salted hash, see client_pool.hash_api_key). Requests that can't start
+immediately wait in a per-key FIFO queue. Free slots are handed out
+round-robin across keys, so one user uploading a batch of files can't starve
+everyone else. Waiting is bounded: when the queues are full, or a request
+waits longer than the maximum, it is rejected right away with a status and
+Retry-After. Then clients back off instead of piling up behind the backlog.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from app.constants import (
+    ADMISSION_ENABLED,
+    ADMISSION_MAX_IN_FLIGHT,
+    ADMISSION_PER_KEY_MAX_IN_FLIGHT,
+    ADMISSION_MAX_QUEUED,
+    ADMISSION_PER_KEY_MAX_QUEUED,
+    ADMISSION_MAX_WAIT_SECONDS,
+)
+from app.metrics import ADMISSION_WAIT_SECONDS
+
+HOLD_TIME_SMOOTHING = 0.2 # EWMA weight of the newest analysis duration
+DEFAULT_HOLD_SECONDS = 10.0 # Assumed analysis duration before any has finished
+
+
+# --- Custom Exceptions ---
+class AdmissionRejectedError(Exception):
+    """The request can't be admitted now. status_code is 429 (this key's share is used up) or 503 (server full)."""
+    def __init__(self, message: str, status_code: int, retry_after: float):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+# -------------------------
+
+
+class AdmissionTicket:
+    """A granted slot. release() is idempotent so every exit path can call it."""
+
+    def __init__(self, controller: Optional["AdmissionController"], key_hash: str):
+        self._controller = controller
+        self._key_hash = key_hash
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        if self._controller is not None:
+            self._controller._release(self._key_hash, time.monotonic() - self._started)
+
+
+class AdmissionController:
+    """Global and per-key concurrency caps with round-robin fair, bounded waiting."""
+
+    def __init__(
+        self,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        per_key_max_in_flight: int = ADMISSION_PER_KEY_MAX_IN_FLIGHT,
+        max_queued: int = ADMISSION_MAX_QUEUED,
+        per_key_max_queued: int = ADMISSION_PER_KEY_MAX_QUEUED,
+        max_wait_seconds: float = ADMISSION_MAX_WAIT_SECONDS,
+        enabled: bool = ADMISSION_ENABLED,
+    ):
+        self.max_in_flight = max_in_flight
+        self.per_key_max_in_flight = per_key_max_in_flight
+        self.max_queued = max_queued
+        self.per_key_max_queued = per_key_max_queued
+        self.max_wait_seconds = max_wait_seconds
+        self.enabled = enabled
+        self._in_flight = 0
+        self._in_flight_by_key: Dict[str, int] = {}
+        # key hash -> waiting futures; dict order is the round-robin rotation
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0
+        self._hold_seconds = DEFAULT_HOLD_SECONDS
+        self.stats = {"admitted": 0, "waited": 0, "rejected_key": 0, "rejected_capacity": 0, "timed_out": 0}
+
+    @asynccontextmanager
+    async def admit(self, key_hash: str):
+        """Holds an admission slot for the duration of the block. Raises AdmissionRejectedError."""
+        ticket = await self.acquire(key_hash)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    async def acquire(self, key_hash: str) -> AdmissionTicket:
+        """Returns a ticket once the request may run; the caller must release() it. Raises AdmissionRejectedError."""
+        if not self.enabled:
+            return AdmissionTicket(None, key_hash)
+        # Free slots are always handed to waiters first (see _dispatch), so anything queued here can't run yet
+        if self._has_slot(key_hash):
+            self._grant(key_hash)
+            return AdmissionTicket(self, key_hash)
+
+        queue = self._queues.get(key_hash)
+        key_limited = self._in_flight_by_key.get(key_hash, 0) >= self.per_key_max_in_flight
+        if queue is not None and len(queue) >= self.per_key_max_queued:
+            raise self._reject(key_hash, "rejected_key")
+        if self._queued >= self.max_queued or self.max_wait_seconds <= 0:
+            raise self._reject(key_hash, "rejected_key" if key_limited else "rejected_capacity")
+
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[key_hash] = deque()
+        queue.append(future)
+        self._queued += 1
+        waited_from = time.monotonic()
+        try:
+            await asyncio.wait_for(future, self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            if not (future.done() and not future.cancelled()): # Else granted just as the wait ran out; keep it
+                self._remove_waiter(key_hash, future)
+                self.stats["timed_out"] += 1
+                raise AdmissionRejectedError(
+                    "The server is busy and the request could not start in time. Please try again shortly.",
+                    503, self._retry_after(self._queued, self.max_in_flight),
+                ) from None
+        except asyncio.CancelledError:
+            # Client went away; give back a slot that was granted in the meantime
+            if not self._remove_waiter(key_hash, future) and future.done() and not future.cancelled():
+                self._release(key_hash, 0.0)
+            raise
+        self.stats["waited"] += 1
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - waited_from)
+        return AdmissionTicket(self, key_hash)
+
+    def _has_slot(self, key_hash: str) -> bool:
+        return (self._in_flight < self.max_in_flight
+                and self._in_flight_by_key.get(key_hash, 0) < self.per_key_max_in_flight)
+
+    def _grant(self, key_hash: str) -> None:
+        self._in_flight += 1
+        self._in_flight_by_key[key_hash] = self._in_flight_by_key.get(key_hash, 0) + 1
+        self.stats["admitted"] += 1
+
+    def _release(self, key_hash: str, held_seconds: float) -> None:
+        self._in_flight -= 1
+        remaining = self._in_flight_by_key.get(key_hash, 1) - 1
+        if remaining > 0:
+            self._in_flight_by_key[key_hash] = remaining
+        else:
+            self._in_flight_by_key.pop(key_hash, None)
+        if held_seconds > 0:
+            self._hold_seconds += HOLD_TIME_SMOOTHING * (held_seconds - self._hold_seconds)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hands free slots to waiting requests, one per key in turn."""
+        while self._queues and self._in_flight < self.max_in_flight:
+            for key_hash in list(self._queues):
+                if self._in_flight_by_key.get(key_hash, 0) >= self.per_key_max_in_flight:
+                    continue
+                queue = self._queues.pop(key_hash)
+                future = queue.popleft()
+                self._queued -= 1
+                if queue:
+                    self._queues[key_hash] = queue # To the back of the rotation
+                if future.done(): # Timed out or cancelled, not yet cleaned up by its waiter
+                    break
+                self._grant(key_hash)
+                future.set_result(None)
+                break
+            else:
+                return # Every waiting key is at its own limit
+
+    def _remove_waiter(self, key_hash: str, future: asyncio.Future) -> bool:
+        queue = self._queues.get(key_hash)
+        if queue is None or future not in queue:
+            return False
+        queue.remove(future)
+        self._queued -= 1
+        if not queue:
+            del self._queues[key_hash]
+        return True
+
+    def _retry_after(self, waiting: int, slots: int) -> float:
+        """Rough time until a slot frees up for a newcomer, from the recent analysis duration."""
+        return max(1.0, math.ceil(self._hold_seconds * (waiting + 1) / max(1, slots)))
+
+    def _reject(self, key_hash: str, outcome: str) -> AdmissionRejectedError:
+        self.stats[outcome] += 1
+        if outcome == "rejected_key":
+            queue = self._queues.get(key_hash)
+            return AdmissionRejectedError(
+                "Too many analyses are in progress for this API key. Please wait for them to finish.",
+                429, self._retry_after(len(queue) if queue else 0, self.per_key_max_in_flight),
+            )
+        return AdmissionRejectedError(
+            "The server is at capacity. Please try again shortly.",
+            503, self._retry_after(self._queued, self.max_in_flight),
+        )
+
+    def snapshot_stats(self) -> dict:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "keys_in_flight": len(self._in_flight_by_key),
+            "keys_waiting": len(self._queues),
+        }
+
+
+# Shared process-wide controller used by the API endpoints
+admission_controller = AdmissionController()
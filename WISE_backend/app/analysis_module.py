@@ -1,161 +1,295 @@
-import os
-import json
+import copy
 import asyncio
-from google import genai
-import xml.etree.ElementTree as ET #
-from pydantic import BaseModel, Field, ValidationError 
-from typing import List, Optional, Union
+import datetime
+from pydantic import ValidationError
+from typing import Any, AsyncIterator, List, Optional, Tuple
 from collections import defaultdict
 
 # Import models from app.models to avoid duplication
 from app.models import (
     Metadata,
-    ExecutiveSummary,
-    IntentBreakdownItem,
-    ManipulationCategory,
-    OverallAssessment,
     Tactic,
-    DetailedReportSections,
     AnalysisResultFromAPI, # This is the structure expected from GenAI
     FinalAnalysisResult # This is the final structure the endpoint will return
 )
+from app.constants import (
+    GEMINI_MODEL_NAME,
+    CHUNK_MAX_CHARS,
+    CHUNK_OVERLAP_CHARS,
+    CHUNK_MAX_CONCURRENCY,
+    PRESCREEN_MODE,
+    PRESCREEN_CONTEXT_PARAGRAPHS,
+    LLM_DEADLINE_SECONDS,
+)
+from app.chunking import TextChunk, split_into_chunks, merge_chunk_results, dedupe_tactics, compute_intent_breakdown
+from app.streaming import JSONStreamScanner
+from app.result_cache import result_cache, make_cache_key
+from app.client_pool import client_pool
+from app.prescreen import PrescreenIndex, benign_result
+from app.knowledge import knowledge_base
+from app.quote_spans import DocumentIndex, add_quote_spans
+from app.incremental import paragraph_store, split_paragraphs, IncrementalPlan
+from app.prompt_builder import PromptTemplate, AnalysisPlan, plan_analysis, STRATEGY_CHUNKED
+from app.metrics import stage, TACTIC_COUNT, ANALYSIS_STRATEGY
+from app.startup import startup_report
+from app.llm_scheduler import (
+    LLMScheduler, Deadline, CircuitOpenError, DeadlineExceededError, is_retryable, status_code,
+    retry_after_seconds, RATE_LIMITED_STATUS_CODE,
+)
 
 # --- Custom Exception ---
 class AnalysisError(Exception):
     """Custom exception for errors during the analysis process."""
     pass
+
+class UpstreamError(AnalysisError):
+    """The model API was unavailable, rate limited or too slow; carries the HTTP status to report."""
+    def __init__(self, message: str, status_code: int = 503, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
 # ----------------------
 
-# Load the taxonomy from the JSON file
-try:
-    taxonomy_path = os.path.join(os.path.dirname(__file__), '..', 'taxonomy_kb.json')
-    with open(taxonomy_path, 'r') as f:
-        taxonomy_kb = json.load(f)
-    taxonomy = taxonomy_kb.get('taxonomy', {})
-except FileNotFoundError:
-    print(f"Warning: taxonomy_kb.json not found at expected path {taxonomy_path}. Tactic information might be limited.")
-    taxonomy = {}
-except json.JSONDecodeError:
-    print(f"Warning: Could not decode taxonomy_kb.json at {taxonomy_path}. File might be corrupted.")
-    taxonomy = {}
+# The taxonomy, loaded once at startup with the tactic learning material (see app.knowledge)
+taxonomy = knowledge_base.taxonomy
+
+# Built once at startup; screening a document then takes milliseconds
+prescreen_index = PrescreenIndex(taxonomy, knowledge_base.details)
+# Compiled once at startup; its version is part of every result cache key
+prompt_template = PromptTemplate(taxonomy)
+# Deadlines, retries, hedging, circuit breaking and fallback for every model call
+llm_scheduler = LLMScheduler(client_pool.call_slot)
+
+
+class _PreparedInput:
+    """What actually goes to the model after the local pre-screen."""
+    def __init__(self, text: str, candidate_ids: Optional[List[int]] = None, local_result: Optional[dict] = None):
+        self.text = text
+        self.candidate_ids = candidate_ids
+        self.local_result = local_result # Set when no model call is needed
+
+
+def _prepare_input(file_content: str) -> _PreparedInput:
+    """Runs the local pre-screen according to PRESCREEN_MODE."""
+    if PRESCREEN_MODE not in ("hint", "filter"):
+        return _PreparedInput(file_content)
+    with stage("prescreen"):
+        screen = prescreen_index.screen(file_content)
+    print(f"Pre-screen flagged {len(screen.candidates)} candidate tactics in {len(screen.paragraphs)} paragraphs.")
+    if PRESCREEN_MODE == "hint":
+        return _PreparedInput(file_content, screen.hint_ids)
+    if not screen.candidates:
+        return _PreparedInput(file_content, [], benign_result(datetime.date.today().isoformat()))
+    with stage("prescreen_excerpt"):
+        excerpt = prescreen_index.excerpt(file_content, screen, PRESCREEN_CONTEXT_PARAGRAPHS)
+    return _PreparedInput(excerpt, screen.candidate_ids)
 
 
-async def run_wise(file_content: str, user_api_key: str) -> dict:
+def _plan(prepared: _PreparedInput) -> AnalysisPlan:
+    candidate_count = len(prepared.candidate_ids) if prepared.candidate_ids is not None else None
+    plan = plan_analysis(prompt_template, len(prepared.text), candidate_count)
+    ANALYSIS_STRATEGY.inc(strategy=plan.strategy)
+    print(f"Analysis plan: {plan.strategy} (~{plan.input_tokens} input / ~{plan.output_tokens} output tokens, "
+          f"~{plan.estimated_seconds:.1f}s estimated, {plan.chunk_count} chunk(s)).")
+    return plan
+
+
+async def run_wise(file_content: str, user_api_key: str, incremental: bool = True) -> dict:
     """
     Runs WISE analysis using the provided user_api_key,
     gets structured JSON, adds icons & category counts,
     returns dict or raises AnalysisError.
+
+    Results are served from the content-addressed result cache when the same
+    text was already analyzed with the current model and prompt version. When
+    the same key recently analyzed an earlier version of the document, only
+    the changed paragraphs are re-analyzed (see app.incremental). Callers
+    analysing fragments rather than documents (chat export windows) pass
+    incremental=False, so the fragments don't displace the key's documents.
     """
     if not user_api_key:
         raise AnalysisError("API key was not provided for GenAI client initialization.")
 
+    cache_key = make_cache_key(file_content, GEMINI_MODEL_NAME, prompt_template.version)
+    deadline = Deadline(LLM_DEADLINE_SECONDS)
+    plan = None
+    if incremental:
+        with stage("paragraph_hash"):
+            paragraphs = split_paragraphs(file_content)
+        scope = paragraph_store.scope(user_api_key, GEMINI_MODEL_NAME, prompt_template.version)
+        plan = paragraph_store.plan(scope, paragraphs) if not result_cache.contains(cache_key) else None
+    if plan is not None:
+        # Built on this key's earlier findings, so it is neither cached nor shared with other requests
+        result_data = await _run_incremental(file_content, user_api_key, plan, deadline)
+    else:
+        result_data = await result_cache.get_or_compute(
+            cache_key, lambda: _run_wise_uncached(file_content, user_api_key, deadline),
+            store=lambda _: not deadline.fallback_used, # Don't serve fallback-model results for the primary model later
+        )
+    # Spans are resolved against this exact text (not cached), since cache keys ignore whitespace differences
+    with stage("quote_spans"):
+        add_quote_spans(result_data.get('tactics', []), DocumentIndex(file_content))
+    if incremental and not deadline.fallback_used: # Later edits would reuse them as primary-model findings
+        paragraph_store.record(scope, paragraphs, result_data)
+    startup_report.milestone("first_analysis")
+    return result_data
+
+
+async def _run_wise_uncached(file_content: str, user_api_key: str, deadline: Deadline) -> dict:
+    """Performs the actual GenAI call(s) and backend processing for run_wise."""
+    prepared = _prepare_input(file_content)
+    if prepared.local_result is not None:
+        print("Pre-screen found no manipulation cues; skipping the GenAI call.")
+        ANALYSIS_STRATEGY.inc(strategy="prescreen_skip")
+        with stage("aggregation"):
+            return finalize_result(prepared.local_result)
+
+    with client_pool.lease(_create_client(user_api_key)) as current_request_client:
+        plan = _plan(prepared)
+        if plan.strategy == STRATEGY_CHUNKED:
+            result_data = await _run_chunked_analysis(current_request_client, prepared.text, prepared.candidate_ids,
+                                                      deadline)
+        else:
+            print("Running WISE analysis (async)... requesting structured JSON...")
+            api_result = await _generate_analysis(current_request_client, prepared.text, prepared.candidate_ids,
+                                                  plan.trimmed, deadline)
+            result_data = api_result.model_dump() # Convert Pydantic model to dict
+
+    try:
+        with stage("aggregation"):
+            result_data = finalize_result(result_data)
+    except Exception as proc_e:
+        print(f"ERROR: Failed during backend processing of API response: {proc_e}")
+        raise AnalysisError(f"Backend processing failed: {proc_e}") from proc_e
+    print("Backend processing complete.")
+    return result_data
+
+
+async def _run_incremental(file_content: str, user_api_key: str, plan: IncrementalPlan, deadline: Deadline) -> dict:
+    """
+    Re-analyzes only the changed paragraphs of an edited document (with their
+    neighbours as context) and merges the new findings with the reused ones.
+    intentBreakdown and manipulationByCategory are recomputed from the merged tactics.
+    """
+    base = copy.deepcopy(plan.base.result)
+    base.pop('manipulationByCategory', None)
+    score = str(base['metadata'].get('confidenceScore') or "")
+    base['metadata']['confidenceScore'] = int(score) if score.isdigit() else None
+    base['tactics'] = plan.reused_tactics
+    print(f"Incremental analysis: {len(plan.changed)} of {len(plan.paragraphs)} paragraphs changed, "
+          f"reusing {len(plan.reused_tactics)} tactics.")
+    ANALYSIS_STRATEGY.inc(strategy="incremental")
+
+    new_tactics = 0
+    if not plan.changed:
+        result_data = base
+        result_data['intentBreakdown'] = compute_intent_breakdown(result_data['tactics'])
+    else:
+        excerpt = paragraph_store.excerpt(file_content, plan)
+        prepared = _prepare_input(excerpt)
+        if prepared.local_result is not None:
+            delta = prepared.local_result
+        else:
+            with client_pool.lease(_create_client(user_api_key)) as client:
+                delta_plan = _plan(prepared)
+                if delta_plan.strategy == STRATEGY_CHUNKED:
+                    delta = await _run_chunked_analysis(client, prepared.text, prepared.candidate_ids, deadline)
+                else:
+                    api_result = await _generate_analysis(client, prepared.text, prepared.candidate_ids,
+                                                          delta_plan.trimmed, deadline)
+                    delta = api_result.model_dump()
+        # Findings in the context paragraphs were already reused from the earlier analysis
+        with stage("quote_spans"):
+            add_quote_spans(delta['tactics'], DocumentIndex(file_content))
+        delta['tactics'] = [t for t in delta['tactics'] if plan.in_changed_paragraph(t.pop('quoteSpan'))]
+        new_tactics = len(delta['tactics'])
+        changed = set(plan.changed)
+        unchanged_text = "\n".join(file_content[p.start:p.end] for position, p in enumerate(plan.paragraphs)
+                                   if position not in changed)
+        with stage("chunk_merge"):
+            result_data = merge_chunk_results(
+                [base, delta], [TextChunk(0, unchanged_text, 0, 0), TextChunk(1, excerpt, 0, 0)]
+            )
+
+    with stage("aggregation"):
+        result_data = finalize_result(result_data)
+    result_data['reuse'] = plan.stats(new_tactics)
+    return result_data
+
+
+def _create_client(user_api_key: str):
     try:
-        current_request_client = genai.Client(api_key=user_api_key)
-        print("GenAI client initialized successfully with user-provided key for this request.")
+        with stage("client_init"):
+            client = client_pool.get_client(user_api_key)
+        print("GenAI client ready (pooled) for user-provided key.")
+        return client
     except Exception as e:
         print(f"Error initializing GenAI client with user-provided key: {e}")
         raise AnalysisError(f"Failed to initialize GenAI client with the provided API key. Please check the key. Original error: {e}") from e
 
-    print("Running WISE analysis (async)... requesting structured JSON...")
-    model_name = "models/gemini-2.0-flash" 
-
-    # Prompt content (ensure constants are loaded if these strings are moved to constants.py)
-    contents = [ "Persona: Informed Persuasion Analyst",
-        f"Objective: Deconstruct and analyse the following text to detect and distinguish between legitimate persuasion vs purposeful manipulation:\n--- START TEXT ---\n{file_content}\n--- END TEXT ---",
-        "Process (Chain-of-Thought):",
-        "1.  Identify author's Stated Goal: What does the author explicitly say they want to achieve with this communication?",
-        "2.  List Persuasive Tactics Used: Identify all manipulative tactics present in the text using the provided taxonomy (taxonomy_kb.json).",
-        "3.  Assess Necessity of Tactics: Are these tactics necessary to achieve the stated goal, or are they excessive and primarily intended to manipulate the audience's emotions or beliefs?",
-        "4.  Infer Author's Intent: Based on the above factors, determine the author's likely intent: Primarily to inform/persuade rationally, or primarily to manipulate/deceive? Provide a confidence score (as a number 0-100) for this assessment.",
-        "5. Identify Factual Claims: Scrutinise the text for specific, verifiable factual claims (e.g., statistics, dates, events). Prioritise claims that are central to the speaker's argument or that seem questionable.",
-        "6. Identify grounded and ethical resistance strategies for each identified tactic.",
-        "7. If the text is making unsubstantiated claims of fact, or twisting facts to strengthen an identified tactic:  use web search to source evidence that either directly disproves or challenges such claims, choose the (maximum) 3 most relevant and trustworthy sources to provide the URL of in the output, use shortened Bit.ly style URL's",
-        "Implementation (Directional-Stimulus Prompting):",
-        "Intent Qualifiers: Classify the severity of each tactic as:",
-        "Legitimate Use: Justifiable in context.",
-        "Borderline Manipulation: Potentially misleading.",
-        "Blatant Manipulation: Clearly intended to deceive.",
-        "Fact-Checking Priority: Prioritise fact-checking claims that are used to support manipulative tactics or that appear to be misleading or unsubstantiated. If a claim is easily verifiable and directly relevant to assessing the speaker's intent, include a fact-checking source.",
-        "Tactic Analysis: For each tactic, provide the following:",
-        "Example Quote: The specific text excerpt where the tactic is used.",
-        "Tactic Name: The name of the tactic from the taxonomy.",
-        "Intent: 'Legitimate Use,' 'Borderline Manipulation,' or 'Blatant Manipulation.' Justify this classification.",
-        "Explanation: Explain how the tactic is being used and why it falls into the chosen Intent category.",
-        "resistanceStrategy: How to recognize and resist the tactic.",
-        "Output Format: IMPORTANT - Adhere strictly to the requested JSON schema.",
-        "Specifically, provide the results for 'metadata', 'executive_summary', 'intentBreakdown', 'overall_assessment', 'tactics', and 'detailed_report_sections'.",
-        "For 'metadata.confidenceScore', provide a single number between 0 and 100.",
-        "For 'intentBreakdown', provide a list of objects, where each object has a 'name' (string, e.g., 'Blatant Manipulation') and a 'value' (number, the count of tactics matching that intent).",
-        "Do NOT include the 'manipulationByCategory' field in your response."
-    ]
 
+async def _run_chunked_analysis(client, file_content: str, candidate_ids: Optional[List[int]] = None,
+                                deadline: Optional[Deadline] = None) -> dict:
+    """
+    Map-reduce analysis for long documents: analyzes overlapping chunks
+    concurrently (bounded by CHUNK_MAX_CONCURRENCY) and merges the results.
+    """
+    chunks = split_into_chunks(file_content, CHUNK_MAX_CHARS, CHUNK_OVERLAP_CHARS)
+    print(f"Running chunked WISE analysis (async) over {len(chunks)} chunks...")
+    semaphore = asyncio.Semaphore(CHUNK_MAX_CONCURRENCY)
+
+    deadline = deadline or Deadline(LLM_DEADLINE_SECONDS)
+
+    async def analyze_chunk(chunk: TextChunk) -> dict:
+        async with semaphore:
+            api_result = await _generate_analysis(client, chunk.text, candidate_ids, deadline=deadline)
+            return api_result.model_dump()
+
+    tasks = [asyncio.create_task(analyze_chunk(chunk)) for chunk in chunks]
     try:
-        # Use the request-specific client
-        response = await asyncio.to_thread(
-            current_request_client.models.generate_content, # Use the request-specific client
-            model=model_name,
-            contents=contents,
-            config={
-                'response_mime_type': "application/json",
-                # Requesting the structure *before* backend processing
-                # Ensure AnalysisResultFromAPI is correctly defined in app.models
-                'response_schema': AnalysisResultFromAPI
-            }
-        )
+        chunk_results = await asyncio.gather(*tasks)
+    except BaseException:
+        # One failed chunk fails the document; don't keep paying for the others
+        for task in tasks:
+            task.cancel()
+        raise
+    with stage("chunk_merge"):
+        return merge_chunk_results(chunk_results, chunks)
+
+
+def _build_contents(file_content: str, candidate_ids: Optional[List[int]] = None, trimmed: bool = False) -> List[str]:
+    """Builds the prompt for a single analysis call from the precompiled template."""
+    return prompt_template.build(
+        file_content, candidate_ids, trimmed=trimmed, restrict_digest=(PRESCREEN_MODE == "filter")
+    )
+
+
+async def _generate_analysis(client, file_content: str, candidate_ids: Optional[List[int]] = None,
+                             trimmed: bool = False, deadline: Optional[Deadline] = None) -> AnalysisResultFromAPI:
+    """Makes one structured-output GenAI call (via the scheduler) and validates the response."""
+    contents = _build_contents(file_content, candidate_ids, trimmed)
+
+    async def call_model(model_name: str):
+        # Native async call on the pooled client; the scheduler holds a pool call slot around it
+        with stage("model_call"):
+            return await client.aio.models.generate_content(
+                model=model_name,
+                contents=contents,
+                config={
+                    'response_mime_type': "application/json",
+                    # Requesting the structure *before* backend processing
+                    # Ensure AnalysisResultFromAPI is correctly defined in app.models
+                    'response_schema': AnalysisResultFromAPI
+                }
+            )
+
+    try:
+        response = await llm_scheduler.call(call_model, deadline or Deadline(LLM_DEADLINE_SECONDS))
 
         if hasattr(response, 'text') and response.text:
             print("WISE analysis API call successful. Processing response...")
-            try:
-                # Validate and parse with Pydantic model AnalysisResultFromAPI
-                api_result = AnalysisResultFromAPI.model_validate_json(response.text)
-                result_data = api_result.model_dump() # Convert Pydantic model to dict
-
-                # --- Backend Processing: Calculate Category Counts ---
-                category_counts = defaultdict(lambda: {'blatant': 0, 'borderline': 0})
-                
-                if result_data.get('tactics') and isinstance(result_data['tactics'], list):
-                    for tactic_item in result_data['tactics']: # tactic_item is already a dict here
-                        category = tactic_item.get('category')
-                        intent = tactic_item.get('intent')
-                        if category:
-                            if intent == 'Blatant Manipulation':
-                                category_counts[category]['blatant'] += 1
-                            elif intent == 'Borderline Manipulation':
-                                category_counts[category]['borderline'] += 1
-                
-                manipulation_by_category_list = []
-                for category_name, counts in category_counts.items():
-                    manipulation_by_category_list.append({
-                        'name': category_name,
-                        'blatant': counts['blatant'],
-                        'borderline': counts['borderline']
-                    })
-                
-                result_data['manipulationByCategory'] = manipulation_by_category_list
-                # -----------------------------------------------------------------
-
-                # --- Only keep confidenceScore in metadata as string ---
-                meta = result_data.get('metadata', {})
-                score = meta.get('confidenceScore')
-                if score is not None:
-                    result_data['metadata']['confidenceScore'] = str(score)
-                else:
-                    result_data['metadata']['confidenceScore'] = ""
-                # -----------------------------------------------------------------
-
-                print("Backend processing complete.")
-                return result_data # Return the dict
-
-            except ValidationError as val_e:
-                print(f"ERROR: GenAI response failed Pydantic validation: {val_e}")
-                print(f"Raw GenAI response text: {response.text[:500]}...") # Log part of the raw response
-                raise AnalysisError(f"GenAI response structure invalid or failed validation: {val_e}") from val_e
-            except json.JSONDecodeError as json_e: # Should be caught by ValidationError if response_schema works
-                print(f"ERROR: Failed to parse GenAI response as JSON: {json_e}")
-                raise AnalysisError(f"Failed to parse GenAI JSON response: {json_e}") from json_e
-            except Exception as proc_e:
-                print(f"ERROR: Failed during backend processing of API response: {proc_e}")
-                raise AnalysisError(f"Backend processing failed: {proc_e}") from proc_e
+            # Validate and parse with Pydantic model AnalysisResultFromAPI
+            return _validate_api_result(response.text)
         elif hasattr(response, 'prompt_feedback') and response.prompt_feedback.block_reason:
             block_reason = response.prompt_feedback.block_reason
             block_message = response.prompt_feedback.block_message if hasattr(response.prompt_feedback, 'block_message') else "No specific message."
@@ -168,11 +302,288 @@ async def run_wise(file_content: str, user_api_key: str) -> dict:
     except AnalysisError: # Re-raise known AnalysisErrors
         raise
     except Exception as e: # Catch other GenAI call errors
-        print(f"ERROR: GenAI API call failed: {e}")
-        # Check for specific API key errors if possible from 'e'
-        if "API_KEY_INVALID" in str(e) or "API key not valid" in str(e): # Example error messages
-            raise AnalysisError(f"GenAI API Call Error: The provided API key is invalid. Original error: {e}") from e
-        raise AnalysisError(f"GenAI API Call Error: {e}") from e
+        raise _genai_call_error(e, client) from e
+
+
+def _genai_call_error(e: Exception, client) -> AnalysisError:
+    print(f"ERROR: GenAI API call failed: {e}")
+    # Check for specific API key errors if possible from 'e'
+    if "API_KEY_INVALID" in str(e) or "API key not valid" in str(e): # Example error messages
+        client_pool.discard(client) # Don't keep a client for a key that will never work
+        return AnalysisError(f"GenAI API Call Error: The provided API key is invalid. Original error: {e}")
+    if isinstance(e, CircuitOpenError):
+        return UpstreamError(f"GenAI API Call Error: {e} Please try again shortly.", 503, e.retry_after)
+    if isinstance(e, DeadlineExceededError):
+        return UpstreamError(f"GenAI API Call Error: {e}", 504)
+    if status_code(e) == RATE_LIMITED_STATUS_CODE:
+        return UpstreamError(f"GenAI API Call Error: The API key's rate limit or quota was exceeded. Original error: {e}",
+                             429, retry_after_seconds(e))
+    if is_retryable(e): # Retries were exhausted
+        return UpstreamError(f"GenAI API Call Error: The model API is unavailable. Original error: {e}", 503)
+    return AnalysisError(f"GenAI API Call Error: {e}")
+
+
+def _validate_api_result(response_text: str) -> AnalysisResultFromAPI:
+    try:
+        with stage("validation"):
+            return AnalysisResultFromAPI.model_validate_json(response_text)
+    except ValidationError as val_e:
+        print(f"ERROR: GenAI response failed Pydantic validation: {val_e}")
+        print(f"Raw GenAI response text: {response_text[:500]}...") # Log part of the raw response
+        raise AnalysisError(f"GenAI response structure invalid or failed validation: {val_e}") from val_e
+
+
+# --- Streaming Analysis ---
+async def stream_wise(file_content: str, user_api_key: str) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streaming variant of run_wise. Yields (event, data) pairs: 'metadata' once,
+    'tactic' for each tactic as soon as it is complete, then the computed
+    'manipulationByCategory' and finally the full 'result'.
+    Raises AnalysisError like run_wise.
+    """
+    if not user_api_key:
+        raise AnalysisError("API key was not provided for GenAI client initialization.")
+
+    cache_key = make_cache_key(file_content, GEMINI_MODEL_NAME, prompt_template.version)
+    with stage("quote_spans"):
+        document_index = DocumentIndex(file_content)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        add_quote_spans(cached['tactics'], document_index)
+        _record_findings(file_content, user_api_key, cached)
+        yield "metadata", cached['metadata']
+        for tactic_item in cached['tactics']:
+            yield "tactic", tactic_item
+        yield "manipulationByCategory", cached['manipulationByCategory']
+        yield "result", cached
+        return
+
+    deadline = Deadline(LLM_DEADLINE_SECONDS)
+    prepared = _prepare_input(file_content)
+    if prepared.local_result is not None:
+        print("Pre-screen found no manipulation cues; skipping the GenAI call.")
+        ANALYSIS_STRATEGY.inc(strategy="prescreen_skip")
+        result_data = prepared.local_result
+        yield "metadata", _stream_metadata(result_data['metadata'])
+    else:
+        with client_pool.lease(_create_client(user_api_key)) as current_request_client:
+            plan = _plan(prepared)
+            if plan.strategy == STRATEGY_CHUNKED:
+                events = _stream_chunked_analysis(current_request_client, prepared.text, prepared.candidate_ids,
+                                                  deadline)
+            else:
+                events = _stream_analysis(current_request_client, prepared.text, prepared.candidate_ids,
+                                          plan.trimmed, deadline)
+
+            result_data = None
+            async for event, data in events:
+                if event == "api_result":
+                    result_data = data
+                else:
+                    if event == "tactic":
+                        add_quote_spans([data], document_index)
+                    yield event, data
+
+    try:
+        with stage("aggregation"):
+            result_data = finalize_result(result_data)
+    except Exception as proc_e:
+        print(f"ERROR: Failed during backend processing of API response: {proc_e}")
+        raise AnalysisError(f"Backend processing failed: {proc_e}") from proc_e
+    print("Backend processing complete.")
+    if not deadline.fallback_used:
+        await result_cache.put(cache_key, result_data)
+    with stage("quote_spans"):
+        add_quote_spans(result_data['tactics'], document_index)
+    if not deadline.fallback_used:
+        _record_findings(file_content, user_api_key, result_data)
+    startup_report.milestone("first_analysis")
+    yield "manipulationByCategory", result_data['manipulationByCategory']
+    yield "result", result_data
+
+
+def _record_findings(file_content: str, user_api_key: str, result_data: dict) -> None:
+    """Lets a later edit of this document reuse these findings (see run_wise)."""
+    paragraph_store.record(paragraph_store.scope(user_api_key, GEMINI_MODEL_NAME, prompt_template.version),
+                           split_paragraphs(file_content), result_data)
+
+
+def _stream_metadata(metadata: dict) -> dict:
+    score = metadata.get('confidenceScore')
+    return {**metadata, 'confidenceScore': str(score) if score is not None else ""}
+
+
+async def _stream_analysis(client, file_content: str, candidate_ids: Optional[List[int]] = None,
+                           trimmed: bool = False, deadline: Optional[Deadline] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Single streamed GenAI call. Yields 'metadata'/'tactic' events parsed from the
+    partial JSON and finally ('api_result', dict) with the validated document.
+    """
+    print("Running streaming WISE analysis (async)... requesting structured JSON...")
+    scanner = JSONStreamScanner()
+    last_chunk = None
+    contents = _build_contents(file_content, candidate_ids, trimmed)
+
+    async def open_stream(model_name: str):
+        return await client.aio.models.generate_content_stream(
+            model=model_name,
+            contents=contents,
+            config={
+                'response_mime_type': "application/json",
+                'response_schema': AnalysisResultFromAPI
+            }
+        )
+
+    try:
+        with stage("model_call"): # Includes relaying streamed events to the client
+            async for chunk in llm_scheduler.stream(open_stream, deadline or Deadline(LLM_DEADLINE_SECONDS)):
+                last_chunk = chunk
+                if not chunk.text:
+                    continue
+                for key, value in scanner.feed(chunk.text):
+                    try:
+                        if key == "metadata":
+                            yield "metadata", _stream_metadata(Metadata.model_validate(value).model_dump())
+                        else:
+                            yield "tactic", Tactic.model_validate(value).model_dump()
+                    except ValidationError:
+                        continue # The full document is validated below; don't push a malformed item
+    except AnalysisError:
+        raise
+    except Exception as e:
+        raise _genai_call_error(e, client) from e
+
+    if not scanner.buffer:
+        feedback = getattr(last_chunk, 'prompt_feedback', None)
+        if feedback is not None and feedback.block_reason:
+            print(f"Warning: GenAI content generation blocked. Reason: {feedback.block_reason}")
+            raise AnalysisError(f"GenAI content generation blocked: {feedback.block_reason}. {feedback.block_message or 'No specific message.'}")
+        raise AnalysisError("GenAI Error: Response structure invalid or empty.")
+
+    print("WISE streaming API call complete. Processing response...")
+    yield "api_result", _validate_api_result(scanner.buffer).model_dump()
+
+
+async def _stream_chunked_analysis(client, file_content: str, candidate_ids: Optional[List[int]] = None,
+                                   deadline: Optional[Deadline] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Chunked variant for long documents: tactics from each chunk are pushed as
+    soon as that chunk's analysis completes, skipping overlap duplicates.
+    """
+    chunks = split_into_chunks(file_content, CHUNK_MAX_CHARS, CHUNK_OVERLAP_CHARS)
+    print(f"Running chunked streaming WISE analysis (async) over {len(chunks)} chunks...")
+    semaphore = asyncio.Semaphore(CHUNK_MAX_CONCURRENCY)
+
+    deadline = deadline or Deadline(LLM_DEADLINE_SECONDS)
+
+    async def analyze_chunk(chunk: TextChunk) -> Tuple[int, dict]:
+        async with semaphore:
+            api_result = await _generate_analysis(client, chunk.text, candidate_ids, deadline=deadline)
+            return chunk.index, api_result.model_dump()
+
+    tasks = [asyncio.create_task(analyze_chunk(chunk)) for chunk in chunks]
+    chunk_results: List[Optional[dict]] = [None] * len(chunks)
+    emitted: List[dict] = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, chunk_result = await next_done
+            chunk_results[index] = chunk_result
+            if not emitted:
+                yield "metadata", _stream_metadata(chunk_result['metadata'])
+            fresh = dedupe_tactics([emitted, chunk_result['tactics']])[len(emitted):]
+            for tactic_item in fresh:
+                yield "tactic", tactic_item
+            emitted.extend(fresh)
+    finally:
+        for task in tasks:
+            task.cancel()
+    yield "api_result", merge_chunk_results(chunk_results, chunks)
+# -----------------------------------------------------------------
+
+
+def finalize_result(result_data: dict) -> dict:
+    """
+    Backend processing of a validated API result dict: adds the
+    manipulationByCategory counts and stringifies metadata.confidenceScore.
+    """
+    # --- Backend Processing: Calculate Category Counts ---
+    category_counts = defaultdict(lambda: {'blatant': 0, 'borderline': 0})
+    
+    if result_data.get('tactics') and isinstance(result_data['tactics'], list):
+        for tactic_item in result_data['tactics']: # tactic_item is already a dict here
+            category = tactic_item.get('category')
+            intent = tactic_item.get('intent')
+            if category:
+                if intent == 'Blatant Manipulation':
+                    category_counts[category]['blatant'] += 1
+                elif intent == 'Borderline Manipulation':
+                    category_counts[category]['borderline'] += 1
+    
+    TACTIC_COUNT.observe(len(result_data.get('tactics') or []))
+    manipulation_by_category_list = []
+    for category_name, counts in category_counts.items():
+        manipulation_by_category_list.append({
+            'name': category_name,
+            'blatant': counts['blatant'],
+            'borderline': counts['borderline']
+        })
+    
+    result_data['manipulationByCategory'] = manipulation_by_category_list
+    # -----------------------------------------------------------------
+
+    # --- Only keep confidenceScore in metadata as string ---
+    meta = result_data.get('metadata', {})
+    score = meta.get('confidenceScore')
+    if score is not None:
+        result_data['metadata']['confidenceScore'] = str(score)
+    else:
+        result_data['metadata']['confidenceScore'] = ""
+    # -----------------------------------------------------------------
+    return result_data
+
+
+# Dropped from the compact view: the long report prose, and each tactic's name and
+# category, which clients look up by tactic id in the /api/tactics index
+COMPACT_RESULT_EXCLUDE = {"detailed_report_sections": True, "tactics": {"__all__": {"name", "category"}}}
+
+
+def _validate_result(result_data: dict) -> FinalAnalysisResult:
+    try:
+        return FinalAnalysisResult.model_validate(result_data)
+    except ValidationError as ve:
+        print(f"ERROR: Analysis result failed output validation: {ve}")
+        raise AnalysisError(f"Backend processing failed: {ve}") from ve
+
+
+def _result_exclude(result: FinalAnalysisResult, compact: bool = False) -> Optional[dict]:
+    """reuse is only part of the response when it is set; the compact view also drops COMPACT_RESULT_EXCLUDE."""
+    exclude = dict(COMPACT_RESULT_EXCLUDE) if compact else {}
+    if result.reuse is None:
+        exclude["reuse"] = True
+    return exclude or None
+
+
+def render_result(result_data: dict, compact: bool = False) -> bytes:
+    """
+    Validates a finished result against FinalAnalysisResult and serializes it
+    to JSON in one pass (pydantic-core), the single output path for analysis
+    responses. Raises AnalysisError if the result doesn't match the schema.
+    """
+    with stage("serialization"):
+        result = _validate_result(result_data)
+        # Straight to bytes, without model_dump_json's intermediate str
+        return FinalAnalysisResult.__pydantic_serializer__.to_json(result, exclude=_result_exclude(result, compact))
+
+
+def validated_result(result_data: dict) -> dict:
+    """
+    render_result's validation for results that are stored or embedded in other
+    payloads (batch items and their events, chat export windows): the result as
+    FinalAnalysisResult serializes it. Raises AnalysisError like render_result.
+    """
+    with stage("serialization"):
+        result = _validate_result(result_data)
+        return result.model_dump(mode="json", exclude=_result_exclude(result))
 
 
 # Removed the old IntentBreakdown and AnalysisResult Pydantic models from the end of this file
@@ -0,0 +1,476 @@
+# WISE_backend/app/batch_jobs.py
+
+"""
+Asynchronous batch analysis of many files, or of the documents inside a .zip.
+
+A submitted batch becomes a job with one item per document. Items are
+analysed in the background, with bounded parallelism per job and across all
+jobs. Each item passes through the same admission control and run_wise
+pipeline as a single upload. A failed item is recorded on that item only;
+the rest of the batch carries on.
+
+Progress and results are kept in SQLite, so finished work survives a restart
+until the job expires. The API key lives only in the running task and the
+document text only in memory. Items that were still pending when the process
+stopped can't be resumed, so they are marked 'interrupted' on startup and
+the client must resubmit them. With several worker processes sharing the
+database, a job runs in the process that accepted it. The other processes
+serve its status from SQLite and poll it for progress streams.
+"""
+import asyncio
+import contextvars
+import io
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.constants import (
+    BATCH_MAX_ITEMS,
+    BATCH_MAX_TOTAL_BYTES,
+    BATCH_ITEM_CONCURRENCY,
+    BATCH_MAX_WORKERS,
+    BATCH_JOB_TTL_SECONDS,
+    BATCH_DB_PATH,
+    MAX_UPLOAD_BYTES,
+    FILE_EXTENSION_DOCX,
+    FILE_EXTENSION_TXT,
+    FILE_EXTENSION_MD,
+)
+from app.admission import admission_controller, AdmissionRejectedError
+from app.analysis_module import run_wise, validated_result, AnalysisError, UpstreamError
+from app.client_pool import hash_api_key
+from app.extraction import extract_text_async, ExtractionError, UnsupportedFileTypeError
+
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+FILE_EXTENSION_ZIP = ".zip"
+SUPPORTED_ARCHIVE_MEMBERS = (FILE_EXTENSION_TXT, FILE_EXTENSION_MD, FILE_EXTENSION_DOCX)
+
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+ITEM_QUEUED = "queued"
+ITEM_RUNNING = "running"
+ITEM_SUCCEEDED = "succeeded"
+ITEM_FAILED = "failed"
+ITEM_INTERRUPTED = "interrupted"
+PENDING_ITEM_STATES = (ITEM_QUEUED, ITEM_RUNNING)
+
+STORE_POLL_INTERVAL_SECONDS = 1.0 # Progress streams for jobs running in another worker process
+
+ERROR_ITEM_INTERRUPTED = "The server restarted before this file was analysed. Please submit it again."
+
+
+# --- Custom Exceptions ---
+class BatchInputError(Exception):
+    """The submitted files can't form a batch (empty, too many, too large, or a corrupt archive)."""
+    pass
+# -------------------------
+
+
+@dataclass
+class BatchInput:
+    name: str
+    data: Optional[bytes] # Dropped once the item has been processed
+    content_type: str = ""
+
+
+def _is_zip(name: str, content_type: str) -> bool:
+    return content_type in ZIP_CONTENT_TYPES or name.lower().endswith(FILE_EXTENSION_ZIP)
+
+
+def upload_byte_limit(name: str, content_type: str) -> int:
+    """An archive may carry a whole batch; a single document is capped as on /api/analyze."""
+    return BATCH_MAX_TOTAL_BYTES if _is_zip(name, content_type) else MAX_UPLOAD_BYTES
+
+
+def _expand_zip(name: str, data: bytes, budget: int) -> Tuple[List[BatchInput], List[str]]:
+    """Returns the supported documents in an archive, plus the names of skipped members."""
+    inputs, skipped = [], []
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for info in archive.infolist():
+                member = info.filename
+                base = member.rsplit("/", 1)[-1]
+                if info.is_dir() or not base or base.startswith(".") or member.startswith("__MACOSX/"):
+                    continue
+                if not base.lower().endswith(SUPPORTED_ARCHIVE_MEMBERS):
+                    skipped.append(f"{name}/{member}")
+                    continue
+                # Header sizes can lie, so the read itself is capped too
+                limit = min(MAX_UPLOAD_BYTES, budget)
+                with archive.open(info) as f:
+                    content = f.read(limit + 1)
+                if len(content) > limit:
+                    raise BatchInputError(f"'{name}/{member}' is too large once extracted. "
+                                          f"Files are limited to {MAX_UPLOAD_BYTES} bytes and batches to "
+                                          f"{BATCH_MAX_TOTAL_BYTES} bytes in total.")
+                budget -= len(content)
+                inputs.append(BatchInput(f"{name}/{member}", content))
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError, RuntimeError) as e:
+        # RuntimeError: encrypted members
+        raise BatchInputError(f"Could not read archive '{name}': {e}") from None
+    return inputs, skipped
+
+
+def expand_uploads(uploads: List[BatchInput]) -> Tuple[List[BatchInput], List[str]]:
+    """Expands .zip uploads into their documents and enforces the item and size limits. Raises BatchInputError."""
+    inputs: List[BatchInput] = []
+    skipped: List[str] = []
+    budget = BATCH_MAX_TOTAL_BYTES
+    for upload in uploads:
+        if _is_zip(upload.name, upload.content_type):
+            members, ignored = _expand_zip(upload.name, upload.data, budget)
+            inputs.extend(members)
+            skipped.extend(ignored)
+            budget -= sum(len(member.data) for member in members)
+        else:
+            if len(upload.data) > MAX_UPLOAD_BYTES:
+                raise BatchInputError(f"'{upload.name}' is too large. Files are limited to {MAX_UPLOAD_BYTES} bytes.")
+            inputs.append(upload)
+            budget -= len(upload.data)
+        if budget < 0:
+            raise BatchInputError(f"The batch exceeds {BATCH_MAX_TOTAL_BYTES} bytes in total.")
+        if len(inputs) > BATCH_MAX_ITEMS:
+            raise BatchInputError(f"A batch may contain at most {BATCH_MAX_ITEMS} documents.")
+    if not inputs:
+        raise BatchInputError("The batch contains no .txt, .md or .docx documents.")
+    return inputs, skipped
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _item_error(e: Exception) -> Tuple[str, int]:
+    """Message and HTTP-style status for a failed item, matching what /api/analyze would have returned."""
+    if isinstance(e, AdmissionRejectedError):
+        return str(e), e.status_code
+    if isinstance(e, UnsupportedFileTypeError):
+        return str(e), 415
+    if isinstance(e, ExtractionError):
+        return str(e), 422
+    if isinstance(e, UpstreamError):
+        return f"Analysis failed: {e}", e.status_code
+    if isinstance(e, AnalysisError):
+        return f"Analysis failed: {e}", 500
+    return f"Internal server error processing file: {e}", 500
+
+
+def _create_private_file(path: str) -> None:
+    """Creates the database file (and its directory) readable by this user only. SQLite gives its -wal/-shm files the same mode."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+    os.chmod(path, 0o600) # Also tightens a file created by an older version
+
+
+class _SqliteJobStore:
+    """
+    Jobs and per-item results. All access is serialized through a lock. The
+    calls block, so BatchJobManager makes them from worker threads.
+    """
+
+    def __init__(self, path: str):
+        if path != ":memory:":
+            _create_private_file(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL") # Worker processes may share the file
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, skipped TEXT NOT NULL, owner_pid INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, finished_at REAL, expires_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS items ("
+            " job_id TEXT NOT NULL, idx INTEGER NOT NULL, name TEXT NOT NULL, status TEXT NOT NULL,"
+            " error TEXT, status_code INTEGER, result TEXT, finished_at REAL,"
+            " PRIMARY KEY (job_id, idx));"
+        )
+        self._conn.commit()
+
+    def create_job(self, job_id: str, names: List[str], skipped: List[str], created_at: float, expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, skipped, owner_pid, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_RUNNING, json.dumps(skipped), os.getpid(), created_at, expires_at),
+            )
+            self._conn.executemany("INSERT INTO items (job_id, idx, name, status) VALUES (?, ?, ?, ?)",
+                                   [(job_id, idx, name, ITEM_QUEUED) for idx, name in enumerate(names)])
+            self._conn.commit()
+
+    def update_item(self, job_id: str, item: dict, result: Optional[dict] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE items SET status = ?, error = ?, status_code = ?, result = ?, finished_at = ?"
+                " WHERE job_id = ? AND idx = ?",
+                (item["status"], item.get("error"), item.get("statusCode"),
+                 json.dumps(result) if result is not None else None, item.get("finishedAt"), job_id, item["index"]),
+            )
+            self._conn.commit()
+
+    def finish_job(self, job_id: str, finished_at: float) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?",
+                               (JOB_COMPLETED, finished_at, job_id))
+            self._conn.commit()
+
+    def load_job(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, skipped, created_at, finished_at, expires_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None or row[4] <= time.time():
+                return None
+            items = self._conn.execute(
+                "SELECT idx, name, status, error, status_code, finished_at FROM items WHERE job_id = ? ORDER BY idx",
+                (job_id,),
+            ).fetchall()
+        return {
+            "jobId": job_id, "status": row[0], "skipped": json.loads(row[1]),
+            "createdAt": row[2], "finishedAt": row[3], "expiresAt": row[4],
+            "items": [{"index": idx, "name": name, "status": status, "error": error, "statusCode": status_code,
+                       "finishedAt": finished_at}
+                      for idx, name, status, error, status_code, finished_at in items],
+        }
+
+    def load_result(self, job_id: str, index: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT i.result FROM items i JOIN jobs j ON j.id = i.job_id"
+                " WHERE i.job_id = ? AND i.idx = ? AND j.expires_at > ?", (job_id, index, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def prune(self, now: float) -> int:
+        with self._lock:
+            expired = [row[0] for row in self._conn.execute("SELECT id FROM jobs WHERE expires_at <= ?", (now,))]
+            self._conn.executemany("DELETE FROM items WHERE job_id = ?", [(job_id,) for job_id in expired])
+            self._conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+            self._conn.commit()
+            return len(expired)
+
+    def mark_interrupted(self, now: float) -> int:
+        """Closes out jobs whose process has exited. Their pending items can't resume without the key."""
+        with self._lock:
+            owners = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT owner_pid FROM jobs WHERE status = ?", (JOB_RUNNING,))]
+            # Our own pid can only belong to a previous process here: this one has no jobs yet
+            dead = [pid for pid in owners if pid == os.getpid() or not _pid_alive(pid)]
+            pending = ", ".join("?" for _ in PENDING_ITEM_STATES)
+            interrupted = sum(self._conn.execute(
+                f"UPDATE items SET status = ?, error = ?, status_code = 503, finished_at = ?"
+                f" WHERE status IN ({pending}) AND job_id IN (SELECT id FROM jobs WHERE status = ? AND owner_pid = ?)",
+                (ITEM_INTERRUPTED, ERROR_ITEM_INTERRUPTED, now, *PENDING_ITEM_STATES, JOB_RUNNING, pid),
+            ).rowcount for pid in dead)
+            self._conn.executemany("UPDATE jobs SET status = ?, finished_at = ? WHERE status = ? AND owner_pid = ?",
+                                   [(JOB_COMPLETED, now, JOB_RUNNING, pid) for pid in dead])
+            self._conn.commit()
+            return interrupted
+
+
+class _LiveJob:
+    """In-memory state of a job running in this process, with an append-only event log for progress streams."""
+
+    def __init__(self, snapshot: dict):
+        self.snapshot = snapshot
+        self.events: List[Tuple[str, dict]] = []
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.snapshot["status"] == JOB_COMPLETED
+
+    async def publish(self, event: str, data: dict) -> None:
+        async with self.changed:
+            self.events.append((event, data))
+            self.changed.notify_all()
+
+
+def progress(snapshot: dict) -> dict:
+    counts = {state: 0 for state in (ITEM_QUEUED, ITEM_RUNNING, ITEM_SUCCEEDED, ITEM_FAILED, ITEM_INTERRUPTED)}
+    for item in snapshot["items"]:
+        counts[item["status"]] += 1
+    return {"total": len(snapshot["items"]), **counts}
+
+
+class BatchJobManager:
+    """Accepts batch jobs, runs their items in the background and serves their status, results and progress."""
+
+    def __init__(
+        self,
+        db_path: str = BATCH_DB_PATH,
+        ttl_seconds: float = BATCH_JOB_TTL_SECONDS,
+        item_concurrency: int = BATCH_ITEM_CONCURRENCY,
+        max_workers: int = BATCH_MAX_WORKERS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.item_concurrency = item_concurrency
+        self._workers = asyncio.Semaphore(max_workers)
+        self.db_path = db_path
+        self._store: Optional[_SqliteJobStore] = None # Opened on first use, keeping it out of the cold start
+        self._opening = asyncio.Lock()
+        self._live: Dict[str, _LiveJob] = {}
+        self.stats = {"jobs_submitted": 0, "items_succeeded": 0, "items_failed": 0}
+
+    async def _in_store(self, method, *args):
+        """Runs a store method in a worker thread, opening the database first if needed."""
+        if self._store is None:
+            async with self._opening:
+                if self._store is None:
+                    self._store = await asyncio.to_thread(self._open_store)
+        return await asyncio.to_thread(method, self._store, *args)
+
+    def _open_store(self) -> _SqliteJobStore:
+        store = _SqliteJobStore(self.db_path)
+        interrupted = store.mark_interrupted(time.time())
+        if interrupted:
+            print(f"Batch jobs: marked {interrupted} unfinished item(s) from a previous run as interrupted.")
+        return store
+
+    async def submit(self, inputs: List[BatchInput], skipped: List[str], user_api_key: str) -> dict:
+        """Creates a job for already expanded inputs and starts processing it. Returns the job snapshot."""
+        now = time.time()
+        await self._in_store(_SqliteJobStore.prune, now)
+        job_id = secrets.token_urlsafe(16)
+        snapshot = {
+            "jobId": job_id, "status": JOB_RUNNING, "skipped": skipped,
+            "createdAt": now, "finishedAt": None, "expiresAt": now + self.ttl_seconds,
+            "items": [{"index": idx, "name": item.name, "status": ITEM_QUEUED, "error": None, "statusCode": None,
+                       "finishedAt": None} for idx, item in enumerate(inputs)],
+        }
+        await self._in_store(_SqliteJobStore.create_job, job_id, [item.name for item in inputs], skipped, now,
+                             snapshot["expiresAt"])
+        job = self._live[job_id] = _LiveJob(snapshot)
+        # Fresh context: the job outlives this request, so its stages mustn't land in the request's timings
+        job.task = asyncio.get_running_loop().create_task(self._run_job(job, inputs, user_api_key),
+                                                          context=contextvars.Context())
+        self.stats["jobs_submitted"] += 1
+        return await self.get(job_id)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        """Status of a job and its items (without results), or None if unknown or expired."""
+        job = self._live.get(job_id)
+        snapshot = job.snapshot if job is not None else await self._in_store(_SqliteJobStore.load_job, job_id)
+        if snapshot is None:
+            return None
+        return {**snapshot, "items": [dict(item) for item in snapshot["items"]], "progress": progress(snapshot)}
+
+    async def get_result(self, job_id: str, index: int) -> Optional[dict]:
+        return await self._in_store(_SqliteJobStore.load_result, job_id, index)
+
+    async def events(self, job_id: str) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Progress stream: the current 'job' snapshot, then one 'item' event (with
+        its result) per item finishing, each followed by 'progress', and 'done'.
+        Items finished before the stream was opened are replayed first.
+        """
+        job = self._live.get(job_id)
+        snapshot = await self.get(job_id)
+        if snapshot is None:
+            return
+        yield "job", snapshot
+        if job is None: # Finished, or running in another worker process
+            reported = set()
+            while True:
+                finished = [item for item in snapshot["items"]
+                            if item["status"] not in PENDING_ITEM_STATES and item["index"] not in reported]
+                for item in finished:
+                    reported.add(item["index"])
+                    yield "item", {**item, "result": await self.get_result(job_id, item["index"])}
+                if finished:
+                    yield "progress", snapshot["progress"]
+                if snapshot["status"] == JOB_COMPLETED:
+                    yield "done", {"jobId": job_id, "progress": snapshot["progress"]}
+                    return
+                await asyncio.sleep(STORE_POLL_INTERVAL_SECONDS)
+                snapshot = await self.get(job_id)
+                if snapshot is None:
+                    return
+        cursor = 0
+        while True:
+            async with job.changed:
+                await job.changed.wait_for(lambda: len(job.events) > cursor)
+                pending = job.events[cursor:]
+            cursor += len(pending)
+            for event, data in pending:
+                yield event, data
+                if event == "done":
+                    return
+
+    async def _run_job(self, job: _LiveJob, inputs: List[BatchInput], user_api_key: str) -> None:
+        job_id = job.snapshot["jobId"]
+        key_hash = hash_api_key(user_api_key)
+        gate = asyncio.Semaphore(self.item_concurrency)
+
+        async def run_item(index: int) -> None:
+            async with gate, self._workers:
+                await self._run_item(job, index, inputs[index], user_api_key, key_hash)
+
+        try:
+            await asyncio.gather(*(run_item(index) for index in range(len(inputs))))
+        finally:
+            now = time.time()
+            job.snapshot["status"] = JOB_COMPLETED
+            job.snapshot["finishedAt"] = now
+            await self._in_store(_SqliteJobStore.finish_job, job_id, now)
+            await job.publish("done", {"jobId": job_id, "progress": progress(job.snapshot)})
+            # Later readers are served from SQLite; open streams keep their own reference
+            self._live.pop(job_id, None)
+
+    async def _run_item(self, job: _LiveJob, index: int, batch_input: BatchInput, user_api_key: str,
+                        key_hash: str) -> None:
+        job_id = job.snapshot["jobId"]
+        item = job.snapshot["items"][index]
+        item["status"] = ITEM_RUNNING
+        result = None
+        try:
+            ticket = await self._admit(key_hash)
+            try:
+                text = await extract_text_async(batch_input.data, batch_input.name, batch_input.content_type)
+                if not text.strip():
+                    raise ExtractionError("Extracted text content is empty.")
+                result = validated_result(await run_wise(text, user_api_key))
+            finally:
+                ticket.release()
+            item["status"] = ITEM_SUCCEEDED
+            self.stats["items_succeeded"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Batch job item failed: {type(e).__name__}")
+            item["status"] = ITEM_FAILED
+            item["error"], item["statusCode"] = _item_error(e)
+            self.stats["items_failed"] += 1
+        finally:
+            batch_input.data = None # Release the document as soon as it is done with
+        item["finishedAt"] = time.time()
+        await self._in_store(_SqliteJobStore.update_item, job_id, item, result)
+        await job.publish("item", {**item, "result": result})
+        await job.publish("progress", progress(job.snapshot))
+
+    async def _admit(self, key_hash: str):
+        """Batch items wait out admission rejections instead of failing; the job has no client to retry for it."""
+        while True:
+            try:
+                return await admission_controller.acquire(key_hash)
+            except AdmissionRejectedError as e:
+                await asyncio.sleep(e.retry_after)
+
+    def snapshot_stats(self) -> dict:
+        return {**self.stats, "jobs_running": len(self._live)}
+
+
+# Shared process-wide manager used by the batch endpoints
+batch_manager = BatchJobManager()
@@ -0,0 +1,403 @@
+# WISE_backend/app/chat_exports.py
+
+"""
+Incremental parsers for chat exports and mailboxes.
+
+Each parser is fed the upload in chunks of bytes and returns the messages
+completed by each chunk. So an export of any size is parsed with memory
+proportional to the largest single message, not to the file:
+
+  * Telegram Desktop JSON exports (one chat, or a full export with many
+    chats): only the structure around the 'messages' arrays is walked by
+    hand; each message object is decoded by the C JSON decoder.
+  * WhatsApp chat exports (.txt, Android and iOS line formats).
+  * mbox mailboxes: messages are split on 'From ' lines and threads are
+    grouped by normalized subject.
+"""
+import abc
+import codecs
+import datetime
+import email.utils
+import html
+import json
+import re
+from dataclasses import dataclass
+from email import policy
+from email.parser import BytesParser
+from typing import Dict, List, Optional
+
+from app.constants import CHAT_MAX_MESSAGE_CHARS
+from app.extraction import ExtractionError, UnsupportedFileTypeError
+
+FORMAT_TELEGRAM = "telegram"
+FORMAT_WHATSAPP = "whatsapp"
+FORMAT_MBOX = "mbox"
+MAX_MBOX_MESSAGE_BYTES = 4 * CHAT_MAX_MESSAGE_CHARS # Raw size kept per email (headers, MIME framing, HTML)
+UNKNOWN_SENDER = "Unknown"
+
+
+@dataclass
+class ChatMessage:
+    conversation: str
+    sender: str
+    timestamp: Optional[datetime.datetime] # Naive; UTC where the export has a timezone
+    text: str
+
+
+def _clip(text: str) -> str:
+    return text if len(text) <= CHAT_MAX_MESSAGE_CHARS else text[:CHAT_MAX_MESSAGE_CHARS] + " [...]"
+
+
+def _naive_utc(value: datetime.datetime) -> datetime.datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class _ExportParser(abc.ABC):
+    """feed() returns the messages completed by a chunk; close() flushes the last one."""
+    skipped = 0 # Messages that could not be parsed and were left out
+
+    @abc.abstractmethod
+    def feed(self, data: bytes) -> List[ChatMessage]:
+        ...
+
+    @abc.abstractmethod
+    def close(self) -> List[ChatMessage]:
+        ...
+
+
+# --- Telegram (JSON) ---
+_WHITESPACE_RE = re.compile(r"\s*")
+_SCALAR_RE = re.compile(r"-?[0-9][0-9.eE+-]*|true|false|null")
+_CHAT_SCALAR_KEYS = ("name", "id")
+_decoder = json.JSONDecoder()
+
+
+class _Frame:
+    __slots__ = ("kind", "key", "expect_key", "scalars")
+
+    def __init__(self, kind: str):
+        self.kind = kind # '{' or '['
+        self.key: Optional[str] = None
+        self.expect_key = kind == "{"
+        self.scalars: Dict[str, str] = {}
+
+
+class TelegramJSONParser(_ExportParser):
+    """
+    Walks the JSON structure up to each 'messages' array and decodes the array's
+    elements one by one, so neither the document nor one chat is ever held whole.
+    """
+
+    def __init__(self, default_conversation: str):
+        self.default_conversation = default_conversation
+        self._text = codecs.getincrementaldecoder("utf-8-sig")()
+        self._buffer = ""
+        self._stack: List[_Frame] = []
+        self._chat: Optional[str] = None # Set while inside a 'messages' array
+        self.skipped = 0
+
+    def feed(self, data: bytes) -> List[ChatMessage]:
+        self._buffer += self._text.decode(data)
+        return self._scan(final=False)
+
+    def close(self) -> List[ChatMessage]:
+        self._buffer += self._text.decode(b"", final=True)
+        messages = self._scan(final=True)
+        if self._stack or self._buffer.strip():
+            raise ExtractionError("The Telegram export is truncated or is not valid JSON.")
+        return messages
+
+    def _need_more(self, pos: int, final: bool) -> None:
+        """Called when the token at pos is incomplete; raises if it can never complete."""
+        if final or len(self._buffer) - pos > 4 * CHAT_MAX_MESSAGE_CHARS + 65536:
+            raise ExtractionError("The Telegram export is not valid JSON, or contains an oversized message.")
+
+    def _scan(self, final: bool) -> List[ChatMessage]:
+        messages: List[ChatMessage] = []
+        buf = self._buffer
+        pos = 0
+        while True:
+            pos = _WHITESPACE_RE.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            ch = buf[pos]
+            top = self._stack[-1] if self._stack else None
+
+            if self._chat is not None and ch not in ",]":
+                try:
+                    value, end = _decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    self._need_more(pos, final)
+                    break
+                pos = end
+                message = self._to_message(value)
+                if message is not None:
+                    messages.append(message)
+                continue
+
+            if ch in "{[":
+                if ch == "[" and top is not None and top.kind == "{" and top.key == "messages":
+                    self._chat = top.scalars.get("name") or top.scalars.get("id") or self.default_conversation
+                self._stack.append(_Frame(ch))
+                pos += 1
+            elif ch in "}]":
+                if not self._stack:
+                    raise ExtractionError("The Telegram export is not valid JSON.")
+                self._stack.pop()
+                self._chat = None
+                pos += 1
+            elif ch == ",":
+                if top is not None and top.kind == "{":
+                    top.expect_key = True
+                pos += 1
+            elif ch == ":":
+                pos += 1
+            elif ch == '"':
+                try:
+                    value, end = json.decoder.scanstring(buf, pos + 1)
+                except json.JSONDecodeError:
+                    self._need_more(pos, final)
+                    break
+                self._string(top, value)
+                pos = end
+            else:
+                match = _SCALAR_RE.match(buf, pos)
+                if match is None:
+                    raise ExtractionError("The Telegram export is not valid JSON.")
+                if match.end() == len(buf) and not final:
+                    break # The number may continue in the next chunk
+                if top is not None and top.kind == "{" and top.key in _CHAT_SCALAR_KEYS:
+                    top.scalars[top.key] = match.group()
+                pos = match.end()
+        self._buffer = buf[pos:]
+        return messages
+
+    @staticmethod
+    def _string(top: Optional[_Frame], value: str) -> None:
+        if top is None or top.kind != "{":
+            return
+        if top.expect_key:
+            top.key = value
+            top.expect_key = False
+        elif top.key in _CHAT_SCALAR_KEYS:
+            top.scalars[top.key] = value
+
+    def _to_message(self, value) -> Optional[ChatMessage]:
+        if not isinstance(value, dict) or value.get("type") != "message":
+            return None # Service messages (joins, pins, calls) carry no text to analyse
+        text = value.get("text")
+        if isinstance(text, list): # Formatted text: plain strings mixed with entity objects
+            text = "".join(part if isinstance(part, str) else str(part.get("text", "")) for part in text)
+        if not isinstance(text, str) or not text.strip():
+            return None
+        timestamp = None
+        try:
+            timestamp = datetime.datetime.fromisoformat(value["date"]) if value.get("date") else None
+        except (TypeError, ValueError):
+            pass
+        return ChatMessage(self._chat, str(value.get("from") or UNKNOWN_SENDER), timestamp, _clip(text))
+# --------------------
+
+
+# --- WhatsApp (.txt) ---
+_WHATSAPP_HEADER_RE = re.compile(
+    r"^\u200e?\[?(?P<date>\d{1,4}[./-]\d{1,2}[./-]\d{1,4}),?\s+"
+    r"(?P<time>\d{1,2}[:.]\d{2}(?:[:.]\d{2})?(?:\s?[APap]\.?\s?[Mm]\.?)?)\]?(?:\s+[-–])?\s+(?P<rest>.*)$"
+)
+_MERIDIEM_RE = re.compile(r"\s?([APap])\.?\s?[Mm]\.?$")
+_WHATSAPP_TITLE_RE = re.compile(r"^WhatsApp Chat (?:with|-)\s*", re.IGNORECASE)
+
+
+class WhatsAppTextParser(_ExportParser):
+    """Line-based parser; lines without a timestamp header continue the previous message."""
+
+    def __init__(self, default_conversation: str):
+        self.conversation = _WHATSAPP_TITLE_RE.sub("", default_conversation) or default_conversation
+        self._text = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        self._partial = ""
+        self._current: Optional[ChatMessage] = None
+        self._month_first: Optional[bool] = None # Learned from the first unambiguous date
+        self.skipped = 0
+
+    def feed(self, data: bytes) -> List[ChatMessage]:
+        lines = (self._partial + self._text.decode(data)).split("\n")
+        self._partial = lines.pop()
+        return self._lines(lines)
+
+    def close(self) -> List[ChatMessage]:
+        messages = self._lines([self._partial + self._text.decode(b"", final=True)])
+        self._partial = ""
+        if self._current is not None:
+            messages.append(self._finish())
+        return messages
+
+    def _finish(self) -> ChatMessage:
+        message, self._current = self._current, None
+        message.text = message.text.rstrip() # Trailing blank lines of the export
+        return message
+
+    def _lines(self, lines: List[str]) -> List[ChatMessage]:
+        messages = []
+        for line in lines:
+            line = line.rstrip("\r")
+            match = _WHATSAPP_HEADER_RE.match(line)
+            if match is None:
+                if self._current is not None and len(self._current.text) < CHAT_MAX_MESSAGE_CHARS:
+                    self._current.text = _clip(self._current.text + "\n" + line)
+                continue
+            if self._current is not None:
+                messages.append(self._finish())
+            sender, separator, text = match.group("rest").partition(": ")
+            if not separator or "<Media omitted>" in text:
+                continue # System notice ("Messages are end-to-end encrypted") or an attachment
+            self._current = ChatMessage(self.conversation, sender.strip("\u200e "),
+                                        self._timestamp(match.group("date"), match.group("time")), _clip(text))
+        return messages
+
+    def _timestamp(self, date: str, time: str) -> Optional[datetime.datetime]:
+        fields = re.split(r"[./-]", date)
+        parts = [int(field) for field in fields]
+        if len(fields[0]) == 4:
+            year, month, day = parts
+        else:
+            if self._month_first is None and (parts[0] > 12 or parts[1] > 12):
+                self._month_first = parts[1] > 12
+            if self._month_first:
+                month, day, year = parts
+            else:
+                day, month, year = parts
+        if year < 100:
+            year += 2000
+        meridiem = _MERIDIEM_RE.search(time)
+        clock = [int(part) for part in re.split(r"[:.]", time[:meridiem.start()] if meridiem else time)]
+        hour = clock[0]
+        if meridiem:
+            hour = hour % 12 + (12 if meridiem.group(1).upper() == "P" else 0)
+        try:
+            return datetime.datetime(year, month, day, hour, clock[1], clock[2] if len(clock) > 2 else 0)
+        except ValueError:
+            return None
+# --------------------
+
+
+# --- mbox ---
+_SUBJECT_PREFIX_RE = re.compile(r"^\s*(?:(?:re|fwd?|aw|sv|tr)\s*(?:\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+_MBOXRD_FROM_RE = re.compile(rb"^>+From ")
+_HTML_TAG_RE = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.IGNORECASE | re.DOTALL)
+_SPACES_RE = re.compile(r"[ \t]+")
+_REPLY_HEADER_RE = re.compile(r"^On .{0,200} wrote:\s*$")
+
+
+def _email_body(message) -> str:
+    part = message.get_body(preferencelist=("plain", "html"))
+    if part is None:
+        return ""
+    try:
+        content = part.get_content()
+    except (LookupError, UnicodeError): # Unknown or wrong charset
+        content = (part.get_payload(decode=True) or b"").decode("utf-8", errors="replace")
+    if part.get_content_subtype() == "html":
+        content = _SPACES_RE.sub(" ", html.unescape(_HTML_TAG_RE.sub(" ", content)))
+    lines = []
+    for line in content.splitlines():
+        if line.rstrip() == "--": # Signature delimiter
+            break
+        if line.startswith(">") or _REPLY_HEADER_RE.match(line):
+            continue # Quoted earlier messages are analysed where they were first sent
+        lines.append(line.rstrip())
+    return "\n".join(lines).strip()
+
+
+class MboxParser(_ExportParser):
+    """Splits on 'From ' separator lines and parses one email at a time; threads are grouped by subject."""
+
+    def __init__(self, default_conversation: str):
+        self._parser = BytesParser(policy=policy.default)
+        self._partial = b""
+        self._lines: List[bytes] = []
+        self._size = 0
+        self._previous_blank = True
+        self.skipped = 0
+
+    def feed(self, data: bytes) -> List[ChatMessage]:
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        if len(self._partial) > MAX_MBOX_MESSAGE_BYTES: # Unbroken line; keep only its start
+            lines.append(self._partial[:MAX_MBOX_MESSAGE_BYTES])
+            self._partial = b""
+        return self._consume(lines)
+
+    def close(self) -> List[ChatMessage]:
+        messages = self._consume([self._partial] if self._partial else [])
+        self._partial = b""
+        message = self._finish()
+        return messages + ([message] if message is not None else [])
+
+    def _consume(self, lines: List[bytes]) -> List[ChatMessage]:
+        messages = []
+        for line in lines:
+            if line.startswith(b"From ") and self._previous_blank:
+                message = self._finish()
+                if message is not None:
+                    messages.append(message)
+                self._previous_blank = False
+                continue
+            self._previous_blank = not line.strip()
+            if self._size < MAX_MBOX_MESSAGE_BYTES: # The rest of an oversized email is dropped
+                if _MBOXRD_FROM_RE.match(line):
+                    line = line[1:]
+                self._lines.append(line)
+                self._size += len(line) + 1
+        return messages
+
+    def _finish(self) -> Optional[ChatMessage]:
+        if not self._lines:
+            return None
+        raw = b"\n".join(self._lines)
+        self._lines, self._size = [], 0
+        try:
+            message = self._parser.parsebytes(raw)
+            subject = _SUBJECT_PREFIX_RE.sub("", str(message.get("subject") or "")).strip()
+            name, address = email.utils.parseaddr(str(message.get("from") or ""))
+            timestamp = None
+            if message.get("date"):
+                try:
+                    timestamp = _naive_utc(email.utils.parsedate_to_datetime(str(message["date"])))
+                except (TypeError, ValueError):
+                    pass
+            text = _email_body(message)
+        except Exception as e: # Malformed MIME; skip this email rather than the mailbox
+            print(f"Skipping unparseable email in mbox: {type(e).__name__}")
+            self.skipped += 1
+            return None
+        if not text:
+            return None
+        return ChatMessage(subject or "(no subject)", name or address or UNKNOWN_SENDER, timestamp, _clip(text))
+# --------------------
+
+
+def detect_export_format(filename: str, head: bytes) -> str:
+    """Picks the parser from the file name and its first bytes. Raises UnsupportedFileTypeError."""
+    lowered = filename.lower()
+    stripped = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    first_line = stripped.split(b"\n", 1)[0].decode("utf-8", errors="replace").rstrip("\r")
+    if lowered.endswith(".json"):
+        return FORMAT_TELEGRAM
+    if _WHATSAPP_HEADER_RE.match(first_line): # Before the JSON check: iOS lines start with '['
+        return FORMAT_WHATSAPP
+    if stripped.startswith((b"{", b"[")):
+        return FORMAT_TELEGRAM
+    if lowered.endswith(".mbox") or stripped.startswith(b"From "):
+        return FORMAT_MBOX
+    raise UnsupportedFileTypeError(
+        f"Unsupported export: {filename}. Please upload a Telegram JSON export (result.json), "
+        f"a WhatsApp chat export (.txt) or an mbox mailbox."
+    )
+
+
+def create_parser(export_format: str, filename: str) -> _ExportParser:
+    conversation = re.sub(r"\.[A-Za-z0-9]{1,5}$", "", filename.rsplit("/", 1)[-1]) or "Conversation"
+    parsers = {FORMAT_TELEGRAM: TelegramJSONParser, FORMAT_WHATSAPP: WhatsAppTextParser, FORMAT_MBOX: MboxParser}
+    return parsers[export_format](conversation)
@@ -0,0 +1,174 @@
+# WISE_backend/app/chunking.py
+
+"""
+Splitting long documents into overlapping chunks and merging the
+per-chunk analysis results back into a single result.
+"""
+import copy
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List
+
+from app.constants import INTENT_BLATANT, INTENT_BORDERLINE, INTENT_LEGITIMATE
+
+SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[.!?…])[\"')\]]*\s+")
+QUOTE_NORMALIZE_RE = re.compile(r"[^\w\s]+")
+
+
+@dataclass
+class TextChunk:
+    index: int
+    text: str
+    start: int # Character offset of the chunk in the source text
+    end: int
+
+
+@dataclass
+class _Unit:
+    start: int
+    end: int
+    paragraph_start: bool
+
+
+def _split_units(text: str, max_chars: int) -> List[_Unit]:
+    """
+    Splits text into sentences, hard-cutting any sentence longer than
+    max_chars. Offsets index into text; units that open a paragraph are
+    flagged so chunks can prefer to end on paragraph boundaries.
+    """
+    units: List[_Unit] = []
+    position = 0
+    for paragraph in text.split("\n"):
+        p_start, p_end = position, position + len(paragraph)
+        position = p_end + 1
+        if not paragraph.strip():
+            continue
+        s_start = p_start
+        boundaries = [p_start + m.end() for m in SENTENCE_BOUNDARY_RE.finditer(paragraph)] + [p_end]
+        for boundary in boundaries:
+            while boundary - s_start > max_chars:
+                units.append(_Unit(s_start, s_start + max_chars, s_start == p_start))
+                s_start += max_chars
+            if boundary > s_start:
+                units.append(_Unit(s_start, boundary, s_start == p_start))
+                s_start = boundary
+    return units
+
+
+def split_into_chunks(text: str, max_chars: int, overlap_chars: int) -> List[TextChunk]:
+    """
+    Packs sentence units into chunks of at most max_chars, ending on a
+    paragraph boundary when one falls in the last fifth of the chunk. Each
+    chunk after the first repeats up to overlap_chars of trailing sentences
+    from the previous chunk so tactics spanning a boundary are seen whole.
+    """
+    units = _split_units(text, max_chars)
+    chunks: List[TextChunk] = []
+    i = 0
+    first_new = 0 # First unit not yet covered by any chunk
+    while i < len(units):
+        j = i
+        while j < len(units) and units[j].end - units[i].start <= max_chars:
+            j += 1
+        if j <= first_new:
+            # The overlap left no room for new material; drop it for this chunk
+            i = first_new
+            continue
+        if j < len(units):
+            for k in range(j - 1, max(i, first_new), -1):
+                if units[k].start - units[i].start < 0.8 * max_chars:
+                    break
+                if units[k].paragraph_start:
+                    j = k
+                    break
+        start, end = units[i].start, units[j - 1].end
+        chunks.append(TextChunk(index=len(chunks), text=text[start:end], start=start, end=end))
+        if j >= len(units):
+            break
+        first_new = j
+        k = j
+        while k - 1 > i and units[j - 1].end - units[k - 1].start <= overlap_chars:
+            k -= 1
+        i = k
+    return chunks
+
+
+def _normalize_quote(quote: str) -> str:
+    return " ".join(QUOTE_NORMALIZE_RE.sub(" ", (quote or "").lower()).split())
+
+
+def _is_duplicate(tactic: dict, normalized_quote: str, existing: dict, existing_quote: str) -> bool:
+    if not normalized_quote or not existing_quote:
+        return False
+    if normalized_quote == existing_quote:
+        return True
+    # Overlap regions often yield the same finding with a slightly truncated quote
+    return tactic.get('id') == existing.get('id') and (
+        normalized_quote in existing_quote or existing_quote in normalized_quote
+    )
+
+
+def dedupe_tactics(tactic_lists: List[List[dict]]) -> List[dict]:
+    """Concatenates tactic lists, dropping findings repeated across overlap regions."""
+    merged: List[dict] = []
+    merged_quotes: List[str] = []
+    for tactics in tactic_lists:
+        for tactic in tactics:
+            normalized = _normalize_quote(tactic.get('quote', ''))
+            if any(_is_duplicate(tactic, normalized, kept, kept_quote)
+                   for kept, kept_quote in zip(merged, merged_quotes)):
+                continue
+            merged.append(tactic)
+            merged_quotes.append(normalized)
+    return merged
+
+
+def compute_intent_breakdown(tactics: List[dict]) -> List[dict]:
+    counts = Counter(t.get('intent') for t in tactics)
+    return [
+        {'name': intent, 'value': counts.get(intent, 0)}
+        for intent in (INTENT_BLATANT, INTENT_BORDERLINE, INTENT_LEGITIMATE)
+    ]
+
+
+def _manipulation_weight(result: dict) -> int:
+    intents = [t.get('intent') for t in result.get('tactics', [])]
+    return 2 * intents.count(INTENT_BLATANT) + intents.count(INTENT_BORDERLINE)
+
+
+def merge_chunk_results(results: List[dict], chunks: List[TextChunk]) -> dict:
+    """
+    Reduces per-chunk AnalysisResultFromAPI dicts into one. Tactics are
+    deduplicated, intentBreakdown is recounted and the confidence score is the
+    length-weighted mean of the chunk scores. Narrative sections come from the
+    chunk with the most manipulation, as it best represents the document.
+    """
+    if not results:
+        raise ValueError("No chunk results to merge")
+    if len(results) == 1:
+        return results[0]
+
+    dominant_index = max(range(len(results)), key=lambda idx: (_manipulation_weight(results[idx]), -idx))
+    merged = copy.deepcopy(results[dominant_index])
+
+    merged['tactics'] = dedupe_tactics([r.get('tactics', []) for r in results])
+    merged['intentBreakdown'] = compute_intent_breakdown(merged['tactics'])
+
+    weighted_total = 0.0
+    weight_sum = 0
+    for result, chunk in zip(results, chunks):
+        score = (result.get('metadata') or {}).get('confidenceScore')
+        if score is not None:
+            weighted_total += score * len(chunk.text)
+            weight_sum += len(chunk.text)
+    merged['metadata']['confidenceScore'] = round(weighted_total / weight_sum) if weight_sum else None
+
+    first_description = (results[0].get('metadata') or {}).get('input_data_description')
+    if first_description:
+        merged['metadata']['input_data_description'] = first_description
+
+    if merged['tactics']:
+        top_names = Counter(t.get('name') for t in merged['tactics'] if t.get('name')).most_common(3)
+        merged['executive_summary']['dominant_tactics'] = ", ".join(name for name, _ in top_names)
+    return merged
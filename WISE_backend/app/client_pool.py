@@ -0,0 +1,167 @@
+# WISE_backend/app/client_pool.py
+
+"""
+Pool of GenAI clients reused across requests made with the same user API key.
+
+Each genai.Client owns its own HTTP connection pool, so reusing one per key
+avoids repeated TLS and connection setup. The pool is keyed on a salted hash
+of the key; the plaintext key only lives inside the client object, which is
+dropped after an idle timeout, when the pool is full or when the upstream
+rejects the key. Requests hold their client with lease(), and a dropped
+client's connections are closed once the last request using it is done.
+Model calls go through the SDK's native async surface and are bounded by
+our own semaphore rather than by executor threads.
+
+The SDK takes most of a second to import, so it is imported by the first
+client created (or by the background warm-up, see app.startup) rather than
+when the server starts.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple
+
+from app.constants import (
+    GENAI_BASE_URL,
+    GENAI_CLIENT_POOL_MAX_CLIENTS,
+    GENAI_CLIENT_IDLE_TTL_SECONDS,
+    GENAI_MAX_CONCURRENT_CALLS,
+)
+
+if TYPE_CHECKING:
+    from google import genai
+
+# Per-process salt: hashes can't be compared across processes or reversed by lookup tables
+_KEY_SALT = os.urandom(16)
+
+
+def hash_api_key(api_key: str) -> str:
+    """Stable (per process) identifier for an API key that never exposes the key itself."""
+    return hashlib.sha256(_KEY_SALT + api_key.encode("utf-8")).hexdigest()
+
+
+class GenAIClientPool:
+    """LRU of genai clients keyed by API key hash, with idle eviction and a call concurrency cap."""
+
+    def __init__(
+        self,
+        max_clients: int = GENAI_CLIENT_POOL_MAX_CLIENTS,
+        idle_ttl_seconds: float = GENAI_CLIENT_IDLE_TTL_SECONDS,
+        max_concurrent_calls: int = GENAI_MAX_CONCURRENT_CALLS,
+        base_url: str = GENAI_BASE_URL,
+    ):
+        self.max_clients = max_clients
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.base_url = base_url
+        # key hash -> (client, last used monotonic time)
+        self._clients: "OrderedDict[str, Tuple[genai.Client, float]]" = OrderedDict()
+        self._call_slots = asyncio.Semaphore(max_concurrent_calls)
+        self._leases: Dict[int, int] = {} # id(client) -> requests holding it
+        self._dropped: Dict[int, "genai.Client"] = {} # Evicted while leased; closed on the last return
+        self._closing: Set[asyncio.Task] = set() # Keeps the aclose() tasks referenced until done
+        self.stats = {"created": 0, "reused": 0, "evicted": 0}
+
+    def get_client(self, api_key: str) -> "genai.Client":
+        """Returns the pooled client for api_key, creating it if needed. May raise on invalid input."""
+        now = time.monotonic()
+        self._evict_idle(now)
+        key_hash = hash_api_key(api_key)
+        entry = self._clients.get(key_hash)
+        if entry is not None:
+            self._clients[key_hash] = (entry[0], now)
+            self._clients.move_to_end(key_hash)
+            self.stats["reused"] += 1
+            return entry[0]
+
+        from google import genai # Deferred import, see the module docstring
+
+        http_options = {"base_url": self.base_url} if self.base_url else None
+        client = genai.Client(api_key=api_key, http_options=http_options)
+        self._clients[key_hash] = (client, now)
+        self.stats["created"] += 1
+        while len(self._clients) > self.max_clients:
+            _, (oldest, _) = self._clients.popitem(last=False)
+            self._close(oldest)
+        return client
+
+    @contextmanager
+    def lease(self, client: "genai.Client"):
+        """Holds a client from get_client() for a request; eviction meanwhile doesn't close it."""
+        client_id = id(client)
+        self._leases[client_id] = self._leases.get(client_id, 0) + 1
+        try:
+            yield client
+        finally:
+            remaining = self._leases.pop(client_id) - 1
+            if remaining:
+                self._leases[client_id] = remaining
+            elif client_id in self._dropped:
+                self._release(self._dropped.pop(client_id))
+
+    def discard(self, client: "genai.Client") -> None:
+        """Drops a pooled client, e.g. after the upstream rejected its key as invalid."""
+        for key_hash, (pooled, _) in self._clients.items():
+            if pooled is client:
+                del self._clients[key_hash]
+                self._close(client)
+                return
+
+    @staticmethod
+    def warm_up() -> None:
+        """Imports the SDK ahead of the first analysis; called off the event loop at startup."""
+        import google.genai
+
+    @asynccontextmanager
+    async def call_slot(self, timeout: Optional[float] = None):
+        """
+        Bounds the number of concurrent outbound model calls for this process.
+        Raises asyncio.TimeoutError if no slot frees up within timeout seconds.
+        """
+        if timeout is None:
+            await self._call_slots.acquire()
+        else:
+            await asyncio.wait_for(self._call_slots.acquire(), timeout)
+        try:
+            yield
+        finally:
+            self._call_slots.release()
+
+    def _evict_idle(self, now: float) -> None:
+        while self._clients:
+            key_hash, (client, last_used) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_ttl_seconds:
+                break
+            del self._clients[key_hash]
+            self._close(client)
+
+    def _close(self, client: "genai.Client") -> None:
+        self.stats["evicted"] += 1
+        if id(client) in self._leases:
+            self._dropped[id(client)] = client # Still in use; closed by lease() when returned
+        else:
+            self._release(client)
+
+    def _release(self, client: "genai.Client") -> None:
+        # The SDK has no public close(); release the connection pools best-effort
+        api_client = getattr(client, "_api_client", None)
+        async_httpx = getattr(api_client, "_async_httpx_client", None)
+        sync_httpx = getattr(api_client, "_httpx_client", None)
+        if sync_httpx is not None:
+            sync_httpx.close()
+        if async_httpx is not None:
+            try:
+                task = asyncio.get_running_loop().create_task(async_httpx.aclose())
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+            except RuntimeError:
+                pass # No running loop; the connections are released on garbage collection
+
+    def snapshot_stats(self) -> dict:
+        return {**self.stats, "clients": len(self._clients), "leased": len(self._leases)}
+
+
+# Shared process-wide pool used by the analysis pipeline
+client_pool = GenAIClientPool()
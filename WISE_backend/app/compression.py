@@ -0,0 +1,99 @@
+# WISE_backend/app/compression.py
+
+"""
+Response compression.
+
+GZipJSONMiddleware gzips complete JSON API responses for clients that accept
+it. Unlike Starlette's GZipMiddleware, it leaves streamed responses (NDJSON and
+SSE analysis events, batch progress) untouched: a compressor buffers its
+output, which would hold back the events until enough data has built up.
+"""
+import gzip
+from typing import Dict, Iterable, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.constants import API_GZIP_LEVEL, GZIP_MIN_BYTES
+
+try: # Optional: brotli variants of the static assets are only built when it is installed
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODING_BROTLI = "br"
+ENCODING_GZIP = "gzip"
+ENCODING_IDENTITY = "identity"
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}. A coding listed with q=0 is refused."""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.lower()] = quality
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: str, available: Iterable[str]) -> Optional[str]:
+    """The first of the available codings (in preference order) the client accepts; None for identity."""
+    accepted = accepted_encodings(accept_encoding)
+    for coding in available:
+        quality = accepted.get(coding, accepted.get("*", 0.0))
+        if quality > 0:
+            return coding
+    return None
+
+
+def brotli_compress(data: bytes, quality: int) -> Optional[bytes]:
+    return brotli.compress(data, quality=quality) if brotli is not None else None
+
+
+class GZipJSONMiddleware:
+    """Pure ASGI middleware compressing single-message JSON responses of at least minimum_size bytes."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = GZIP_MIN_BYTES, level: int = API_GZIP_LEVEL):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepts_gzip = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), (ENCODING_GZIP,)) is not None
+        held_start: Optional[Message] = None
+        first_body = True
+
+        async def compressing_send(message: Message) -> None:
+            nonlocal held_start, first_body
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if headers.get("content-type", "").startswith("application/json") and "content-encoding" not in headers:
+                    held_start = message # Sent with the first body, once we know whether it is streamed
+                    return
+            elif message["type"] == "http.response.body" and first_body and held_start is not None:
+                first_body = False
+                start, held_start = held_start, None
+                headers = MutableHeaders(raw=start["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                body = message.get("body", b"")
+                if accepts_gzip and not message.get("more_body", False) and len(body) >= self.minimum_size:
+                    body = gzip.compress(body, compresslevel=self.level, mtime=0)
+                    headers["content-encoding"] = ENCODING_GZIP
+                    headers["content-length"] = str(len(body))
+                    message = {**message, "body": body}
+                await send(start)
+            await send(message)
+
+        await self.app(scope, receive, compressing_send)
@@ -3,14 +3,30 @@
 """
 Constants used across the backend application.
 """
+import os
 
 # File Paths
 TAXONOMY_FILE_NAME = "taxonomy_kb.json"
+TAXONOMY_FILE_PATH = os.path.join(os.path.dirname(__file__), "..", TAXONOMY_FILE_NAME)
+# Learning material per tactic (scenarios, intent spectrum, citations), served by /api/tactics/{id}
+TACTIC_DETAILS_FILE_PATH = os.getenv(
+    "WISE_TACTIC_DETAILS_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "tacticsData.json"),
+)
+# Precompressed /api/tactics payloads, written by the build step only (python -m app.knowledge); "" disables it
+KNOWLEDGE_SNAPSHOT_PATH = os.getenv(
+    "WISE_KNOWLEDGE_SNAPSHOT_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "knowledge_snapshot.json"),
+)
 
 # API Configuration
 GEMINI_API_KEY_ENV_VAR = "GEMINI_API_KEY"
 GEMINI_MODEL_NAME = "models/gemini-2.0-flash"
+GEMINI_FALLBACK_MODEL_NAME = os.getenv("WISE_GEMINI_FALLBACK_MODEL_NAME", "") # e.g. "models/gemini-2.0-flash-lite"; empty disables fallback
 GEMINI_RESPONSE_MIME_TYPE = "application/json"
+# Bump on semantic prompt changes. The effective prompt version (see app.prompt_builder) also
+# fingerprints the compiled template and taxonomy digest, so edits there invalidate caches too.
+PROMPT_TEMPLATE_VERSION = "3"
 
 # Taxonomy and Analysis Constants
 TAXONOMY_ROOT_KEY = "taxonomy"
@@ -40,11 +56,12 @@ PROMPT_OBJECTIVE_SUFFIX = "\n--- END TEXT ---"
 PROMPT_PROCESS_HEADER = "Process (Chain-of-Thought):"
 PROMPT_PROCESS_STEPS = [
     "1.  Identify author's Stated Goal: What does the author explicitly say they want to achieve with this communication?",
-    "2.  List Persuasive Tactics Used: Identify all manipulative tactics present in the text using the provided taxonomy (taxonomy_kb.json).",
+    "2.  List Persuasive Tactics Used: Identify all manipulative tactics present in the text using the provided taxonomy (see the taxonomy digest above).",
     "3.  Assess Necessity of Tactics: Are these tactics necessary to achieve the stated goal, or are they excessive and primarily intended to manipulate the audience's emotions or beliefs?",
     "4.  Infer Author's Intent: Based on the above factors, determine the author's likely intent: Primarily to inform/persuade rationally, or primarily to manipulate/deceive? Provide a confidence score (as a number 0-100) for this assessment.",
     "5. Identify Factual Claims: Scrutinise the text for specific, verifiable factual claims (e.g., statistics, dates, events). Prioritise claims that are central to the speaker's argument or that seem questionable.",
     "6. Identify grounded and ethical resistance strategies for each identified tactic.",
+    "7. If the text is making unsubstantiated claims of fact, or twisting facts to strengthen an identified tactic:  use web search to source evidence that either directly disproves or challenges such claims, choose the (maximum) 3 most relevant and trustworthy sources to provide the URL of in the output, use shortened Bit.ly style URL's",
 ]
 PROMPT_IMPLEMENTATION_HEADER = "Implementation (Directional-Stimulus Prompting):"
 PROMPT_IMPLEMENTATION_DETAILS = [
@@ -60,6 +77,15 @@ PROMPT_IMPLEMENTATION_DETAILS = [
     "Explanation: Explain how the tactic is being used and why it falls into the chosen Intent category.",
     "resistanceStrategy: How to recognize and resist the tactic.", # Note: resistanceStrategy field renamed in models
 ]
+# Dropped from the trimmed template used when the latency budget is tight
+PROMPT_FACT_CHECK_INSTRUCTIONS = [
+    PROMPT_PROCESS_STEPS[4],
+    PROMPT_PROCESS_STEPS[6],
+    PROMPT_IMPLEMENTATION_DETAILS[4],
+]
+PROMPT_TRIMMED_BREVITY_NOTE = "Keep each explanation and resistanceStrategy to one or two sentences, and each detailed report section to a short paragraph."
+PROMPT_TAXONOMY_DIGEST_HEADER = "Taxonomy digest (id | tactic name | category). Use exactly these ids, names and categories for 'tactics[].id', 'tactics[].name' and 'tactics[].category':"
+PROMPT_PRESCREEN_HINT = "Pre-screen hint: a lexical scan flagged these taxonomy tactic ids as likely present: {}. Verify each against the text and report any other tactics you find."
 PROMPT_OUTPUT_HEADER = "Output Format: IMPORTANT - Adhere strictly to the requested JSON schema."
 PROMPT_OUTPUT_DETAILS = [
     f"Specifically, provide the results for '{METADATA_KEY}', '{EXECUTIVE_SUMMARY_KEY}', '{INTENT_BREAKDOWN_KEY}', '{OVERALL_ASSESSMENT_KEY}', '{TACTICS_KEY}', and '{DETAILED_REPORT_SECTIONS_KEY}'.",
@@ -81,6 +107,113 @@ ALLOWED_ORIGINS = [
     # "https://your-frontend-domain.com",
 ]
 
+# GenAI Client Pool Configuration
+GENAI_BASE_URL = os.getenv("WISE_GENAI_BASE_URL", "") # Override the API endpoint (e.g. a local fake for benchmarks)
+GENAI_CLIENT_POOL_MAX_CLIENTS = int(os.getenv("WISE_GENAI_CLIENT_POOL_MAX_CLIENTS", "64"))
+GENAI_CLIENT_IDLE_TTL_SECONDS = float(os.getenv("WISE_GENAI_CLIENT_IDLE_TTL_SECONDS", "300"))
+GENAI_MAX_CONCURRENT_CALLS = int(os.getenv("WISE_GENAI_MAX_CONCURRENT_CALLS", "32"))
+
+# Model Call Scheduling (deadlines, retries, hedging, circuit breaking)
+LLM_DEADLINE_SECONDS = float(os.getenv("WISE_LLM_DEADLINE_SECONDS", "120")) # All model calls of one analysis
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("WISE_LLM_ATTEMPT_TIMEOUT_SECONDS", "60")) # One call (to first chunk when streaming)
+LLM_MAX_RETRIES = int(os.getenv("WISE_LLM_MAX_RETRIES", "2")) # Per model, for 429/5xx/timeouts/connection errors only
+LLM_RETRY_BASE_DELAY_SECONDS = float(os.getenv("WISE_LLM_RETRY_BASE_DELAY_SECONDS", "0.5"))
+LLM_RETRY_MAX_DELAY_SECONDS = float(os.getenv("WISE_LLM_RETRY_MAX_DELAY_SECONDS", "8"))
+LLM_HEDGE_ENABLED = os.getenv("WISE_LLM_HEDGE_ENABLED", "false").lower() == "true" # Hedges spend the user's quota; opt in
+LLM_HEDGE_QUANTILE = float(os.getenv("WISE_LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("WISE_LLM_HEDGE_MIN_DELAY_SECONDS", "2"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("WISE_LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("WISE_LLM_CIRCUIT_FAILURE_THRESHOLD", "5")) # Consecutive upstream failures
+LLM_CIRCUIT_OPEN_SECONDS = float(os.getenv("WISE_LLM_CIRCUIT_OPEN_SECONDS", "30"))
+
+# Admission Control (limits are per process; API keys are identified by their salted hash)
+ADMISSION_ENABLED = os.getenv("WISE_ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("WISE_ADMISSION_MAX_IN_FLIGHT", "32")) # Analyses running at once
+ADMISSION_PER_KEY_MAX_IN_FLIGHT = int(os.getenv("WISE_ADMISSION_PER_KEY_MAX_IN_FLIGHT", "4"))
+ADMISSION_MAX_QUEUED = int(os.getenv("WISE_ADMISSION_MAX_QUEUED", "128")) # Waiting requests across all keys
+ADMISSION_PER_KEY_MAX_QUEUED = int(os.getenv("WISE_ADMISSION_PER_KEY_MAX_QUEUED", "8"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("WISE_ADMISSION_MAX_WAIT_SECONDS", "15")) # 0 rejects instead of queueing
+
+# Incremental Re-analysis (paragraph findings are kept in memory per API key hash)
+INCREMENTAL_ENABLED = os.getenv("WISE_INCREMENTAL_ENABLED", "true").lower() == "true"
+INCREMENTAL_MAX_DOCUMENTS = int(os.getenv("WISE_INCREMENTAL_MAX_DOCUMENTS", "256"))
+INCREMENTAL_TTL_SECONDS = float(os.getenv("WISE_INCREMENTAL_TTL_SECONDS", str(60 * 60)))
+INCREMENTAL_MIN_REUSED_FRACTION = float(os.getenv("WISE_INCREMENTAL_MIN_REUSED_FRACTION", "0.5")) # Of the text, by characters
+INCREMENTAL_CONTEXT_PARAGRAPHS = int(os.getenv("WISE_INCREMENTAL_CONTEXT_PARAGRAPHS", "1")) # Sent around each changed paragraph
+
+# Batch Jobs (results persist in SQLite with a TTL; document text and API keys are never stored)
+BATCH_MAX_ITEMS = int(os.getenv("WISE_BATCH_MAX_ITEMS", "50")) # Files per job, after expanding .zip archives
+BATCH_MAX_TOTAL_BYTES = int(os.getenv("WISE_BATCH_MAX_TOTAL_BYTES", str(50 * 1024 * 1024))) # Upload and unzipped size
+BATCH_ITEM_CONCURRENCY = int(os.getenv("WISE_BATCH_ITEM_CONCURRENCY", "4")) # Items of one job analysed at once
+BATCH_MAX_WORKERS = int(os.getenv("WISE_BATCH_MAX_WORKERS", "8")) # Items analysed at once across all jobs
+BATCH_JOB_TTL_SECONDS = float(os.getenv("WISE_BATCH_JOB_TTL_SECONDS", str(24 * 60 * 60)))
+# Holds verbatim quotes until the TTL ends, so it lives in an app-owned directory (0700, file 0600), not /tmp
+BATCH_DB_PATH = os.getenv(
+    "WISE_BATCH_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "var", "batch_jobs.sqlite3"),
+) # ":memory:" keeps nothing across restarts
+
+# Chat Export Ingestion (Telegram JSON, WhatsApp .txt and mbox uploads are parsed as they are read)
+CHAT_EXPORT_MAX_UPLOAD_BYTES = int(os.getenv("WISE_CHAT_EXPORT_MAX_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+CHAT_MAX_MESSAGE_CHARS = int(os.getenv("WISE_CHAT_MAX_MESSAGE_CHARS", "20000")) # Longer messages are truncated
+CHAT_WINDOW_GAP_SECONDS = float(os.getenv("WISE_CHAT_WINDOW_GAP_SECONDS", str(6 * 60 * 60))) # Silence that starts a new window
+CHAT_WINDOW_MAX_CHARS = int(os.getenv("WISE_CHAT_WINDOW_MAX_CHARS", "12000")) # Text sent to the model per window
+CHAT_MAX_OPEN_WINDOWS = int(os.getenv("WISE_CHAT_MAX_OPEN_WINDOWS", "64")) # Conversations buffered at once
+CHAT_WINDOW_CONCURRENCY = int(os.getenv("WISE_CHAT_WINDOW_CONCURRENCY", "4")) # Windows of one upload analysed at once
+CHAT_MAX_WINDOWS = int(os.getenv("WISE_CHAT_MAX_WINDOWS", "200")) # Model calls per upload; later windows are counted, not analysed
+CHAT_MAX_CONVERSATIONS = int(os.getenv("WISE_CHAT_MAX_CONVERSATIONS", "200")) # Reported one by one; the rest are summed up
+CHAT_TOP_TACTICS_PER_CONVERSATION = int(os.getenv("WISE_CHAT_TOP_TACTICS_PER_CONVERSATION", "20"))
+
+# Result Cache Configuration (content-addressed, never keyed on the user's API key)
+RESULT_CACHE_ENABLED = os.getenv("WISE_RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("WISE_RESULT_CACHE_MAX_ENTRIES", "256"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("WISE_RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("WISE_RESULT_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+RESULT_CACHE_DB_PATH = os.getenv("WISE_RESULT_CACHE_DB_PATH", "") # Empty disables the SQLite tier
+RESULT_CACHE_DB_MAX_ENTRIES = int(os.getenv("WISE_RESULT_CACHE_DB_MAX_ENTRIES", "5000"))
+
+# Chunked (map-reduce) Analysis Configuration for long documents
+CHUNKED_ANALYSIS_THRESHOLD_CHARS = int(os.getenv("WISE_CHUNKED_ANALYSIS_THRESHOLD_CHARS", "30000"))
+CHUNK_MAX_CHARS = int(os.getenv("WISE_CHUNK_MAX_CHARS", "12000"))
+CHUNK_OVERLAP_CHARS = int(os.getenv("WISE_CHUNK_OVERLAP_CHARS", "600"))
+CHUNK_MAX_CONCURRENCY = int(os.getenv("WISE_CHUNK_MAX_CONCURRENCY", "4"))
+
+# Prompt Planning (token estimates and per-request latency budget)
+PROMPT_LATENCY_BUDGET_SECONDS = float(os.getenv("WISE_PROMPT_LATENCY_BUDGET_SECONDS", "30"))
+# Opt-in: the trimmed prompt meets the budget by dropping the fact-check steps
+PROMPT_TRIMMING_ENABLED = os.getenv("WISE_PROMPT_TRIMMING_ENABLED", "false").lower() == "true"
+CHARS_PER_TOKEN = 4 # Rough average for English prose
+MODEL_MAX_OUTPUT_TOKENS = int(os.getenv("WISE_MODEL_MAX_OUTPUT_TOKENS", "8192"))
+MODEL_BASE_LATENCY_SECONDS = float(os.getenv("WISE_MODEL_BASE_LATENCY_SECONDS", "1.0"))
+MODEL_INPUT_TOKENS_PER_SECOND = float(os.getenv("WISE_MODEL_INPUT_TOKENS_PER_SECOND", "20000"))
+MODEL_OUTPUT_TOKENS_PER_SECOND = float(os.getenv("WISE_MODEL_OUTPUT_TOKENS_PER_SECOND", "180"))
+OUTPUT_BASE_TOKENS = 900 # Metadata, summaries and report sections
+OUTPUT_BASE_TOKENS_TRIMMED = 450
+OUTPUT_TOKENS_PER_TACTIC = 180
+OUTPUT_TOKENS_PER_TACTIC_TRIMMED = 90
+
+# Local Pre-screen Configuration
+# "off": disabled; "hint": tell the model which tactics the pre-screen flagged;
+# "filter": also skip the model for text with no cues and send only flagged paragraphs (plus context)
+PRESCREEN_MODE = os.getenv("WISE_PRESCREEN_MODE", "hint")
+PRESCREEN_CONTEXT_PARAGRAPHS = int(os.getenv("WISE_PRESCREEN_CONTEXT_PARAGRAPHS", "1"))
+
+# Observability (metrics and timings carry no document content or API keys)
+METRICS_ENABLED = os.getenv("WISE_METRICS_ENABLED", "true").lower() == "true" # Serves GET /metrics
+SERVER_TIMING_ENABLED = os.getenv("WISE_SERVER_TIMING_ENABLED", "true").lower() == "true"
+REQUEST_TIMING_LOG_ENABLED = os.getenv("WISE_REQUEST_TIMING_LOG_ENABLED", "true").lower() == "true"
+
+# Compression and Static Files
+API_GZIP_ENABLED = os.getenv("WISE_API_GZIP_ENABLED", "true").lower() == "true" # Complete JSON responses only, never streams
+API_GZIP_LEVEL = int(os.getenv("WISE_API_GZIP_LEVEL", "6"))
+GZIP_MIN_BYTES = int(os.getenv("WISE_GZIP_MIN_BYTES", "1024")) # Smaller bodies aren't worth the extra header and CPU
+STATIC_GZIP_LEVEL = int(os.getenv("WISE_STATIC_GZIP_LEVEL", "6")) # When indexed at runtime; the build step (python -m app.static_files) uses the max
+STATIC_BROTLI_QUALITY = int(os.getenv("WISE_STATIC_BROTLI_QUALITY", "5"))
+STATIC_SERVE_SOURCE_MAPS = os.getenv("WISE_STATIC_SERVE_SOURCE_MAPS", "false").lower() == "true" # Enable for debugging only
+
+# Cold Start (heavy imports and static indexing are deferred; see app.startup)
+STARTUP_WARM_UP = os.getenv("WISE_STARTUP_WARM_UP", "true").lower() == "true" # Run them in the background once serving
+
 # File Handling Constants
 CONTENT_TYPE_DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
 CONTENT_TYPE_TEXT_PREFIX = "text/"
@@ -88,6 +221,13 @@ FILE_EXTENSION_DOCX = ".docx"
 FILE_EXTENSION_TXT = ".txt"
 FILE_EXTENSION_MD = ".md"
 DEFAULT_ENCODING = 'utf-8'
+MAX_UPLOAD_BYTES = int(os.getenv("WISE_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+MULTIPART_OVERHEAD_BYTES = 64 * 1024 # Allowance for form fields and multipart framing
+UPLOAD_READ_CHUNK_BYTES = 64 * 1024
+EXTRACTION_EXECUTOR = os.getenv("WISE_EXTRACTION_EXECUTOR", "process") # "process" keeps parsing off the GIL; "thread" avoids worker processes
+EXTRACTION_MAX_WORKERS = int(os.getenv("WISE_EXTRACTION_MAX_WORKERS", "2"))
+EXTRACTION_TIMEOUT_SECONDS = float(os.getenv("WISE_EXTRACTION_TIMEOUT_SECONDS", "20"))
+EXTRACTION_MAX_CHARS = int(os.getenv("WISE_EXTRACTION_MAX_CHARS", "2000000"))
 
 # Error Messages
 ERROR_GENAI_CLIENT_INIT = "Failed to initialize GenAI client"
@@ -96,11 +236,13 @@ ERROR_GENAI_API_CALL_FAILED = "GenAI API Call Error"
 ERROR_GENAI_INVALID_RESPONSE = "GenAI Error: Response structure invalid."
 ERROR_GENAI_JSON_PARSE = "Failed to parse GenAI JSON response"
 ERROR_BACKEND_PROCESSING_FAILED = "Backend processing failed"
-ERROR_DOCX_SUPPORT_DISABLED = ".docx processing is not enabled (python-docx library missing)"
 ERROR_DOCX_PARSE_FAILED = "Failed to parse .docx file"
 ERROR_FILE_DECODE_FAILED = "Failed to decode file as UTF-8"
 ERROR_UNSUPPORTED_FILE_TYPE = "Unsupported file type. Please upload .txt, .md, or .docx."
 ERROR_EMPTY_CONTENT = "Extracted text content is empty."
+ERROR_UPLOAD_TOO_LARGE = "Uploaded file is too large. The limit is {} bytes."
+ERROR_EXTRACTION_TIMEOUT = "Extracting text from the file took too long."
+ERROR_EXTRACTION_TOO_LARGE = "Extracted text exceeds the limit of {} characters."
 ERROR_ANALYSIS_FAILED = "Analysis failed"
 ERROR_UNEXPECTED_FILE_PROCESSING = "Internal server error processing file"
 
@@ -0,0 +1,391 @@
+# WISE_backend/app/conversations.py
+
+"""
+Per-conversation analysis of chat exports and mailboxes.
+
+Messages parsed by app.chat_exports are grouped into windows. A window holds
+consecutive messages of one conversation and closes after a silence of
+CHAT_WINDOW_GAP_SECONDS, or once it reaches CHAT_WINDOW_MAX_CHARS. Each
+closed window is analysed by run_wise like a document, but without
+incremental reuse, and holds its own admission slot (app.admission), so
+an upload gets no more of the key's share than other requests. Several
+windows are analysed at once while parsing continues. At most
+CHAT_MAX_WINDOWS windows are analysed per upload; later ones are still
+parsed and counted. A bounded queue between the parser
+and the workers makes reading wait when analysis falls behind. Only bounded
+summaries are kept per conversation (counts, category totals and the top
+tactics), so memory does not grow with the size of the export.
+"""
+import asyncio
+import bisect
+import datetime
+import heapq
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.constants import (
+    CHAT_WINDOW_GAP_SECONDS,
+    CHAT_WINDOW_MAX_CHARS,
+    CHAT_MAX_WINDOWS,
+    CHAT_MAX_OPEN_WINDOWS,
+    CHAT_WINDOW_CONCURRENCY,
+    CHAT_MAX_CONVERSATIONS,
+    CHAT_TOP_TACTICS_PER_CONVERSATION,
+    INTENT_BLATANT,
+    INTENT_BORDERLINE,
+    INTENT_LEGITIMATE,
+)
+from app.admission import admission_controller, AdmissionRejectedError, AdmissionTicket
+from app.analysis_module import run_wise, validated_result, AnalysisError, UpstreamError
+from app.client_pool import hash_api_key
+from app.chat_exports import ChatMessage, detect_export_format, create_parser
+from app.extraction import ExtractionError
+from app.llm_scheduler import status_code
+
+MAX_PARTICIPANTS = 20 # Listed per conversation; mailing-list threads can have hundreds
+MAX_ERRORS = 5 # Distinct window errors kept per conversation
+FAIL_FAST_WINDOWS = 3 # Give up when this many windows failed (transiently) before any succeeded
+REJECTED_STATUS_CODES = (400, 401, 403) # Invalid key or request; every other window would fail the same way
+OTHER_CONVERSATIONS = "(other conversations)"
+INTENT_WEIGHTS = {INTENT_BLATANT: 2, INTENT_BORDERLINE: 1}
+
+
+def _fails_every_window(e: Exception) -> bool:
+    """The key or the request was rejected, rather than the model API being busy or slow."""
+    if not isinstance(e, AnalysisError) or isinstance(e, UpstreamError):
+        return False
+    return status_code(e.__cause__) in REJECTED_STATUS_CODES or "API key" in str(e)
+
+
+def _isoformat(value: Optional[datetime.datetime]) -> Optional[str]:
+    return value.isoformat(timespec="minutes") if value is not None else None
+
+
+@dataclass
+class _Window:
+    conversation: str
+    sequence: int # Order in which windows were opened across the export
+    lines: List[str] = field(default_factory=list)
+    offsets: List[int] = field(default_factory=list) # Start of each message's line in the window text
+    senders: List[Tuple[str, Optional[datetime.datetime]]] = field(default_factory=list)
+    chars: int = 0
+    last_timestamp: Optional[datetime.datetime] = None
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+    def add(self, message: ChatMessage, max_chars: int) -> None:
+        prefix = f"[{message.timestamp:%Y-%m-%d %H:%M}] " if message.timestamp else ""
+        line = f"{prefix}{message.sender}: {message.text}"[:max_chars]
+        self.offsets.append(self.chars + len(self.lines)) # Plus one newline per earlier line
+        self.lines.append(line)
+        self.senders.append((message.sender, message.timestamp))
+        self.chars += len(line)
+        if message.timestamp is not None:
+            self.last_timestamp = message.timestamp
+
+    def message_at(self, offset: int) -> int:
+        """Index of the message whose line contains the offset into the window text."""
+        return max(0, bisect.bisect_right(self.offsets, offset) - 1)
+
+
+class ConversationWindower:
+    """Groups messages into per-conversation windows; at most max_open windows are buffered at a time."""
+
+    def __init__(self, gap_seconds: float = CHAT_WINDOW_GAP_SECONDS, max_chars: int = CHAT_WINDOW_MAX_CHARS,
+                 max_open: int = CHAT_MAX_OPEN_WINDOWS):
+        self.gap = datetime.timedelta(seconds=gap_seconds)
+        self.max_chars = max_chars
+        self.max_open = max_open
+        self._open: "OrderedDict[str, _Window]" = OrderedDict() # Least recently extended first
+        self._sequence = 0
+
+    def add(self, message: ChatMessage) -> List[_Window]:
+        """Adds a message; returns the windows closed by it."""
+        closed = []
+        window = self._open.get(message.conversation)
+        if window is not None and self._ends_window(window, message):
+            closed.append(self._open.pop(message.conversation))
+            window = None
+        if window is None:
+            window = self._open[message.conversation] = _Window(message.conversation, self._sequence)
+            self._sequence += 1
+            if len(self._open) > self.max_open:
+                closed.append(self._open.popitem(last=False)[1])
+        else:
+            self._open.move_to_end(message.conversation)
+        window.add(message, self.max_chars)
+        return closed
+
+    def _ends_window(self, window: _Window, message: ChatMessage) -> bool:
+        if window.chars + len(message.text) > self.max_chars:
+            return True
+        return (message.timestamp is not None and window.last_timestamp is not None
+                and message.timestamp - window.last_timestamp > self.gap)
+
+    def close_all(self) -> List[_Window]:
+        windows = sorted(self._open.values(), key=lambda window: window.sequence)
+        self._open.clear()
+        return windows
+
+
+class _ConversationSummary:
+    """Running totals for one conversation; its size is bounded whatever the number of windows."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.messages = 0
+        self.windows = 0
+        self.failed_windows = 0
+        self.first_message_at: Optional[datetime.datetime] = None
+        self.last_message_at: Optional[datetime.datetime] = None
+        self.participants: Counter = Counter()
+        self.categories: Dict[str, Dict[str, int]] = {}
+        self.intents: Counter = Counter()
+        self.tactic_counts: Counter = Counter() # By tactic name; bounded by the taxonomy
+        self._top: List[Tuple[int, int, dict]] = [] # Min-heap of (intent weight, -order, tactic)
+        self._order = 0
+        self.errors: List[str] = []
+
+    def add_messages(self, window: _Window) -> None:
+        self.messages += len(window.senders)
+        for sender, timestamp in window.senders:
+            if sender in self.participants or len(self.participants) < MAX_PARTICIPANTS:
+                self.participants[sender] += 1
+            if timestamp is not None:
+                if self.first_message_at is None or timestamp < self.first_message_at:
+                    self.first_message_at = timestamp
+                if self.last_message_at is None or timestamp > self.last_message_at:
+                    self.last_message_at = timestamp
+
+    def add_result(self, window: _Window, result: dict) -> None:
+        self.windows += 1
+        for tactic in result.get('tactics') or []:
+            intent = tactic.get('intent')
+            self.intents[intent] += 1
+            self.tactic_counts[tactic.get('name')] += 1
+            if intent in INTENT_WEIGHTS and tactic.get('category'): # Counted like finalize_result does
+                counts = self.categories.setdefault(tactic['category'], {'blatant': 0, 'borderline': 0})
+                counts['blatant' if intent == INTENT_BLATANT else 'borderline'] += 1
+            self._keep_top(INTENT_WEIGHTS.get(intent, 0), _attributed(tactic, window))
+
+    def add_failure(self, message: str) -> None:
+        self.windows += 1
+        self.failed_windows += 1
+        if message not in self.errors and len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+
+    def _keep_top(self, weight: int, tactic: dict) -> None:
+        entry = (weight, -self._order, tactic) # Earlier findings win ties
+        self._order += 1
+        if len(self._top) < CHAT_TOP_TACTICS_PER_CONVERSATION:
+            heapq.heappush(self._top, entry)
+        elif entry[:2] > self._top[0][:2]:
+            heapq.heapreplace(self._top, entry)
+
+    @property
+    def weight(self) -> int:
+        return sum(INTENT_WEIGHTS.get(intent, 0) * count for intent, count in self.intents.items())
+
+    def to_dict(self) -> dict:
+        top = sorted(self._top, key=lambda entry: entry[:2], reverse=True)
+        return {
+            'name': self.name,
+            'messages': self.messages,
+            'windows': self.windows,
+            'failedWindows': self.failed_windows,
+            'firstMessageAt': _isoformat(self.first_message_at),
+            'lastMessageAt': _isoformat(self.last_message_at),
+            'participants': [name for name, _ in self.participants.most_common()],
+            'intentBreakdown': _intent_breakdown(self.intents),
+            'manipulationByCategory': _category_list(self.categories),
+            'tacticCounts': [{'name': name, 'count': count} for name, count in self.tactic_counts.most_common()],
+            'tactics': [tactic for _, _, tactic in top],
+            'errors': list(self.errors),
+        }
+
+
+def _attributed(tactic: dict, window: _Window) -> dict:
+    """The tactic with its quote tied to the message it came from instead of an offset into the window."""
+    attributed = {key: value for key, value in tactic.items() if key != 'quoteSpan'}
+    span = tactic.get('quoteSpan')
+    if span:
+        sender, timestamp = window.senders[window.message_at(span['start'])]
+        attributed['message'] = {'sender': sender, 'timestamp': _isoformat(timestamp)}
+    else:
+        attributed['message'] = None
+    attributed['window'] = window.sequence
+    return attributed
+
+
+def _intent_breakdown(intents: Counter) -> List[dict]:
+    return [{'name': intent, 'value': intents.get(intent, 0)} for intent in (INTENT_BLATANT, INTENT_BORDERLINE, INTENT_LEGITIMATE)]
+
+
+def _category_list(categories: Dict[str, Dict[str, int]]) -> List[dict]:
+    return [{'name': name, **counts} for name, counts in categories.items()]
+
+
+class _ExportReport:
+    """Summaries of up to CHAT_MAX_CONVERSATIONS conversations; any further ones are summed into one entry."""
+
+    def __init__(self, export_format: str):
+        self.export_format = export_format
+        self.conversations: Dict[str, _ConversationSummary] = {}
+        self.analyzed_windows = 0
+        self.failed_windows = 0
+        self.submitted_windows = 0
+        self.unanalysed_windows = 0 # Beyond CHAT_MAX_WINDOWS
+        self.first_error: Optional[Exception] = None
+        self.fatal: Optional[Exception] = None
+
+    def summary(self, name: str) -> _ConversationSummary:
+        summary = self.conversations.get(name)
+        if summary is None:
+            if len(self.conversations) >= CHAT_MAX_CONVERSATIONS:
+                name = OTHER_CONVERSATIONS
+                summary = self.conversations.get(name)
+            if summary is None:
+                summary = self.conversations[name] = _ConversationSummary(name)
+        return summary
+
+    def to_dict(self, skipped_messages: int) -> dict:
+        conversations = sorted(self.conversations.values(), key=lambda summary: (-summary.weight, summary.name))
+        categories: Dict[str, Dict[str, int]] = {}
+        intents: Counter = Counter()
+        for summary in conversations:
+            intents.update(summary.intents)
+            for name, counts in summary.categories.items():
+                total = categories.setdefault(name, {'blatant': 0, 'borderline': 0})
+                total['blatant'] += counts['blatant']
+                total['borderline'] += counts['borderline']
+        return {
+            'format': self.export_format,
+            'conversations': [summary.to_dict() for summary in conversations],
+            'intentBreakdown': _intent_breakdown(intents),
+            'manipulationByCategory': _category_list(categories),
+            'totals': {
+                'conversations': len(conversations),
+                'messages': sum(summary.messages for summary in conversations),
+                'windows': self.analyzed_windows + self.failed_windows + self.unanalysed_windows,
+                'failedWindows': self.failed_windows,
+                'unanalysedWindows': self.unanalysed_windows,
+                'skippedMessages': skipped_messages,
+            },
+        }
+
+
+class ConversationAnalyzer:
+    """Parses an export as it is read and analyses its windows concurrently."""
+
+    def __init__(self, concurrency: int = CHAT_WINDOW_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self.stats = {"exports": 0, "messages": 0, "windows": 0, "failed_windows": 0}
+
+    async def analyze(self, chunks: AsyncIterator[bytes], filename: str, user_api_key: str) -> dict:
+        """
+        Returns per-conversation results and totals for an export read from chunks.
+        Raises UnsupportedFileTypeError or ExtractionError for unreadable exports,
+        and the first window's error when no window could be analysed at all.
+        """
+        chunks = chunks.__aiter__()
+        chunk = await anext(chunks, b"")
+        export_format = detect_export_format(filename, chunk)
+        parser = create_parser(export_format, filename)
+        windower = ConversationWindower()
+        report = _ExportReport(export_format)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency) # Backpressure on the parser
+        key_hash = hash_api_key(user_api_key)
+        workers = [asyncio.create_task(self._worker(queue, report, user_api_key, key_hash))
+                   for _ in range(self.concurrency)]
+        self.stats["exports"] += 1
+        try:
+            while chunk:
+                for message in parser.feed(chunk):
+                    for window in windower.add(message):
+                        await self._submit(queue, report, window)
+                chunk = await anext(chunks, b"")
+            for message in parser.close():
+                for window in windower.add(message):
+                    await self._submit(queue, report, window)
+            for window in windower.close_all():
+                await self._submit(queue, report, window)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+        if report.fatal is None and report.analyzed_windows == 0 and report.first_error is not None:
+            report.fatal = report.first_error
+        if report.fatal is not None:
+            raise report.fatal
+        if not report.conversations:
+            raise ExtractionError("No messages were found in the export.")
+        print(f"Analysed {export_format} export: {len(report.conversations)} conversation(s), "
+              f"{report.analyzed_windows} window(s), {report.failed_windows} failed.")
+        return report.to_dict(parser.skipped)
+
+    async def _submit(self, queue: asyncio.Queue, report: _ExportReport, window: _Window) -> None:
+        if report.fatal is not None:
+            raise report.fatal
+        report.summary(window.conversation).add_messages(window)
+        self.stats["messages"] += len(window.senders)
+        if report.submitted_windows >= CHAT_MAX_WINDOWS:
+            report.unanalysed_windows += 1
+            return
+        report.submitted_windows += 1
+        await queue.put(window)
+
+    async def _admit(self, report: _ExportReport, key_hash: str) -> Optional[AdmissionTicket]:
+        """
+        A slot for one window. Until a window has been analysed, a rejection
+        fails the upload (the client sees 429/503 and retries later); after
+        that, rejections are waited out so the analysed part isn't lost.
+        """
+        while report.fatal is None:
+            try:
+                return await admission_controller.acquire(key_hash)
+            except AdmissionRejectedError as e:
+                if report.analyzed_windows == 0:
+                    report.fatal = e
+                    return None
+                await asyncio.sleep(e.retry_after)
+        return None
+
+    async def _worker(self, queue: asyncio.Queue, report: _ExportReport, user_api_key: str, key_hash: str) -> None:
+        while True:
+            window = await queue.get()
+            if window is None:
+                return
+            ticket = await self._admit(report, key_hash) if report.fatal is None else None
+            if ticket is None:
+                continue # Failed; drain so the parser isn't left blocked on a full queue
+            summary = report.summary(window.conversation)
+            try:
+                result = validated_result(await run_wise(window.text, user_api_key, incremental=False))
+            except Exception as e: # One failed window doesn't fail the conversation
+                print(f"Conversation window failed: {type(e).__name__}")
+                report.failed_windows += 1
+                self.stats["failed_windows"] += 1
+                summary.add_failure(f"Analysis failed: {e}")
+                report.first_error = report.first_error or e
+                if report.analyzed_windows == 0 and (_fails_every_window(e)
+                                                     or report.failed_windows >= FAIL_FAST_WINDOWS):
+                    report.fatal = report.first_error
+                continue
+            finally:
+                ticket.release()
+            report.analyzed_windows += 1
+            self.stats["windows"] += 1
+            summary.add_result(window, result)
+
+    def snapshot_stats(self) -> dict:
+        return dict(self.stats)
+
+
+# Shared process-wide analyzer used by the conversation endpoint
+conversation_analyzer = ConversationAnalyzer()
@@ -0,0 +1,180 @@
+# WISE_backend/app/extraction.py
+
+"""
+Text extraction from uploaded files, run off the event loop.
+
+.docx text is read with a streaming XML parser over word/document.xml, so
+memory stays proportional to one paragraph rather than the whole document
+tree. Extraction runs in a thread or process pool with a timeout so a large
+or pathological upload cannot stall other requests on the same worker. On a
+timeout the pool is replaced (and its worker processes killed), so stuck
+extractions can't fill it.
+"""
+import asyncio
+import io
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+
+from app.constants import (
+    CONTENT_TYPE_DOCX,
+    CONTENT_TYPE_TEXT_PREFIX,
+    FILE_EXTENSION_DOCX,
+    FILE_EXTENSION_TXT,
+    FILE_EXTENSION_MD,
+    DEFAULT_ENCODING,
+    EXTRACTION_EXECUTOR,
+    EXTRACTION_MAX_WORKERS,
+    EXTRACTION_TIMEOUT_SECONDS,
+    EXTRACTION_MAX_CHARS,
+    ERROR_EXTRACTION_TIMEOUT,
+    ERROR_EXTRACTION_TOO_LARGE,
+)
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_PARAGRAPH = WORD_NS + "p"
+_TEXT = WORD_NS + "t"
+_TAB = WORD_NS + "tab"
+_BREAKS = (WORD_NS + "br", WORD_NS + "cr")
+_BODY = WORD_NS + "body"
+
+
+# --- Custom Exceptions (kept to a single message argument so they pickle across processes) ---
+class ExtractionError(Exception):
+    """The file could not be parsed or decoded."""
+    pass
+
+class UnsupportedFileTypeError(ExtractionError):
+    """The file is neither a supported document type nor UTF-8 text."""
+    pass
+
+class ExtractionTimeoutError(ExtractionError):
+    """Extraction did not finish within EXTRACTION_TIMEOUT_SECONDS."""
+    pass
+# ----------------------
+
+
+def is_docx(filename: str, content_type: str) -> bool:
+    return content_type == CONTENT_TYPE_DOCX or filename.endswith(FILE_EXTENSION_DOCX)
+
+
+def iter_docx_paragraphs(data: bytes, max_chars: int = EXTRACTION_MAX_CHARS):
+    """
+    Yields the text of each paragraph in a .docx file, in document order.
+    Matches python-docx's Paragraph.text for runs, tabs and line breaks, but
+    also includes paragraphs inside tables and text boxes.
+    """
+    total_chars = 0
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        with archive.open("word/document.xml") as xml_stream:
+            open_paragraphs: List[List[str]] = []
+            body = None
+            depth = 0
+            for event, elem in ET.iterparse(xml_stream, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if elem.tag == _PARAGRAPH:
+                        open_paragraphs.append([])
+                    elif elem.tag == _BODY:
+                        body = elem
+                    continue
+
+                depth -= 1
+                if open_paragraphs:
+                    if elem.tag == _TEXT:
+                        open_paragraphs[-1].append(elem.text or "")
+                    elif elem.tag == _TAB:
+                        open_paragraphs[-1].append("\t")
+                    elif elem.tag in _BREAKS:
+                        open_paragraphs[-1].append("\n")
+                if elem.tag == _PARAGRAPH:
+                    text = "".join(open_paragraphs.pop())
+                    total_chars += len(text) + 1
+                    if total_chars > max_chars:
+                        raise ExtractionError(ERROR_EXTRACTION_TOO_LARGE.format(max_chars))
+                    yield text
+                # Drop finished top-level blocks (paragraphs, tables) so the tree never grows
+                if depth == 2 and body is not None:
+                    body.clear()
+
+
+def extract_docx_text(data: bytes) -> str:
+    try:
+        return "\n".join(iter_docx_paragraphs(data))
+    except ExtractionError:
+        raise
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        raise ExtractionError(f"Failed to parse .docx file: {e}") from None
+    except (RuntimeError, NotImplementedError) as e: # Encrypted archive or unsupported compression method
+        raise ExtractionError(f"Failed to read .docx file: {e}") from None
+
+
+def extract_text(data: bytes, filename: str, content_type: str) -> str:
+    """Synchronous extraction entry point; runs inside the extraction pool."""
+    if is_docx(filename, content_type):
+        return extract_docx_text(data)
+
+    is_text = (content_type.startswith(CONTENT_TYPE_TEXT_PREFIX)
+               or filename.endswith(FILE_EXTENSION_TXT) or filename.endswith(FILE_EXTENSION_MD))
+    try:
+        text = data.decode(DEFAULT_ENCODING)
+    except UnicodeDecodeError as e:
+        if is_text:
+            raise ExtractionError(f"Failed to decode file as UTF-8: {e}") from None
+        # Fallback attempt to decode as UTF-8 for unspecified text types failed
+        raise UnsupportedFileTypeError(f"Unsupported file type: {filename} ({content_type}). Please upload .txt, .md, or .docx.") from None
+    if len(text) > EXTRACTION_MAX_CHARS:
+        raise ExtractionError(ERROR_EXTRACTION_TOO_LARGE.format(EXTRACTION_MAX_CHARS))
+    return text
+
+
+_executor: Optional[Executor] = None
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if EXTRACTION_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=EXTRACTION_MAX_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=EXTRACTION_MAX_WORKERS, thread_name_prefix="wise-extract")
+    return _executor
+
+
+def _recycle_executor(executor: Executor) -> None:
+    """
+    Replaces the pool after a timeout. Worker processes are killed; a thread
+    can't be, but the new pool's workers don't wait behind it.
+    """
+    global _executor
+    if _executor is executor:
+        _executor = None
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def warm_up() -> None:
+    """Starts the extraction pool, so the first upload does not wait for a worker process to spawn."""
+    _get_executor().submit(extract_text, b"", "warm-up.txt", CONTENT_TYPE_TEXT_PREFIX).result()
+
+
+async def extract_text_async(data: bytes, filename: str, content_type: str,
+                             timeout: float = EXTRACTION_TIMEOUT_SECONDS) -> str:
+    """Runs extract_text in the extraction pool, raising ExtractionTimeoutError after timeout seconds."""
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        executor = _get_executor()
+        future = loop.run_in_executor(executor, extract_text, data, filename, content_type)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            _recycle_executor(executor)
+            raise ExtractionTimeoutError(ERROR_EXTRACTION_TIMEOUT) from None
+        except BrokenExecutor:
+            # Killed by another upload's timeout (or a crashed worker); retried once on a new pool
+            _recycle_executor(executor)
+            if attempt:
+                raise
@@ -0,0 +1,257 @@
+# WISE_backend/app/incremental.py
+
+"""
+Paragraph-level reuse of earlier findings when an edited document is resubmitted.
+
+Documents are split into paragraphs the same way as everywhere else (newline
+separated, as produced by the .docx extraction) and each paragraph is hashed
+on its whitespace-normalized text. After an analysis, every tactic is filed
+under the paragraphs its quote span covers. When the same user later submits
+a document that shares most of its paragraphs with an earlier one, only the
+new or changed paragraphs, plus neighbouring paragraphs for context, go to
+the model. Findings whose paragraphs are all unchanged are reused.
+
+Records are scoped to the salted API key hash, the model and the prompt
+version. One user's narrative sections are never reused for another user's
+document. Everything is kept in memory only, bounded by count and age.
+"""
+import bisect
+import copy
+import hashlib
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.constants import (
+    INCREMENTAL_ENABLED,
+    INCREMENTAL_MAX_DOCUMENTS,
+    INCREMENTAL_TTL_SECONDS,
+    INCREMENTAL_MIN_REUSED_FRACTION,
+    INCREMENTAL_CONTEXT_PARAGRAPHS,
+)
+from app.client_pool import hash_api_key
+
+OMITTED_MARKER = "[...]" # Same marker as the pre-screen excerpt
+
+
+@dataclass
+class Paragraph:
+    line: int # Index in text.split("\n")
+    start: int
+    end: int
+    digest: str
+
+
+def split_paragraphs(text: str) -> List[Paragraph]:
+    """Non-blank lines of text with their offsets and content hashes."""
+    paragraphs: List[Paragraph] = []
+    position = 0
+    for line, paragraph in enumerate(text.split("\n")):
+        start = position
+        position += len(paragraph) + 1
+        normalized = " ".join(paragraph.split())
+        if normalized:
+            digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+            paragraphs.append(Paragraph(line, start, start + len(paragraph), digest))
+    return paragraphs
+
+
+def _paragraph_at(paragraphs: List[Paragraph], starts: List[int], offset: int) -> Optional[int]:
+    position = bisect.bisect_right(starts, offset) - 1
+    if position >= 0 and offset <= paragraphs[position].end:
+        return position
+    return None
+
+
+def _covered_paragraphs(paragraphs: List[Paragraph], starts: List[int], span: dict) -> List[int]:
+    first = _paragraph_at(paragraphs, starts, span['start'])
+    last = _paragraph_at(paragraphs, starts, max(span['start'], span['end'] - 1))
+    if first is None or last is None:
+        return []
+    return list(range(first, last + 1))
+
+
+@dataclass
+class _DocumentRecord:
+    scope: str
+    digests: List[str]
+    # Tactics (without quoteSpan) with the digests of every paragraph their quote covers
+    located: List[Tuple[dict, Tuple[str, ...]]]
+    unlocated: List[dict] # Quote couldn't be found in the text; can't be tied to a paragraph
+    result: dict # The final result minus its tactics: metadata and narrative sections to reuse
+    recorded_at: float
+
+
+@dataclass
+class IncrementalPlan:
+    """How a resubmitted document relates to the earlier version it is based on."""
+    base: _DocumentRecord
+    paragraphs: List[Paragraph]
+    changed: List[int] # Positions in paragraphs that must be analysed
+    reused_tactics: List[dict]
+    reused_chars: int
+    changed_chars: int
+    changed_lines: Set[int] # Line numbers of the changed paragraphs
+
+    def in_changed_paragraph(self, span: Optional[dict]) -> bool:
+        """Whether a newly found tactic belongs to a changed paragraph rather than to the context around it."""
+        if span is None:
+            return True # Not locatable: keep it rather than lose a finding
+        starts = [paragraph.start for paragraph in self.paragraphs]
+        covered = _covered_paragraphs(self.paragraphs, starts, span)
+        return any(self.paragraphs[position].line in self.changed_lines for position in covered)
+
+    def stats(self, new_tactics: int) -> dict:
+        total_chars = self.reused_chars + self.changed_chars
+        return {
+            "paragraphs": len(self.paragraphs),
+            "reusedParagraphs": len(self.paragraphs) - len(self.changed),
+            "analyzedParagraphs": len(self.changed),
+            "reusedFraction": round(self.reused_chars / total_chars, 3) if total_chars else 1.0,
+            "reusedTactics": len(self.reused_tactics),
+            "newTactics": new_tactics,
+        }
+
+
+class ParagraphFindingsStore:
+    """Per-user LRU of analysed documents, indexed by paragraph hash."""
+
+    def __init__(
+        self,
+        max_documents: int = INCREMENTAL_MAX_DOCUMENTS,
+        ttl_seconds: float = INCREMENTAL_TTL_SECONDS,
+        min_reused_fraction: float = INCREMENTAL_MIN_REUSED_FRACTION,
+        context_paragraphs: int = INCREMENTAL_CONTEXT_PARAGRAPHS,
+        enabled: bool = INCREMENTAL_ENABLED,
+    ):
+        self.max_documents = max_documents
+        self.ttl_seconds = ttl_seconds
+        self.min_reused_fraction = min_reused_fraction
+        self.context_paragraphs = context_paragraphs
+        self.enabled = enabled
+        self._documents: "OrderedDict[str, _DocumentRecord]" = OrderedDict()
+        # (scope, paragraph digest) -> id of the most recent document containing it
+        self._by_paragraph: Dict[Tuple[str, str], str] = {}
+        self.stats = {"recorded": 0, "incremental": 0, "reused_paragraphs": 0, "analyzed_paragraphs": 0}
+
+    @staticmethod
+    def scope(user_api_key: str, model_name: str, prompt_version: str) -> str:
+        return hashlib.sha256(f"{hash_api_key(user_api_key)}\x00{model_name}\x00{prompt_version}".encode()).hexdigest()
+
+    @staticmethod
+    def _document_id(scope: str, digests: List[str]) -> str:
+        return hashlib.sha256("\x00".join([scope, *digests]).encode()).hexdigest()
+
+    def record(self, scope: str, paragraphs: List[Paragraph], result: dict) -> None:
+        """Files the tactics of a finished analysis (with quoteSpans set) under their paragraphs."""
+        if not self.enabled or not paragraphs:
+            return
+        digests = [paragraph.digest for paragraph in paragraphs]
+        starts = [paragraph.start for paragraph in paragraphs]
+        located, unlocated = [], []
+        for tactic in result.get('tactics') or []:
+            stored = {key: value for key, value in tactic.items() if key != 'quoteSpan'}
+            covered = _covered_paragraphs(paragraphs, starts, tactic['quoteSpan']) if tactic.get('quoteSpan') else []
+            if covered:
+                located.append((stored, tuple(digests[position] for position in covered)))
+            else:
+                unlocated.append(stored)
+        narrative = {key: value for key, value in result.items() if key not in ('tactics', 'reuse')}
+
+        document_id = self._document_id(scope, digests)
+        if document_id in self._documents:
+            del self._documents[document_id]
+        self._documents[document_id] = _DocumentRecord(scope, digests, located, unlocated, copy.deepcopy(narrative),
+                                                       time.monotonic())
+        for digest in digests:
+            self._by_paragraph[(scope, digest)] = document_id
+        self.stats["recorded"] += 1
+        while len(self._documents) > self.max_documents:
+            self._evict(next(iter(self._documents)))
+
+    def _evict(self, document_id: str) -> None:
+        record = self._documents.pop(document_id)
+        for digest in record.digests:
+            if self._by_paragraph.get((record.scope, digest)) == document_id:
+                del self._by_paragraph[(record.scope, digest)]
+
+    def _base_for(self, scope: str, paragraphs: List[Paragraph]) -> Optional[_DocumentRecord]:
+        """The earlier document sharing the most text with this one."""
+        shared_chars: Counter = Counter()
+        for paragraph in paragraphs:
+            document_id = self._by_paragraph.get((scope, paragraph.digest))
+            if document_id is not None:
+                shared_chars[document_id] += paragraph.end - paragraph.start
+        for document_id, _ in shared_chars.most_common():
+            record = self._documents.get(document_id)
+            if record is None:
+                continue
+            if time.monotonic() - record.recorded_at > self.ttl_seconds:
+                self._evict(document_id)
+                continue
+            self._documents.move_to_end(document_id)
+            return record
+        return None
+
+    def plan(self, scope: str, paragraphs: List[Paragraph]) -> Optional[IncrementalPlan]:
+        """
+        Returns a plan if an earlier version of this document can be reused, i.e.
+        at least min_reused_fraction of its text is unchanged. Returns None for
+        unrelated documents and for exact resubmissions, which the result cache serves.
+        """
+        if not self.enabled or not paragraphs:
+            return None
+        base = self._base_for(scope, paragraphs)
+        if base is None:
+            return None
+        digests = [paragraph.digest for paragraph in paragraphs]
+        if digests == base.digests:
+            return None
+        known = set(base.digests)
+        changed = [position for position, paragraph in enumerate(paragraphs) if paragraph.digest not in known]
+        changed_chars = sum(paragraphs[position].end - paragraphs[position].start for position in changed)
+        total_chars = sum(paragraph.end - paragraph.start for paragraph in paragraphs)
+        reused_chars = total_chars - changed_chars
+        if reused_chars < self.min_reused_fraction * total_chars:
+            return None
+
+        present = set(digests)
+        reused = [copy.deepcopy(tactic) for tactic, covered in base.located if all(d in present for d in covered)]
+        # Unlocatable findings can't be checked against the edit; keep them as the earlier analysis reported them
+        reused.extend(copy.deepcopy(tactic) for tactic in base.unlocated)
+        self.stats["incremental"] += 1
+        self.stats["reused_paragraphs"] += len(paragraphs) - len(changed)
+        self.stats["analyzed_paragraphs"] += len(changed)
+        return IncrementalPlan(base, paragraphs, changed, reused, reused_chars, changed_chars,
+                               {paragraphs[position].line for position in changed})
+
+    def excerpt(self, text: str, plan: IncrementalPlan) -> str:
+        """The changed paragraphs plus context_paragraphs neighbours each side, with omitted stretches marked."""
+        lines = text.split("\n")
+        positions = set()
+        for position in plan.changed:
+            for neighbour in range(position - self.context_paragraphs, position + self.context_paragraphs + 1):
+                if 0 <= neighbour < len(plan.paragraphs):
+                    positions.add(neighbour)
+        excerpt_lines = []
+        previous = -1
+        for position in sorted(positions):
+            if position != previous + 1:
+                excerpt_lines.append(OMITTED_MARKER)
+            excerpt_lines.append(lines[plan.paragraphs[position].line])
+            previous = position
+        if previous != len(plan.paragraphs) - 1:
+            excerpt_lines.append(OMITTED_MARKER)
+        return "\n".join(excerpt_lines)
+
+    def clear(self) -> None:
+        self._documents.clear()
+        self._by_paragraph.clear()
+
+    def snapshot_stats(self) -> dict:
+        return {**self.stats, "documents": len(self._documents), "enabled": self.enabled}
+
+
+# Shared process-wide store used by the analysis pipeline
+paragraph_store = ParagraphFindingsStore()
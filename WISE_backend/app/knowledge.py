@@ -0,0 +1,252 @@
+# WISE_backend/app/knowledge.py
+
+"""
+The tactic knowledge base: the taxonomy (taxonomy_kb.json) merged with the
+learning material (tacticsData.json: scenarios, intent spectrum, citations)
+by tactic id.
+
+Both files are loaded once at startup. The analysis pipeline reads the
+taxonomy from here. Compressing the API payloads is most of the startup cost,
+so the build step (python -m app.knowledge) validates the sources and writes
+the gzip variants to a JSON snapshot. Serving processes only read it: a
+variant is used if the snapshot's fingerprint of the two source files still
+matches and the variant decompresses to the exact payload body. Otherwise
+the payload is compressed at startup.
+
+The /api/tactics endpoints serve a compact index and full per-tactic
+details. Every payload is serialized once, with a strong ETag and a gzip
+variant, so a request costs a dictionary lookup; clients revalidate with
+If-None-Match and get 304.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from app.compression import ENCODING_GZIP, negotiate_encoding
+from app.constants import (
+    TAXONOMY_FILE_PATH,
+    TACTIC_DETAILS_FILE_PATH,
+    KNOWLEDGE_SNAPSHOT_PATH,
+    TAXONOMY_ROOT_KEY,
+    GZIP_MIN_BYTES,
+)
+from app.static_files import etag_matches
+from app.startup import startup_report
+
+INDEX_FIELDS = ("id", "name", "category", "description") # Enough to list and link the tactics
+CACHE_CONTROL = "public, max-age=3600" # Changes only with a deploy; revalidated by ETag afterwards
+SNAPSHOT_FORMAT = 2 # Bump when the snapshot contents change shape
+REQUIRED_TACTIC_FIELDS = ("id", "tactic_name", "category", "description")
+INTENT_SPECTRUM_LEVELS = ("legitimate", "borderline", "blatant") # Rendered by the UI's TacticDetailViewer
+
+
+@dataclass
+class KnowledgePayload:
+    """A serialized JSON response body with its ETag and (when worthwhile) gzip variant."""
+    body: bytes
+    etag: str
+    gzipped: Optional[bytes] = None
+
+    @classmethod
+    def of(cls, value, compressed: Optional[Dict[str, bytes]] = None) -> "KnowledgePayload":
+        """compressed: gzip variants from the snapshot by ETag, used instead of compressing again if they match."""
+        body = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        if len(body) < GZIP_MIN_BYTES:
+            return cls(body, etag)
+        gzipped = (compressed or {}).get(etag)
+        if gzipped is None or not _gunzips_to(gzipped, body):
+            gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        return cls(body, etag, gzipped)
+
+
+def _gunzips_to(gzipped: bytes, body: bytes) -> bool:
+    try:
+        return gzip.decompress(gzipped) == body
+    except (OSError, EOFError):
+        return False
+
+
+def payload_response(payload: KnowledgePayload, request_headers: Headers) -> Response:
+    """200 with the (gzipped, if accepted) body, or 304 when the client's copy is current."""
+    headers = {"ETag": payload.etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if etag_matches(request_headers.get("if-none-match", ""), payload.etag):
+        return Response(status_code=304, headers=headers)
+    if payload.gzipped is not None and negotiate_encoding(request_headers.get("accept-encoding", ""), (ENCODING_GZIP,)):
+        headers["Content-Encoding"] = ENCODING_GZIP
+        return Response(payload.gzipped, media_type="application/json", headers=headers)
+    return Response(payload.body, media_type="application/json", headers=headers)
+
+
+def _read_source(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"Warning: {os.path.basename(path)} not found at expected path {path}. Tactic information might be limited.")
+        return None
+
+
+def _decode_source(data: Optional[bytes], path: str, default):
+    """A missing or corrupt file only limits the features using it."""
+    if data is None:
+        return default
+    try:
+        return json.loads(data)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        print(f"Warning: Could not decode {os.path.basename(path)} at {path}. File might be corrupted.")
+        return default
+
+
+def validate_knowledge(taxonomy: dict, details: List[dict]) -> List[str]:
+    """Problems that would leave tactics unnamed, uncategorized or without their learning material."""
+    problems = []
+    seen = set()
+    for position, entry in enumerate(taxonomy.get("tactics", [])):
+        missing = [name for name in REQUIRED_TACTIC_FIELDS if not entry.get(name)]
+        if missing:
+            problems.append(f"taxonomy tactic #{position} is missing {', '.join(missing)}")
+        if entry.get("id") in seen:
+            problems.append(f"taxonomy tactic id {entry['id']} is duplicated")
+        seen.add(entry.get("id"))
+    for detail in details:
+        tactic_id = detail.get("id") if isinstance(detail, dict) else None
+        if tactic_id not in seen:
+            problems.append(f"tactic details for id {tactic_id} have no taxonomy entry")
+            continue
+        levels = detail.get("intent_spectrum") or {}
+        if any(level not in levels for level in INTENT_SPECTRUM_LEVELS):
+            problems.append(f"tactic details for id {tactic_id} lack part of the intent spectrum")
+    return problems
+
+
+class TacticKnowledgeBase:
+    """Tactics indexed by id and by category, with their API payloads prebuilt."""
+
+    def __init__(self, taxonomy: dict, details: List[dict], compressed: Optional[Dict[str, bytes]] = None):
+        self.taxonomy = taxonomy
+        self.details = details
+        details_by_id = {item["id"]: item for item in details if isinstance(item, dict) and "id" in item}
+        self.tactics: "OrderedDict[int, dict]" = OrderedDict()
+        for entry in sorted((t for t in taxonomy.get("tactics", []) if "id" in t), key=lambda t: t["id"]):
+            detail = details_by_id.pop(entry["id"], {})
+            self.tactics[entry["id"]] = {
+                **detail,
+                "id": entry["id"],
+                "name": entry.get("tactic_name") or detail.get("name", ""),
+                "category": entry.get("category", ""),
+                "description": entry.get("description", ""),
+                "intent_qualifiers": entry.get("intent_qualifiers", []),
+                "example": entry.get("example", ""),
+            }
+        for tactic_id, detail in sorted(details_by_id.items()): # Learning material for a tactic not in the taxonomy
+            self.tactics[tactic_id] = {"category": "", "description": detail.get("definition", ""), **detail}
+
+        self.by_category: Dict[str, List[int]] = {}
+        for tactic in self.tactics.values():
+            self.by_category.setdefault(tactic["category"], []).append(tactic["id"])
+
+        index = [{key: tactic.get(key) for key in INDEX_FIELDS} for tactic in self.tactics.values()]
+        self._index = KnowledgePayload.of({"version": taxonomy.get("version"), "tactics": index}, compressed)
+        self._category_indexes = {
+            category.lower(): KnowledgePayload.of({
+                "version": taxonomy.get("version"),
+                "tactics": [entry for entry in index if entry["category"] == category],
+            }, compressed)
+            for category in self.by_category
+        }
+        self._details = {tactic_id: KnowledgePayload.of(tactic, compressed) for tactic_id, tactic in self.tactics.items()}
+
+    @classmethod
+    def load(cls, taxonomy_path: str = TAXONOMY_FILE_PATH, details_path: str = TACTIC_DETAILS_FILE_PATH,
+             snapshot_path: str = KNOWLEDGE_SNAPSHOT_PATH) -> "TacticKnowledgeBase":
+        """From the source files, reusing the snapshot's gzip variants when it was built from the same files."""
+        taxonomy_data = _read_source(taxonomy_path)
+        details_data = _read_source(details_path)
+        compressed = _read_snapshot(snapshot_path, _fingerprint(taxonomy_data, details_data)) if snapshot_path else None
+        taxonomy = _decode_source(taxonomy_data, taxonomy_path, {}).get(TAXONOMY_ROOT_KEY, {})
+        details = _decode_source(details_data, details_path, [])
+        details = details if isinstance(details, list) else []
+        if compressed is None: # The build step validated the sources the snapshot was made from
+            for problem in validate_knowledge(taxonomy, details):
+                print(f"Warning: {problem}.")
+        return cls(taxonomy, details, compressed)
+
+    def payloads(self) -> List[KnowledgePayload]:
+        return [self._index, *self._category_indexes.values(), *self._details.values()]
+
+    def index_payload(self, category: Optional[str] = None) -> Optional[KnowledgePayload]:
+        """The compact listing of all tactics, or of one category (case-insensitive); None for unknown categories."""
+        if category is None:
+            return self._index
+        return self._category_indexes.get(category.lower())
+
+    def detail_payload(self, tactic_id: int) -> Optional[KnowledgePayload]:
+        return self._details.get(tactic_id)
+
+    def snapshot_stats(self) -> dict:
+        return {"tactics": len(self.tactics), "categories": len(self.by_category),
+                "with_details": sum(1 for tactic in self.tactics.values() if "definition" in tactic)}
+
+
+def _fingerprint(taxonomy_data: Optional[bytes], details_data: Optional[bytes]) -> str:
+    return hashlib.sha256(b"\x00".join(
+        [str(SNAPSHOT_FORMAT).encode(), taxonomy_data or b"", details_data or b""]
+    )).hexdigest()
+
+
+def _read_snapshot(path: str, fingerprint: str) -> Optional[Dict[str, bytes]]:
+    """The snapshot's gzip variants by ETag, or None if it is missing, unreadable or built from other sources."""
+    try:
+        with open(path, "rb") as f:
+            snapshot = json.loads(f.read())
+        if snapshot.get("format") != SNAPSHOT_FORMAT or snapshot.get("fingerprint") != fingerprint:
+            return None
+        return {etag: base64.b64decode(data) for etag, data in snapshot["gzip"].items()}
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"Warning: Ignoring unreadable knowledge snapshot {path}: {type(e).__name__}")
+        return None
+
+
+def write_snapshot(path: str = KNOWLEDGE_SNAPSHOT_PATH) -> TacticKnowledgeBase:
+    """Build step: validates the sources (SystemExit on problems) and writes the snapshot atomically."""
+    taxonomy_data = _read_source(TAXONOMY_FILE_PATH)
+    details_data = _read_source(TACTIC_DETAILS_FILE_PATH)
+    taxonomy = _decode_source(taxonomy_data, TAXONOMY_FILE_PATH, {}).get(TAXONOMY_ROOT_KEY, {})
+    details = _decode_source(details_data, TACTIC_DETAILS_FILE_PATH, [])
+    details = details if isinstance(details, list) else []
+    problems = validate_knowledge(taxonomy, details)
+    if taxonomy_data is None or details_data is None or problems:
+        raise SystemExit("Knowledge sources are missing or invalid:\n  " + "\n  ".join(problems))
+    knowledge = TacticKnowledgeBase(taxonomy, details)
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "fingerprint": _fingerprint(taxonomy_data, details_data),
+        "gzip": {payload.etag: base64.b64encode(payload.gzipped).decode("ascii")
+                 for payload in knowledge.payloads() if payload.gzipped is not None},
+    }
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+    os.replace(temporary_path, path)
+    return knowledge
+
+
+# Shared process-wide knowledge base used by the analysis pipeline and the tactics endpoints
+with startup_report.phase("init_knowledge"):
+    knowledge_base = TacticKnowledgeBase.load()
+
+
+if __name__ == "__main__":
+    _knowledge = write_snapshot()
+    print(f"Wrote knowledge snapshot {KNOWLEDGE_SNAPSHOT_PATH}: {_knowledge.snapshot_stats()}")
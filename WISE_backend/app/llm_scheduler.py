@@ -0,0 +1,421 @@
+# WISE_backend/app/llm_scheduler.py
+
+"""
+Deadline-aware scheduling of model calls.
+
+Every analysis gets one Deadline covering all of its model calls. Within it,
+LLMScheduler runs each call with:
+  * a per-attempt timeout, so a stuck upstream response can't hold a call
+    slot indefinitely;
+  * jittered exponential retries for retryable errors only (429, 5xx,
+    timeouts, connection errors), honouring Retry-After when present;
+  * an optional hedged second request once the first has run longer than the
+    model's recent p95 latency (off by default: it spends the user's quota);
+  * a per-model circuit breaker that fails fast while upstream is degraded
+    (429s are per-key quota and don't count against it);
+  * an optional fallback model used when the primary's retries are exhausted
+    or its circuit is open.
+
+Streams are retried only until their first chunk arrives; after that, tactics
+have been sent to the client and a failure is final.
+"""
+import asyncio
+import random
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+import httpx
+
+from app.constants import (
+    GEMINI_MODEL_NAME,
+    GEMINI_FALLBACK_MODEL_NAME,
+    LLM_ATTEMPT_TIMEOUT_SECONDS,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_DELAY_SECONDS,
+    LLM_RETRY_MAX_DELAY_SECONDS,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_QUANTILE,
+    LLM_HEDGE_MIN_DELAY_SECONDS,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_CIRCUIT_FAILURE_THRESHOLD,
+    LLM_CIRCUIT_OPEN_SECONDS,
+)
+from app.metrics import (
+    LLM_ATTEMPTS,
+    LLM_RETRIES,
+    LLM_HEDGES,
+    LLM_FALLBACKS,
+    LLM_CIRCUIT_REJECTIONS,
+    LLM_CIRCUIT_OPEN,
+    LLM_ATTEMPT_SECONDS,
+)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RATE_LIMITED_STATUS_CODE = 429
+FIRST_CHUNK_MIN_SECONDS = 1.0 # Left for a stream's first chunk even when opening it used up the attempt timeout
+
+
+# --- Custom Exceptions ---
+class SchedulerError(Exception):
+    """Base class for failures raised by the scheduler itself rather than by the upstream API."""
+    pass
+
+class DeadlineExceededError(SchedulerError):
+    """The analysis ran out of time before the model answered."""
+    pass
+
+class CircuitOpenError(SchedulerError):
+    """Upstream is degraded; calls fail fast until the circuit half-opens."""
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Model {model} is temporarily unavailable (circuit open).")
+        self.model = model
+        self.retry_after = retry_after
+
+class AttemptTimeoutError(SchedulerError):
+    """One attempt exceeded LLM_ATTEMPT_TIMEOUT_SECONDS; retryable."""
+    pass
+# ----------------------
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    # The SDK is imported lazily (see app.client_pool); until it is, no exception can be one of its APIErrors
+    genai_errors = sys.modules.get("google.genai.errors")
+    return getattr(exc, "code", None) if genai_errors is not None and isinstance(exc, genai_errors.APIError) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    return (status_code(exc) in RETRYABLE_STATUS_CODES
+            or isinstance(exc, (AttemptTimeoutError, httpx.TransportError)))
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None # HTTP-date form; fall back to our own backoff
+
+
+async def _next_or_none(iterator: AsyncIterator[Any]) -> Any:
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+class Deadline:
+    """Absolute time budget shared by all model calls of one analysis."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+        self.fallback_used = False # Lets callers avoid caching results from the fallback model
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open (fail fast) -> half-open (one probe) -> closed."""
+
+    def __init__(self, failure_threshold: int, open_seconds: float, probe_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.probe_timeout = probe_timeout # A probe that never reports back frees the slot after this
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at: Optional[float] = None
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if now - self.opened_at < self.open_seconds:
+                return False
+            self.state = "half_open"
+            self.probe_started_at = None
+        if self.probe_started_at is None or now - self.probe_started_at > self.probe_timeout:
+            self.probe_started_at = now
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        return max(1.0, self.open_seconds - (time.monotonic() - self.opened_at))
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.probe_started_at = None
+
+    def release_probe(self) -> None:
+        """The probe ended without saying anything about upstream health (a rate limit, a bad request, a cancel)."""
+        self.probe_started_at = None
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+                print(f"Circuit opened after {self.consecutive_failures} consecutive upstream failures.")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.probe_started_at = None
+
+
+@dataclass
+class SchedulerConfig:
+    primary_model: str = GEMINI_MODEL_NAME
+    fallback_model: str = GEMINI_FALLBACK_MODEL_NAME
+    attempt_timeout_seconds: float = LLM_ATTEMPT_TIMEOUT_SECONDS
+    max_retries: int = LLM_MAX_RETRIES
+    retry_base_delay_seconds: float = LLM_RETRY_BASE_DELAY_SECONDS
+    retry_max_delay_seconds: float = LLM_RETRY_MAX_DELAY_SECONDS
+    hedge_enabled: bool = LLM_HEDGE_ENABLED
+    hedge_quantile: float = LLM_HEDGE_QUANTILE
+    hedge_min_delay_seconds: float = LLM_HEDGE_MIN_DELAY_SECONDS
+    hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES
+    circuit_failure_threshold: int = LLM_CIRCUIT_FAILURE_THRESHOLD
+    circuit_open_seconds: float = LLM_CIRCUIT_OPEN_SECONDS
+
+
+@dataclass
+class _ModelState:
+    breaker: CircuitBreaker
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=200)) # Recent successful attempts
+
+
+class LLMScheduler:
+    """Runs model calls under a Deadline with retries, hedging, circuit breaking and fallback."""
+
+    def __init__(self, call_slot: Callable[..., Any], config: Optional[SchedulerConfig] = None):
+        self.config = config or SchedulerConfig()
+        self._call_slot = call_slot # e.g. GenAIClientPool.call_slot; must accept timeout=
+        self._models: Dict[str, _ModelState] = {}
+
+    def _state(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            cfg = self.config
+            state = self._models[model] = _ModelState(
+                CircuitBreaker(cfg.circuit_failure_threshold, cfg.circuit_open_seconds, cfg.attempt_timeout_seconds)
+            )
+        return state
+
+    def _candidate_models(self) -> List[str]:
+        models = [self.config.primary_model]
+        if self.config.fallback_model and self.config.fallback_model != self.config.primary_model:
+            models.append(self.config.fallback_model)
+        return models
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Recent latency quantile for model, or None if hedging is off or there is too little data."""
+        cfg = self.config
+        latencies = self._state(model).latencies
+        if not cfg.hedge_enabled or len(latencies) < cfg.hedge_min_samples:
+            return None
+        ordered = sorted(latencies)
+        quantile = ordered[min(len(ordered) - 1, int(cfg.hedge_quantile * len(ordered)))]
+        return max(cfg.hedge_min_delay_seconds, quantile)
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        cfg = self.config
+        ceiling = min(cfg.retry_max_delay_seconds, cfg.retry_base_delay_seconds * (2 ** attempt))
+        delay = random.uniform(0, ceiling) # Full jitter spreads retries from concurrent requests
+        retry_after = retry_after_seconds(exc)
+        return max(delay, min(retry_after, cfg.retry_max_delay_seconds)) if retry_after is not None else delay
+
+    def _record_failure(self, model: str, exc: BaseException) -> None:
+        retryable = is_retryable(exc)
+        outcome = "timeout" if isinstance(exc, AttemptTimeoutError) else ("retryable_error" if retryable else "error")
+        LLM_ATTEMPTS.inc(model=model, outcome=outcome)
+        # Only upstream health counts: not rate limits (per-key quota) and not request errors (bad key, 400s)
+        breaker = self._state(model).breaker
+        if retryable and status_code(exc) != RATE_LIMITED_STATUS_CODE:
+            breaker.record_failure()
+            LLM_CIRCUIT_OPEN.set(int(breaker.state != "closed"), model=model)
+        else:
+            breaker.release_probe()
+
+    def _record_success(self, model: str, latency: float) -> None:
+        state = self._state(model)
+        state.breaker.record_success()
+        LLM_CIRCUIT_OPEN.set(0, model=model)
+        state.latencies.append(latency)
+        LLM_ATTEMPTS.inc(model=model, outcome="success")
+        LLM_ATTEMPT_SECONDS.observe(latency, model=model)
+
+    def _admit(self, model: str, deadline: Deadline) -> Optional[BaseException]:
+        """Returns the error to remember if model can't be called now, else None (and notes the model as used)."""
+        breaker = self._state(model).breaker
+        if not breaker.allow():
+            LLM_CIRCUIT_REJECTIONS.inc(model=model)
+            return CircuitOpenError(model, breaker.retry_after())
+        if model != self.config.primary_model:
+            LLM_FALLBACKS.inc(model=model)
+            print(f"Falling back to model {model}.")
+            deadline.fallback_used = True
+        return None
+
+    async def _wait_before_retry(self, model: str, attempt: int, exc: BaseException, deadline: Deadline) -> bool:
+        """Sleeps before the next attempt; False if no retry should be made on this model."""
+        if not is_retryable(exc) or attempt >= self.config.max_retries:
+            return False
+        delay = self._backoff(attempt, exc)
+        if delay >= deadline.remaining():
+            return False
+        LLM_RETRIES.inc(model=model)
+        print(f"Retrying model call after {type(exc).__name__} (attempt {attempt + 2}, in {delay:.2f}s).")
+        await asyncio.sleep(delay)
+        return self._state(model).breaker.allow()
+
+    async def _attempt(self, operation: Callable[[str], Awaitable[Any]], model: str, deadline: Deadline) -> Any:
+        try:
+            async with self._call_slot(timeout=deadline.remaining()):
+                remaining = deadline.remaining()
+                timeout = min(remaining, self.config.attempt_timeout_seconds)
+                started = time.monotonic()
+                try:
+                    result = await asyncio.wait_for(operation(model), timeout)
+                except asyncio.TimeoutError:
+                    if timeout >= remaining:
+                        raise DeadlineExceededError("The analysis deadline passed while waiting for the model.") from None
+                    raise AttemptTimeoutError(f"Model call exceeded {timeout:g}s.") from None
+        except asyncio.TimeoutError: # Only slot acquisition can still raise it here
+            raise DeadlineExceededError("Timed out waiting for a free model call slot.") from None
+        self._record_success(model, time.monotonic() - started)
+        return result
+
+    async def _hedged_attempt(self, operation: Callable[[str], Awaitable[Any]], model: str, deadline: Deadline) -> Any:
+        delay = self.hedge_delay(model)
+        primary = asyncio.ensure_future(self._attempt(operation, model, deadline))
+        if delay is None or delay >= deadline.remaining():
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(self._attempt(operation, model, deadline))
+        pending = {primary, hedge}
+        first_error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        LLM_HEDGES.inc(model=model, winner="hedge" if task is hedge else "primary")
+                        return task.result()
+                    first_error = first_error or task.exception()
+            LLM_HEDGES.inc(model=model, winner="none")
+            raise first_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, operation: Callable[[str], Awaitable[Any]], deadline: Deadline) -> Any:
+        """
+        Runs operation(model_name) until it succeeds, a non-retryable error occurs,
+        or the deadline/retries/models are exhausted; raises the last error.
+        """
+        last_error: Optional[BaseException] = None
+        for model in self._candidate_models():
+            admission_error = self._admit(model, deadline)
+            if admission_error is not None:
+                last_error = last_error or admission_error
+                continue
+            attempt = 0
+            try:
+                while True:
+                    try:
+                        return await self._hedged_attempt(operation, model, deadline)
+                    except SchedulerError as e:
+                        if not isinstance(e, AttemptTimeoutError):
+                            raise
+                        self._record_failure(model, e)
+                        last_error = e
+                    except Exception as e:
+                        self._record_failure(model, e)
+                        if not is_retryable(e):
+                            raise
+                        last_error = e
+                    if not await self._wait_before_retry(model, attempt, last_error, deadline):
+                        break
+                    attempt += 1
+            finally:
+                # Whatever ended the calls on this model, a half-open probe must not keep the slot until it times out
+                self._state(model).breaker.release_probe()
+        raise last_error
+
+    async def stream(self, open_stream: Callable[[str], Awaitable[AsyncIterator[Any]]],
+                     deadline: Deadline) -> AsyncIterator[Any]:
+        """
+        Streaming variant of call(): open_stream(model_name) returns an async
+        iterator of chunks. Retries and fallback apply until the first chunk.
+        """
+        last_error: Optional[BaseException] = None
+        for model in self._candidate_models():
+            admission_error = self._admit(model, deadline)
+            if admission_error is not None:
+                last_error = last_error or admission_error
+                continue
+            attempt = 0
+            try:
+                while True:
+                    try:
+                        async with self._call_slot(timeout=deadline.remaining()):
+                            remaining = deadline.remaining()
+                            timeout = min(remaining, self.config.attempt_timeout_seconds)
+                            started = time.monotonic()
+                            try:
+                                iterator = (await asyncio.wait_for(open_stream(model), timeout)).__aiter__()
+                                first_chunk_timeout = min(deadline.remaining(), max(
+                                    FIRST_CHUNK_MIN_SECONDS, timeout - (time.monotonic() - started)))
+                                first = await asyncio.wait_for(_next_or_none(iterator), first_chunk_timeout)
+                            except asyncio.TimeoutError:
+                                if timeout >= remaining or deadline.remaining() <= 0:
+                                    raise DeadlineExceededError("The analysis deadline passed while waiting for the model.") from None
+                                last_error = AttemptTimeoutError(f"Model stream produced nothing within {timeout:.0f}s.")
+                                self._record_failure(model, last_error)
+                            except Exception as e:
+                                self._record_failure(model, e)
+                                if not is_retryable(e):
+                                    raise
+                                last_error = e
+                            else:
+                                self._record_success(model, time.monotonic() - started)
+                                # Committed: chunks reach the client from here on, so there are no more retries
+                                while first is not None:
+                                    yield first
+                                    try:
+                                        first = await asyncio.wait_for(_next_or_none(iterator), deadline.remaining())
+                                    except asyncio.TimeoutError:
+                                        raise DeadlineExceededError("The analysis deadline passed while the model was streaming.") from None
+                                return
+                    except asyncio.TimeoutError: # Only slot acquisition can still raise it here
+                        raise DeadlineExceededError("Timed out waiting for a free model call slot.") from None
+                    if not await self._wait_before_retry(model, attempt, last_error, deadline):
+                        break
+                    attempt += 1
+            finally:
+                self._state(model).breaker.release_probe() # See call()
+        raise last_error
+
+    def snapshot_stats(self) -> dict:
+        """Breaker states and recent latency quantiles per model (no request data)."""
+        stats = {}
+        for model, state in self._models.items():
+            ordered = sorted(state.latencies)
+            stats[model] = {
+                "circuit_state": state.breaker.state,
+                "consecutive_failures": state.breaker.consecutive_failures,
+                "times_opened": state.breaker.times_opened,
+                "recent_p50_seconds": round(ordered[len(ordered) // 2], 3) if ordered else None,
+                "hedge_delay_seconds": self.hedge_delay(model),
+            }
+        return stats
@@ -1,23 +1,83 @@
 # app/main.py
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, APIRouter # Added APIRouter
-from fastapi.middleware.cors import CORSMiddleware
-import os
-import io # Required for io.BytesIO with docx
-from fastapi.staticfiles import StaticFiles
+from app.startup import startup_report, warm_up # First, so the import phases below are timed
 
-try:
-    from docx import Document
-    DOCX_SUPPORTED = True
-except ImportError:
-    DOCX_SUPPORTED = False
-    print("WARNING: python-docx not installed. .docx file support is disabled.")
-    print("Install it with: pip install python-docx")
+with startup_report.phase("import_framework"):
+    from fastapi import FastAPI, UploadFile, File, HTTPException, Form, APIRouter, Query, Request # Added APIRouter
+    from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+    from starlette.background import BackgroundTask
+    from fastapi.middleware.cors import CORSMiddleware
+import os
+import math
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
 # Import the analysis function and custom error 
-from app.analysis_module import run_wise, AnalysisError 
+with startup_report.phase("import_app"): # Includes init_knowledge
+    from app.analysis_module import run_wise, stream_wise, render_result, AnalysisError, UpstreamError, prompt_template
+    from app.streaming import format_event
+    from app.extraction import extract_text_async, ExtractionError, UnsupportedFileTypeError
+    from app import extraction
+    from app.compression import GZipJSONMiddleware
+    from app.serialization import FastJSONResponse, JSONBytesResponse
+    from app.static_files import PrecompressedStaticFiles
+    from app.uploads import UploadSizeLimitMiddleware, read_upload_capped, iter_upload_capped
+    from app.constants import (
+        MAX_UPLOAD_BYTES, MULTIPART_OVERHEAD_BYTES, METRICS_ENABLED, BATCH_MAX_TOTAL_BYTES, CHAT_EXPORT_MAX_UPLOAD_BYTES,
+        API_GZIP_ENABLED, STARTUP_WARM_UP,
+    )
+    from app.result_cache import result_cache
+    from app.incremental import paragraph_store
+    from app.knowledge import knowledge_base, payload_response
+    from app.client_pool import client_pool, hash_api_key
+    from app.admission import admission_controller, AdmissionRejectedError
+    from app.batch_jobs import (
+        batch_manager, expand_uploads, upload_byte_limit, BatchInput, BatchInputError, ITEM_SUCCEEDED,
+    )
+    from app.conversations import conversation_analyzer
+    from app.metrics import registry, stage, RequestTimingMiddleware, UPLOAD_BYTES, INPUT_CHARS
+
+static_app: Optional[PrecompressedStaticFiles] = None # Mounted at the end of this module when the UI build exists
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Accepts requests at once; the deferred imports and indexing then run in the background (see app.startup)."""
+    startup_report.milestone("ready")
+    warm_up_task = None
+    if STARTUP_WARM_UP:
+        steps = [("extraction_pool", extraction.warm_up), ("genai_sdk", client_pool.warm_up)]
+        if static_app is not None:
+            steps.append(("static_files", static_app.warm_up))
+        warm_up_task = asyncio.create_task(warm_up(steps))
+    yield
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+
 
 # Create FastAPI app instance
-app = FastAPI(title="GenAI Analysis API")
+app = FastAPI(title="GenAI Analysis API", lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Reject oversized uploads before the multipart body is parsed.
+# Added before CORS so CORS stays outermost and 413 responses remain readable by the browser.
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={
+        "/api/analyze": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/api/analyze/stream": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/api/batch": BATCH_MAX_TOTAL_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/api/analyze/conversations": CHAT_EXPORT_MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+    },
+)
+
+# Per-request stage timings, Server-Timing header and request latency metrics.
+# Outside the upload limit so rejected uploads are measured too; inside CORS like the limit.
+app.add_middleware(RequestTimingMiddleware)
+
+# Gzips complete JSON responses; streamed events pass through uncompressed so they aren't held back.
+# Static files are negotiated and precompressed by PrecompressedStaticFiles instead.
+if API_GZIP_ENABLED:
+    app.add_middleware(GZipJSONMiddleware)
 
 # --- CORS Configuration ---
 # Define the list of origins that are allowed to make requests.
@@ -41,54 +101,121 @@ api_router = APIRouter()
 
 @api_router.get("/health", tags=["API Health"]) # Added to router
 async def health_check():
+    startup_report.milestone("first_health")
     return {"message": "API is running"}
 
+@api_router.get("/api/startup", tags=["API Health"])
+async def startup_stats():
+    """Cold-start report: import and init phase durations, and seconds from process start to each milestone."""
+    return startup_report.snapshot()
+
+@api_router.get("/api/cache/stats", tags=["API Health"])
+async def cache_stats():
+    """Hit/miss/eviction counters of the analysis result cache. Contains no content or keys."""
+    return {**result_cache.snapshot_stats(), "prompt_version": prompt_template.version}
+
+if METRICS_ENABLED:
+    registry.add_stats_collector("wise_result_cache", result_cache.snapshot_stats,
+                                 counter_keys=("hits", "disk_hits", "misses", "coalesced", "evictions", "expirations"))
+    registry.add_stats_collector("wise_genai_client_pool", client_pool.snapshot_stats,
+                                 counter_keys=("created", "reused", "evicted"))
+    registry.add_stats_collector("wise_admission", admission_controller.snapshot_stats,
+                                 counter_keys=("admitted", "waited", "rejected_key", "rejected_capacity", "timed_out"))
+    registry.add_stats_collector("wise_incremental", paragraph_store.snapshot_stats,
+                                 counter_keys=("recorded", "incremental", "reused_paragraphs", "analyzed_paragraphs"))
+    registry.add_stats_collector("wise_batch", batch_manager.snapshot_stats,
+                                 counter_keys=("jobs_submitted", "items_succeeded", "items_failed"))
+    registry.add_stats_collector("wise_conversations", conversation_analyzer.snapshot_stats,
+                                 counter_keys=("exports", "messages", "windows", "failed_windows"))
+    registry.add_stats_collector("wise_startup", startup_report.snapshot_stats)
+
+    @api_router.get("/metrics", tags=["API Health"], response_class=PlainTextResponse)
+    async def metrics():
+        """Prometheus metrics: stage latencies, input sizes, tactic counts, errors by class, cache counters."""
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# --- Tactic Knowledge ---
+@api_router.get("/api/tactics", tags=["Knowledge"])
+async def list_tactics(request: Request, category: Optional[str] = Query(None)):
+    """Compact index of the taxonomy (id, name, category, description), optionally for one category."""
+    payload = knowledge_base.index_payload(category)
+    if payload is None:
+        raise HTTPException(status_code=404, detail=f"Unknown tactic category: {category}")
+    return payload_response(payload, request.headers)
+
+@api_router.get("/api/tactics/{tactic_id}", tags=["Knowledge"])
+async def tactic_detail(tactic_id: int, request: Request):
+    """Everything known about one tactic: taxonomy entry, intent spectrum, scenarios, resistance strategies, citations."""
+    payload = knowledge_base.detail_payload(tactic_id)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Tactic not found.")
+    return payload_response(payload, request.headers)
+# --- End Tactic Knowledge ---
+
+async def _extract_upload_text(file: UploadFile) -> str:
+    """Reads the uploaded file (size-capped) and extracts its text off the event loop, raising HTTPException on failure."""
+    filename = file.filename or ""
+    content_type = file.content_type or ""
+
+    with stage("upload_read"):
+        content_bytes = await read_upload_capped(file, MAX_UPLOAD_BYTES)
+    UPLOAD_BYTES.observe(len(content_bytes))
+    try:
+        with stage("extraction"):
+            content_str = await extract_text_async(content_bytes, filename, content_type)
+    except UnsupportedFileTypeError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ExtractionError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if not content_str.strip():
+         raise HTTPException(status_code=422, detail="Extracted text content is empty.")
+    INPUT_CHARS.observe(len(content_str))
+    return content_str
+
+
+def _retry_after_headers(retry_after: Optional[float]) -> Optional[dict]:
+    return {"Retry-After": str(math.ceil(retry_after))} if retry_after else None
+
+
+def _admission_http_error(are: AdmissionRejectedError) -> HTTPException:
+    return HTTPException(status_code=are.status_code, detail=str(are), headers=_retry_after_headers(are.retry_after))
+
+
+def _analysis_http_error(ae: AnalysisError) -> HTTPException:
+    if isinstance(ae, UpstreamError):
+        return HTTPException(status_code=ae.status_code, detail=f"Analysis failed: {ae}",
+                             headers=_retry_after_headers(ae.retry_after))
+    if "API key is invalid" in str(ae) or "Failed to initialize GenAI client with the provided API key" in str(ae):
+        return HTTPException(status_code=401, detail=f"Analysis failed due to an API key issue: {ae}")
+    return HTTPException(status_code=500, detail=f"Analysis failed: {ae}")
+
+
 @api_router.post("/api/analyze", tags=["Analysis"]) # Added to router
 async def analyze_text(
     file: UploadFile = File(...),
-    user_api_key: str = Form(...)
+    user_api_key: str = Form(...),
+    view: str = Query("full", pattern="^(full|compact)$")
 ):
-    content_str = ""
-    filename = file.filename or ""
-    content_type = file.content_type or ""
-
-    print(f"Received file: {filename}, Content-Type: {content_type}")
+    """
+    Analyses the uploaded file. ?view=compact omits detailed_report_sections and
+    each tactic's name and category (look them up by id in GET /api/tactics).
+    """
+    print(f"Received file: {file.filename or ''}, Content-Type: {file.content_type or ''}")
     if not user_api_key or user_api_key.strip() == "":
         raise HTTPException(status_code=400, detail="API key is missing or empty.")
     
     try:
-        content_bytes = await file.read()
-
-        if content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document" or filename.endswith(".docx"):
-            if not DOCX_SUPPORTED:
-                raise HTTPException(status_code=501, detail=".docx processing is not enabled (python-docx library missing)")
-            try:
-                document = Document(io.BytesIO(content_bytes))
-                content_str = "\n".join([para.text for para in document.paragraphs])
-            except Exception as e:
-                raise HTTPException(status_code=422, detail=f"Failed to parse .docx file: {e}")
-        elif content_type.startswith("text/") or filename.endswith(".txt") or filename.endswith(".md"):
-            try:
-                content_str = content_bytes.decode('utf-8')
-            except UnicodeDecodeError as e:
-                raise HTTPException(status_code=422, detail=f"Failed to decode file as UTF-8: {e}")
-        else:
-            # Fallback attempt to decode as UTF-8 for unspecified text types
-            try:
-                content_str = content_bytes.decode('utf-8')
-            except UnicodeDecodeError: # Keep original error for truly unsupported
-                raise HTTPException(status_code=415, detail=f"Unsupported file type: {filename} ({content_type}). Please upload .txt, .md, or .docx.")
-
-        if not content_str.strip():
-             raise HTTPException(status_code=422, detail="Extracted text content is empty.")
-
-        analysis_result = await run_wise(content_str, user_api_key) 
-        return analysis_result
+        # Admitted before extraction so a full server rejects without spending CPU on the file
+        async with admission_controller.admit(hash_api_key(user_api_key)):
+            content_str = await _extract_upload_text(file)
+            analysis_result = await run_wise(content_str, user_api_key) 
+        return JSONBytesResponse(render_result(analysis_result, compact=view == "compact"))
 
+    except AdmissionRejectedError as are:
+        raise _admission_http_error(are)
     except AnalysisError as ae:
-        if "API key is invalid" in str(ae) or "Failed to initialize GenAI client with the provided API key" in str(ae):
-            raise HTTPException(status_code=401, detail=f"Analysis failed due to an API key issue: {ae}")
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {ae}")
+        raise _analysis_http_error(ae)
     except HTTPException as http_exc:
         # Re-raise HTTPException directly to preserve status code and detail
         raise http_exc
@@ -99,18 +226,199 @@ async def analyze_text(
     finally:
         await file.close()
 
+@api_router.post("/api/analyze/stream", tags=["Analysis"])
+async def analyze_text_stream(
+    file: UploadFile = File(...),
+    user_api_key: str = Form(...),
+    stream_format: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$")
+):
+    """
+    Streaming variant of /api/analyze. Emits 'metadata', one 'tactic' event per
+    tactic as it is generated, 'manipulationByCategory' and the full 'result'
+    as NDJSON lines (default) or server-sent events (?format=sse).
+    Failures after the stream has started are reported as an 'error' event.
+    """
+    print(f"Received file for streaming analysis: {file.filename or ''}, Content-Type: {file.content_type or ''}")
+    if not user_api_key or user_api_key.strip() == "":
+        raise HTTPException(status_code=400, detail="API key is missing or empty.")
+
+    try:
+        ticket = await admission_controller.acquire(hash_api_key(user_api_key))
+    except AdmissionRejectedError as are:
+        await file.close()
+        raise _admission_http_error(are)
+    try:
+        content_str = await _extract_upload_text(file)
+    except BaseException:
+        ticket.release()
+        raise
+    finally:
+        await file.close()
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+
+    async def event_stream():
+        try:
+            async for event, data in stream_wise(content_str, user_api_key):
+                if event == "result":
+                    data = render_result(data)
+                yield format_event(event, data, media_type)
+        except AnalysisError as ae:
+            http_exc = _analysis_http_error(ae)
+            yield format_event("error", {"status": http_exc.status_code, "detail": http_exc.detail}, media_type)
+        except Exception as e:
+            print(f"Unexpected server error during streaming analysis: {e}")
+            yield format_event("error", {"status": 500, "detail": f"Internal server error processing file: {e}"}, media_type)
+        finally:
+            ticket.release()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(ticket.release), # In case the stream is never iterated
+    )
+
+@api_router.post("/api/analyze/conversations", tags=["Analysis"])
+async def analyze_conversations(
+    file: UploadFile = File(...),
+    user_api_key: str = Form(...)
+):
+    """
+    Analyses a Telegram JSON export, WhatsApp chat export (.txt) or mbox mailbox.
+    The file is parsed as it is read and its messages are analysed in windows per
+    conversation. Returns per-conversation results (with each tactic attributed
+    to a message) and an aggregate manipulationByCategory and intentBreakdown.
+    """
+    print(f"Received chat export: {file.filename or ''}, Content-Type: {file.content_type or ''}")
+    if not user_api_key or user_api_key.strip() == "":
+        raise HTTPException(status_code=400, detail="API key is missing or empty.")
+
+    try:
+        # Each window is admitted on its own, since several are analysed at once
+        with stage("conversation_analysis"):
+            return await conversation_analyzer.analyze(
+                iter_upload_capped(file, CHAT_EXPORT_MAX_UPLOAD_BYTES), file.filename or "", user_api_key
+            )
+    except AdmissionRejectedError as are:
+        raise _admission_http_error(are)
+    except UnsupportedFileTypeError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ExtractionError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except AnalysisError as ae:
+        raise _analysis_http_error(ae)
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        print(f"Unexpected server error: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error processing file: {e}")
+    finally:
+        await file.close()
+
+# --- Batch Jobs ---
+def _batch_links(job_id: str) -> dict:
+    return {
+        "status": f"/api/batch/{job_id}",
+        "events": f"/api/batch/{job_id}/events",
+        "itemResult": f"/api/batch/{job_id}/items/{{index}}",
+    }
+
+@api_router.post("/api/batch", tags=["Batch Analysis"], status_code=202)
+async def submit_batch(
+    files: List[UploadFile] = File(...),
+    user_api_key: str = Form(...)
+):
+    """
+    Starts a background job analysing each uploaded file, or each .txt/.md/.docx
+    document inside uploaded .zip archives. Returns the job id at once; poll
+    the status link or stream the events link for per-item progress and results.
+    """
+    print(f"Received batch of {len(files)} file(s)")
+    if not user_api_key or user_api_key.strip() == "":
+        raise HTTPException(status_code=400, detail="API key is missing or empty.")
+
+    uploads = []
+    try:
+        with stage("upload_read"):
+            for file in files:
+                content_bytes = await read_upload_capped(file, upload_byte_limit(file.filename or "", file.content_type or ""))
+                UPLOAD_BYTES.observe(len(content_bytes))
+                uploads.append(BatchInput(file.filename or "", content_bytes, file.content_type or ""))
+    finally:
+        for file in files:
+            await file.close()
+    try:
+        inputs, skipped = await asyncio.to_thread(expand_uploads, uploads)
+    except BatchInputError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    job = await batch_manager.submit(inputs, skipped, user_api_key)
+    return JSONResponse(status_code=202, content={**job, "links": _batch_links(job["jobId"])})
+
+@api_router.get("/api/batch/{job_id}", tags=["Batch Analysis"])
+async def batch_status(job_id: str):
+    """Job status with per-item state and errors. Results are fetched per item."""
+    job = await batch_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found or expired.")
+    return {**job, "links": _batch_links(job_id)}
+
+@api_router.get("/api/batch/{job_id}/items/{index}", tags=["Batch Analysis"])
+async def batch_item_result(job_id: str, index: int, view: str = Query("full", pattern="^(full|compact)$")):
+    """One item's analysis result; ?view=compact as for /api/analyze."""
+    job = await batch_manager.get(job_id)
+    if job is None or not 0 <= index < len(job["items"]):
+        raise HTTPException(status_code=404, detail="Batch job or item not found or expired.")
+    item = job["items"][index]
+    if item["status"] != ITEM_SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Item is {item['status']}; no result available.")
+    result = await batch_manager.get_result(job_id, index)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Batch job or item not found or expired.")
+    try:
+        return JSONBytesResponse(render_result(result, compact=view == "compact"))
+    except AnalysisError as ae:
+        raise _analysis_http_error(ae)
+
+@api_router.get("/api/batch/{job_id}/events", tags=["Batch Analysis"])
+async def batch_events(
+    job_id: str,
+    stream_format: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$")
+):
+    """
+    Progress stream: 'job' (current status), then 'item' (with its result) and
+    'progress' as each item finishes, and 'done'. Already finished items are
+    replayed first, so the stream can be reopened at any time.
+    """
+    if await batch_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Batch job not found or expired.")
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+
+    async def event_stream():
+        async for event, data in batch_manager.events(job_id):
+            yield format_event(event, data, media_type)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+# --- End Batch Jobs ---
+
 # Include the API router in the main application
 app.include_router(api_router)
 # --- End API Router Setup ---
 
 # --- Static Files Mounting (after API router) ---
-# Serves React frontend.
+# Serves React frontend: precompressed, with strong ETags and immutable caching of hashed bundles (see app.static_files).
 # Ensure 'static_dir' points to React app's build folder (e.g., 'build' or 'dist')
 # The user prompt specified "/static" inside WISE_backend
 static_dir_name = "static" 
 static_dir_path = os.path.join(os.path.dirname(__file__), static_dir_name)
 
 if os.path.exists(static_dir_path):
-    app.mount("/", StaticFiles(directory=static_dir_path, html=True), name="static_frontend")
+    static_app = PrecompressedStaticFiles(directory=static_dir_path, html=True)
+    app.mount("/", static_app, name="static_frontend")
 else:
     print(f"Warning: Static directory '{static_dir_path}' not found. Frontend will not be served by FastAPI.")
\ No newline at end of file
@@ -0,0 +1,288 @@
+# WISE_backend/app/metrics.py
+
+"""
+Per-stage timing and Prometheus metrics.
+
+stage("name") times one step of a request (upload read, extraction, model
+call, validation, ...), records it in a histogram and in the current
+request's timing list, and counts failures by exception class. The
+RequestTimingMiddleware starts that list for each request, adds a
+Server-Timing header and records overall request latency. render() produces
+the Prometheus text exposition format for GET /metrics.
+
+Labels are limited to fixed stage names, route templates, status codes,
+strategies and exception class names, so no document content, filenames or
+API keys can ever end up in a metric, header or log line.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.constants import SERVER_TIMING_ENABLED, REQUEST_TIMING_LOG_ENABLED
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+SIZE_BUCKETS = (1_000, 4_000, 16_000, 64_000, 256_000, 1_000_000, 4_000_000, 16_000_000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0.0)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def collect(self) -> List[str]:
+        lines = super().collect()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {} # key -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1 # Stored non-cumulatively; made cumulative when rendered
+                    break
+            series[-2] += 1
+            series[-1] += value
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(tuple(str(labels.get(name, "")) for name in self.labelnames))
+        return int(series[-2]) if series else 0
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, bucket_count in zip(self.buckets, series):
+                    cumulative += bucket_count
+                    le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{le} {_format_value(cumulative)}")
+                inf = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds the metrics plus collectors that read stats from other components at scrape time."""
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_stats_collector(self, prefix: str, snapshot: Callable[[], dict], counter_keys: Iterable[str] = ()) -> None:
+        """Exposes the numeric fields of a snapshot_stats()-style dict, as counters for counter_keys and gauges otherwise."""
+        counter_keys = set(counter_keys)
+
+        def collect() -> Iterable[str]:
+            for key, value in snapshot().items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                if key in counter_keys:
+                    name, kind = f"{prefix}_{key}_total", "counter"
+                else:
+                    name, kind = f"{prefix}_{key}", "gauge"
+                yield f"# TYPE {name} {kind}"
+                yield f"{name} {_format_value(value)}"
+
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for collect in self._collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+# --- Metrics ---
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "wise_stage_duration_seconds", "Time spent in each processing stage.", ("stage",)))
+STAGE_ERRORS = registry.register(Counter(
+    "wise_stage_errors_total", "Failed stages by exception class.", ("stage", "error_class")))
+REQUEST_SECONDS = registry.register(Histogram(
+    "wise_http_request_duration_seconds", "HTTP request latency, including streamed bodies.",
+    ("method", "route", "status")))
+UPLOAD_BYTES = registry.register(Histogram(
+    "wise_upload_bytes", "Size of uploaded files in bytes.", buckets=SIZE_BUCKETS))
+INPUT_CHARS = registry.register(Histogram(
+    "wise_input_chars", "Length of the extracted text in characters.", buckets=SIZE_BUCKETS))
+TACTIC_COUNT = registry.register(Histogram(
+    "wise_tactics_per_analysis", "Tactics found per computed (non-cached) analysis.", buckets=COUNT_BUCKETS))
+ANALYSIS_STRATEGY = registry.register(Counter(
+    "wise_analysis_strategy_total", "Computed analyses by strategy.", ("strategy",)))
+LLM_ATTEMPTS = registry.register(Counter(
+    "wise_llm_attempts_total", "Model call attempts by model and outcome.", ("model", "outcome")))
+LLM_RETRIES = registry.register(Counter(
+    "wise_llm_retries_total", "Model calls retried after a retryable error.", ("model",)))
+LLM_HEDGES = registry.register(Counter(
+    "wise_llm_hedges_total", "Hedged second requests, by which request won.", ("model", "winner")))
+LLM_FALLBACKS = registry.register(Counter(
+    "wise_llm_fallbacks_total", "Calls moved to the fallback model.", ("model",)))
+LLM_CIRCUIT_REJECTIONS = registry.register(Counter(
+    "wise_llm_circuit_rejections_total", "Calls failed fast because the model's circuit was open.", ("model",)))
+LLM_CIRCUIT_OPEN = registry.register(Gauge(
+    "wise_llm_circuit_open", "1 while the model's circuit breaker is open or half-open, else 0.", ("model",)))
+LLM_ATTEMPT_SECONDS = registry.register(Histogram(
+    "wise_llm_attempt_duration_seconds", "Latency of successful model call attempts (to first chunk when streaming).",
+    ("model",)))
+ADMISSION_WAIT_SECONDS = registry.register(Histogram(
+    "wise_admission_wait_seconds", "Time queued requests waited before being admitted."))
+# -----------------
+
+
+# --- Per-request stage timings ---
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "wise_request_timings", default=None
+)
+
+
+def error_class(exc: BaseException) -> str:
+    """Class name of the underlying error (AnalysisError usually wraps the SDK's exception). Never the message."""
+    cause = exc.__cause__
+    # Process-pool errors carry a private _RemoteTraceback cause; the exception itself is the real one
+    if cause is not None and not type(cause).__name__.startswith("_"):
+        return type(cause).__name__
+    return type(exc).__name__
+
+
+@contextmanager
+def stage(name: str):
+    """Times a block as one processing stage. Works around sync code and awaits alike."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        STAGE_ERRORS.inc(stage=name, error_class=error_class(e))
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    """Sums repeated stages (e.g. one model_call per chunk) into one Server-Timing entry each."""
+    totals: Dict[str, List[float]] = {}
+    for name, elapsed in timings:
+        total = totals.setdefault(name, [0.0, 0])
+        total[0] += elapsed
+        total[1] += 1
+    return ", ".join(
+        f"{name};dur={total * 1000:.1f}" + (f';desc="x{count}"' if count > 1 else "")
+        for name, (total, count) in totals.items()
+    )
+
+
+class RequestTimingMiddleware:
+    """Pure ASGI middleware: collects stage timings per request, adds Server-Timing and records request latency."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def timing_send(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING_ENABLED and timings:
+                    # Streamed responses only include the stages that finished before the first byte
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", server_timing_header(timings))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timing_send)
+        finally:
+            _request_timings.reset(token)
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            # Route templates only; raw paths (static files, unknown URLs) would make label cardinality unbounded
+            route_label = getattr(route, "path", None) or "other"
+            REQUEST_SECONDS.observe(elapsed, method=scope.get("method", ""), route=route_label, status=str(status))
+            if REQUEST_TIMING_LOG_ENABLED and timings:
+                stages = " ".join(f"{name}={elapsed_stage * 1000:.1f}ms" for name, elapsed_stage in timings)
+                print(f"Request timings: {scope.get('method', '')} {route_label} {status} "
+                      f"total={elapsed * 1000:.1f}ms {stages}")
+# -----------------
@@ -16,6 +16,10 @@ class Metadata(BaseModel):
     tacticDensity: Optional[str] = Field(None, description="Density of tactics, e.g., 'High', 'Medium', 'Low'")
     input_data_description: Optional[str] = Field(None, description="Description of the input source")
 
+class FinalMetadata(Metadata):
+    # Stringified by the backend (see analysis_module.finalize_result), as the UI expects
+    confidenceScore: str = Field("", description="Confidence score (0-100) as a string, empty if not determined")
+
 class ExecutiveSummary(BaseModel):
     primary_intent: str = Field(..., description="Overall assessed intent")
     tactic_density: str = Field(..., description="Density of tactics")
@@ -45,6 +49,23 @@ class Tactic(BaseModel):
     resistanceStrategy: str = Field(..., description="How to recognize and resist the tactic")
     
 
+class QuoteSpan(BaseModel):
+    start: int = Field(..., description="Character offset where the quote starts in the analyzed text")
+    end: int = Field(..., description="Character offset just past the end of the quote")
+    matchScore: float = Field(..., description="1.0 for an exact (whitespace/punctuation-insensitive) match, lower for fuzzy matches")
+
+class LocatedTactic(Tactic):
+    # Added by the backend after the GenAI call; not part of the schema requested from the API
+    quoteSpan: Optional[QuoteSpan] = Field(None, description="Location of the quote in the source text, null if not found")
+
+class ReuseStats(BaseModel):
+    paragraphs: int = Field(..., description="Paragraphs in the submitted document")
+    reusedParagraphs: int = Field(..., description="Unchanged paragraphs whose earlier findings were reused")
+    analyzedParagraphs: int = Field(..., description="New or changed paragraphs sent to the model")
+    reusedFraction: float = Field(..., description="Share of the document's characters that was reused (0-1)")
+    reusedTactics: int = Field(..., description="Tactics carried over from the earlier analysis")
+    newTactics: int = Field(..., description="Tactics found in the changed paragraphs")
+
 class DetailedReportSections(BaseModel):
     confidence_levels_discussion: str = Field(...)
     context_handling: str = Field(...)
@@ -64,4 +85,8 @@ class AnalysisResultFromAPI(BaseModel):
 
 # Final structure returned BY the endpoint (includes calculated fields)
 class FinalAnalysisResult(AnalysisResultFromAPI):
-    manipulationByCategory: List[ManipulationCategory]
\ No newline at end of file
+    metadata: FinalMetadata
+    tactics: List[LocatedTactic]
+    manipulationByCategory: List[ManipulationCategory]
+    # Only set when an earlier version of the document was re-analyzed incrementally
+    reuse: Optional[ReuseStats] = None
\ No newline at end of file
@@ -0,0 +1,250 @@
+# WISE_backend/app/prescreen.py
+
+"""
+Local lexical pre-screen for manipulation tactics.
+
+A token-level multi-pattern index, built once at startup from a curated cue
+lexicon plus the example utterances in taxonomy_kb.json and (when available)
+the tactic learning material in tacticsData.json, finds candidate tactics per
+paragraph in milliseconds. The result is used to hint the model at likely tactics and,
+in "filter" mode, to skip the model call entirely for text with no cues or to
+send only the paragraphs that contain them.
+"""
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.chunking import compute_intent_breakdown
+
+# Curated cue phrases per taxonomy tactic id. Multi-word phrases are strong
+# signals; single words are weak ones and only flag a paragraph together with
+# another cue for the same tactic. Words common in ordinary prose ("threat",
+# "blame", "everybody") are left out. Phrases are matched case-insensitively
+# on whole tokens; a trailing '*' matches any word continuation.
+CUE_PHRASES: Dict[int, List[str]] = {
+    1: ["join us", "together we can", "brighter future", "the only way", "the only path", "be part of",
+        "transform your life", "a new dawn", "only we can", "we will restore"],
+    2: ["they stole", "stolen from us", "outrage*", "sick and tired", "fed up", "betray*", "how dare",
+        "rigged", "enough is enough"],
+    3: ["doomed", "catastroph*", "before it's too late", "before it is too late", "terrif*", "act now",
+        "can you afford to wait"],
+    4: ["everyone knows", "it is a fact", "it's a fact", "the truth is", "undeniabl*", "no doubt",
+        "without question", "make no mistake", "let's be clear"],
+    5: ["us versus them", "us vs them", "real americans", "people like us", "our people", "true patriots",
+        "enemies of", "not one of us", "our kind"],
+    6: ["so you're saying", "so you are saying", "they want to ban", "they want to take away",
+        "would have you believe", "they think we should"],
+    7: ["to blame for", "fault of", "because of them", "responsible for all"],
+    8: ["radical*", "extremist*", "corrupt*", "disgusting", "thugs", "monsters", "vermin", "woke"],
+    9: ["studies show", "research shows", "experts agree", "some say", "many people are saying",
+        "it has been proven"],
+    10: ["just like the", "reminiscent of", "no different from", "associated with", "in bed with",
+         "same people who"],
+    11: ["you're imagining", "you are imagining", "that never happened", "you're overreacting",
+         "you are overreacting", "too sensitive", "you're crazy", "i never said", "remembering it wrong",
+         "you're making things up"],
+    12: ["just asking questions", "can you prove", "show me the evidence", "i'm just curious",
+         "where is your source", "i'm only asking"],
+    13: ["right side of history", "any decent person", "shame on", "good people know",
+         "the moral choice", "morally bankrupt", "no reasonable person"],
+    14: ["one study", "a single study", "the only data", "just look at", "proves that all"],
+    15: ["either you", "you're either with us", "with us or against us", "there is no alternative",
+         "only two options", "only two choices", "if you're not with us"],
+    16: ["everyone is", "millions of people", "join the thousands", "join millions", "most people agree",
+         "left behind", "don't miss out"],
+    17: ["idiot*", "stupid", "liar*", "clown*", "moron*", "can't be trusted", "hypocrite*", "pathetic"],
+    18: ["experts say", "scientists agree", "doctors recommend", "according to experts",
+         "leading experts", "as a doctor", "trust the experts", "nine out of ten"],
+    19: ["what about", "the real issue is", "let's not forget", "the real question is",
+         "but more importantly"],
+    20: ["always been", "our ancestors", "time-honored", "time honoured", "for generations",
+         "the way it has always", "the way it's always"],
+    21: ["you're amazing", "you deserve", "so proud of you", "incredible people", "the greatest",
+         "nobody has ever seen"],
+}
+
+STRONG_CUE_WEIGHT = 2.0
+WEAK_CUE_WEIGHT = 1.0
+EXAMPLE_CUE_WEIGHT = 3.0
+MIN_CANDIDATE_SCORE = 2.0 # Per paragraph: one strong cue, or two weak ones for the same tactic
+MIN_HINT_SCORE = 3.0 # Per document, before the tactic is named in the prompt hint
+
+# Quoted utterances inside tacticsData.json examples, e.g. "... claims 'Act NOW before it's too late!'"
+_QUOTED_UTTERANCE_RE = re.compile(r"(?:^|\s)'(.{10,160}?)'(?=[\s.,;:!?)]|$)")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass
+class ParagraphScreen:
+    index: int
+    start: int
+    end: int
+    scores: Dict[int, float] = field(default_factory=dict)
+
+
+@dataclass
+class ScreenResult:
+    candidates: Dict[int, float] # tactic id -> summed score over the document
+    paragraphs: List[ParagraphScreen] # Only paragraphs with at least one candidate
+
+    @property
+    def candidate_ids(self) -> List[int]:
+        return sorted(self.candidates, key=lambda tactic_id: -self.candidates[tactic_id])
+
+    @property
+    def hint_ids(self) -> List[int]:
+        """The candidates with enough evidence to be suggested to the model."""
+        return [tactic_id for tactic_id in self.candidate_ids if self.candidates[tactic_id] >= MIN_HINT_SCORE]
+
+
+_TOKEN_RE = re.compile(r"[\w']+")
+
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower().replace("\u2019", "'"))
+
+
+@dataclass(frozen=True)
+class _Cue:
+    tactic_id: int
+    rest: Tuple[str, ...] # Tokens after the first one
+    prefix_last: bool # The last token only needs to be a prefix (trailing '*')
+    weight: float
+
+
+def _example_utterances(tactic_details: Iterable[dict]) -> Iterable[Tuple[int, str]]:
+    for detail in tactic_details:
+        spectrum = detail.get("intent_spectrum") or {}
+        for level in ("borderline", "blatant"): # Legitimate examples are not manipulation cues
+            example = (spectrum.get(level) or {}).get("example", "")
+            for utterance in _QUOTED_UTTERANCE_RE.findall(example):
+                for sentence in _SENTENCE_SPLIT_RE.split(utterance):
+                    yield detail.get("id"), sentence
+
+
+class PrescreenIndex:
+    """Precompiled cue index. Build once; screen() is cheap and thread-safe."""
+
+    def __init__(self, taxonomy: dict, tactic_details: Optional[List[dict]] = None):
+        self.tactic_names: Dict[int, str] = {
+            t["id"]: t.get("tactic_name", "") for t in taxonomy.get("tactics", []) if "id" in t
+        }
+        # Multi-pattern index: cues are bucketed by their first token (or by the stem of a
+        # single-word wildcard), so a pass over the text costs one dict lookup per token.
+        self._by_first: Dict[str, List[_Cue]] = defaultdict(list)
+        self._by_stem: Dict[str, List[_Cue]] = defaultdict(list)
+        self.cue_count = 0
+        for tactic_id, phrases in CUE_PHRASES.items():
+            for phrase in phrases:
+                tokens = _tokenize(phrase)
+                wildcard = phrase.endswith("*")
+                weight = STRONG_CUE_WEIGHT if len(tokens) > 1 else WEAK_CUE_WEIGHT
+                self._add_cue(tokens, _Cue(tactic_id, tuple(tokens[1:]), wildcard, weight))
+        examples = [(t["id"], t.get("example", "")) for t in taxonomy.get("tactics", []) if "id" in t]
+        examples.extend(_example_utterances(tactic_details or []))
+        for tactic_id, sentence in examples:
+            tokens = _tokenize(sentence)
+            if tactic_id in self.tactic_names and len(tokens) >= 4:
+                self._add_cue(tokens, _Cue(tactic_id, tuple(tokens[1:]), False, EXAMPLE_CUE_WEIGHT))
+        self._stem_lengths = sorted({len(stem) for stem in self._by_stem})
+
+    def _add_cue(self, tokens: List[str], cue: _Cue) -> None:
+        if cue.prefix_last and not cue.rest:
+            self._by_stem[tokens[0]].append(cue)
+        else:
+            self._by_first[tokens[0]].append(cue)
+        self.cue_count += 1
+
+    def _match_tokens(self, tokens: List[str]) -> Dict[int, float]:
+        scores: Dict[int, float] = defaultdict(float)
+        for i, token in enumerate(tokens):
+            matched = list(self._by_first.get(token, ()))
+            for length in self._stem_lengths:
+                if length > len(token):
+                    break
+                matched.extend(self._by_stem.get(token[:length], ()))
+            for cue in matched:
+                rest = cue.rest
+                if not rest:
+                    scores[cue.tactic_id] += cue.weight
+                    continue
+                following = tokens[i + 1:i + 1 + len(rest)]
+                if len(following) != len(rest):
+                    continue
+                if cue.prefix_last:
+                    if following[:-1] == list(rest[:-1]) and following[-1].startswith(rest[-1]):
+                        scores[cue.tactic_id] += cue.weight
+                elif tuple(following) == rest:
+                    scores[cue.tactic_id] += cue.weight
+        return scores
+
+    def screen(self, text: str) -> ScreenResult:
+        """Scores every paragraph (split on newlines, like the .docx extraction) against the cue index."""
+        candidates: Dict[int, float] = defaultdict(float)
+        paragraphs: List[ParagraphScreen] = []
+        position = 0
+        for index, paragraph in enumerate(text.split("\n")):
+            start = position
+            position += len(paragraph) + 1
+            if not paragraph.strip():
+                continue
+            scores = {tactic_id: score for tactic_id, score in self._match_tokens(_tokenize(paragraph)).items()
+                      if score >= MIN_CANDIDATE_SCORE}
+            if scores:
+                paragraphs.append(ParagraphScreen(index, start, start + len(paragraph), scores))
+                for tactic_id, score in scores.items():
+                    candidates[tactic_id] += score
+        return ScreenResult(dict(candidates), paragraphs)
+
+    def excerpt(self, text: str, result: ScreenResult, context_paragraphs: int = 1) -> str:
+        """Returns only the flagged paragraphs (plus neighbours), with omitted stretches marked."""
+        lines = text.split("\n")
+        keep = set()
+        for paragraph in result.paragraphs:
+            for neighbour in range(paragraph.index - context_paragraphs, paragraph.index + context_paragraphs + 1):
+                if 0 <= neighbour < len(lines):
+                    keep.add(neighbour)
+        excerpt_lines = []
+        previous = -1
+        for index in sorted(keep):
+            if index != previous + 1:
+                excerpt_lines.append("[...]")
+            excerpt_lines.append(lines[index])
+            previous = index
+        if previous != len(lines) - 1:
+            excerpt_lines.append("[...]")
+        return "\n".join(excerpt_lines)
+
+
+def benign_result(date: str) -> dict:
+    """AnalysisResultFromAPI-shaped result for text the pre-screen found no cues in."""
+    note = "No manipulation cues were found by the local pre-screen, so no language model analysis was run."
+    return {
+        'metadata': {
+            'author': None,
+            'date': date,
+            'overallIntent': "No Manipulation Detected",
+            'confidenceScore': None,
+            'tacticDensity': "None",
+            'input_data_description': "Pre-screened locally",
+        },
+        'executive_summary': {
+            'primary_intent': "No Manipulation Detected",
+            'tactic_density': "None",
+            'dominant_tactics': "None",
+            'structural_bias': "None detected",
+        },
+        'intentBreakdown': compute_intent_breakdown([]),
+        'overall_assessment': {
+            'summary_text': note,
+            'confidence_score_note': "The pre-screen is lexical; it reports no confidence score.",
+        },
+        'tactics': [],
+        'detailed_report_sections': {
+            'confidence_levels_discussion': note,
+            'context_handling': "Not assessed.",
+            'persuasion_vs_manipulation_distinction': "Not assessed.",
+            'manipulative_elements_summary': "None found.",
+        },
+    }
@@ -0,0 +1,179 @@
+# WISE_backend/app/prompt_builder.py
+
+"""
+Single source of the analysis prompt.
+
+PromptTemplate compiles the prompt pieces from app.constants once at startup,
+together with a compact digest of the taxonomy (id | name | category) so the
+model returns valid Tactic.id/category values. plan_analysis() estimates
+token counts up front and picks the strategy (single shot, trimmed
+instructions or chunked) expected to meet the per-request latency budget.
+The trimmed prompt leaves out the fact-check steps, so it is only chosen
+when PROMPT_TRIMMING_ENABLED is set; the chosen strategy is counted in the
+wise_analysis_strategy_total metric.
+"""
+import hashlib
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+from app.constants import (
+    PROMPT_TEMPLATE_VERSION,
+    PROMPT_PERSONA,
+    PROMPT_OBJECTIVE_PREFIX,
+    PROMPT_OBJECTIVE_SUFFIX,
+    PROMPT_PROCESS_HEADER,
+    PROMPT_PROCESS_STEPS,
+    PROMPT_IMPLEMENTATION_HEADER,
+    PROMPT_IMPLEMENTATION_DETAILS,
+    PROMPT_OUTPUT_HEADER,
+    PROMPT_OUTPUT_DETAILS,
+    PROMPT_FACT_CHECK_INSTRUCTIONS,
+    PROMPT_TRIMMED_BREVITY_NOTE,
+    PROMPT_TAXONOMY_DIGEST_HEADER,
+    PROMPT_PRESCREEN_HINT,
+    PROMPT_LATENCY_BUDGET_SECONDS,
+    PROMPT_TRIMMING_ENABLED,
+    CHARS_PER_TOKEN,
+    MODEL_MAX_OUTPUT_TOKENS,
+    MODEL_BASE_LATENCY_SECONDS,
+    MODEL_INPUT_TOKENS_PER_SECOND,
+    MODEL_OUTPUT_TOKENS_PER_SECOND,
+    OUTPUT_BASE_TOKENS,
+    OUTPUT_BASE_TOKENS_TRIMMED,
+    OUTPUT_TOKENS_PER_TACTIC,
+    OUTPUT_TOKENS_PER_TACTIC_TRIMMED,
+    CHUNKED_ANALYSIS_THRESHOLD_CHARS,
+    CHUNK_MAX_CHARS,
+    CHUNK_OVERLAP_CHARS,
+    CHUNK_MAX_CONCURRENCY,
+    PRESCREEN_MODE,
+)
+
+STRATEGY_SINGLE = "single"
+STRATEGY_TRIMMED = "single_trimmed"
+STRATEGY_CHUNKED = "chunked"
+
+
+def estimate_tokens(text_or_length) -> int:
+    length = text_or_length if isinstance(text_or_length, int) else len(text_or_length)
+    return math.ceil(length / CHARS_PER_TOKEN)
+
+
+class PromptTemplate:
+    """Prompt compiled once from the constants and the taxonomy; build() only splices in the text."""
+
+    def __init__(self, taxonomy: dict):
+        tactics = [t for t in taxonomy.get("tactics", []) if "id" in t]
+        self.digest_lines: Dict[int, str] = {
+            t["id"]: f"{t['id']} | {t.get('tactic_name', '')} | {t.get('category', '')}" for t in tactics
+        }
+        full_digest = "\n".join([PROMPT_TAXONOMY_DIGEST_HEADER, *self.digest_lines.values()])
+
+        process_and_implementation = [
+            PROMPT_PROCESS_HEADER, *PROMPT_PROCESS_STEPS,
+            PROMPT_IMPLEMENTATION_HEADER, *PROMPT_IMPLEMENTATION_DETAILS,
+        ]
+        output = [PROMPT_OUTPUT_HEADER, *PROMPT_OUTPUT_DETAILS]
+        # Everything after the document, per variant, as one precompiled tuple
+        self._tails = {
+            False: tuple(process_and_implementation + output),
+            True: tuple([line for line in process_and_implementation if line not in PROMPT_FACT_CHECK_INSTRUCTIONS]
+                        + output + [PROMPT_TRIMMED_BREVITY_NOTE]),
+        }
+        self._full_digest = full_digest
+        self._static_chars = {
+            trimmed: sum(len(line) for line in tail) + len(PROMPT_PERSONA) + len(PROMPT_OBJECTIVE_PREFIX)
+            + len(PROMPT_OBJECTIVE_SUFFIX) + len(full_digest)
+            for trimmed, tail in self._tails.items()
+        }
+
+        fingerprint = hashlib.sha256()
+        for part in (PROMPT_PERSONA, PROMPT_OBJECTIVE_PREFIX, PROMPT_OBJECTIVE_SUFFIX, full_digest,
+                     PROMPT_PRESCREEN_HINT, PRESCREEN_MODE, *self._tails[False], *self._tails[True]):
+            fingerprint.update(part.encode("utf-8"))
+            fingerprint.update(b"\x00")
+        # Exposed for cache keys: changes whenever any compiled prompt text or the taxonomy changes
+        self.version = f"{PROMPT_TEMPLATE_VERSION}-{fingerprint.hexdigest()[:12]}"
+
+    def build(self, text: str, candidate_ids: Optional[Sequence[int]] = None,
+              trimmed: bool = False, restrict_digest: bool = False) -> List[str]:
+        """
+        Returns the prompt contents for one call. With restrict_digest, only the
+        candidate tactics from the pre-screen are listed in the taxonomy digest.
+        """
+        if restrict_digest and candidate_ids:
+            digest = "\n".join([PROMPT_TAXONOMY_DIGEST_HEADER,
+                                *(self.digest_lines[i] for i in candidate_ids if i in self.digest_lines)])
+        else:
+            digest = self._full_digest
+        contents = [PROMPT_PERSONA, f"{PROMPT_OBJECTIVE_PREFIX}{text}{PROMPT_OBJECTIVE_SUFFIX}", digest]
+        contents.extend(self._tails[trimmed])
+        if candidate_ids and not restrict_digest:
+            contents.append(PROMPT_PRESCREEN_HINT.format(", ".join(str(i) for i in candidate_ids)))
+        return contents
+
+    def estimate_input_tokens(self, text_length: int, trimmed: bool = False) -> int:
+        return estimate_tokens(self._static_chars[trimmed] + text_length)
+
+
+@dataclass
+class AnalysisPlan:
+    strategy: str
+    input_tokens: int
+    output_tokens: int
+    estimated_seconds: float
+    chunk_count: int = 1
+
+    @property
+    def trimmed(self) -> bool:
+        return self.strategy == STRATEGY_TRIMMED
+
+
+def _expected_tactics(text_length: int, candidate_count: Optional[int]) -> int:
+    by_length = text_length / 700 # Observed density: roughly one tactic per short paragraph
+    by_screen = candidate_count * 1.5 if candidate_count else 0
+    return int(min(40, max(3, by_length, by_screen)))
+
+
+def _estimate_call(template: PromptTemplate, text_length: int, candidate_count: Optional[int], trimmed: bool):
+    tactics = _expected_tactics(text_length, candidate_count)
+    if trimmed:
+        output_tokens = OUTPUT_BASE_TOKENS_TRIMMED + tactics * OUTPUT_TOKENS_PER_TACTIC_TRIMMED
+    else:
+        output_tokens = OUTPUT_BASE_TOKENS + tactics * OUTPUT_TOKENS_PER_TACTIC
+    input_tokens = template.estimate_input_tokens(text_length, trimmed)
+    seconds = (MODEL_BASE_LATENCY_SECONDS + input_tokens / MODEL_INPUT_TOKENS_PER_SECOND
+               + output_tokens / MODEL_OUTPUT_TOKENS_PER_SECOND)
+    return input_tokens, output_tokens, seconds
+
+
+def plan_analysis(template: PromptTemplate, text_length: int, candidate_count: Optional[int] = None,
+                  latency_budget_seconds: float = PROMPT_LATENCY_BUDGET_SECONDS,
+                  allow_trimmed: bool = PROMPT_TRIMMING_ENABLED) -> AnalysisPlan:
+    """
+    Chooses how to run the analysis. The full single-shot prompt is preferred;
+    trimmed instructions (if allowed) are used when they are needed to meet the
+    latency budget; chunking is used when the document or the expected output
+    is too large for one call, or when it is the only way to meet the budget.
+    """
+    single = AnalysisPlan(STRATEGY_SINGLE, *_estimate_call(template, text_length, candidate_count, False))
+    trimmed = AnalysisPlan(STRATEGY_TRIMMED, *_estimate_call(template, text_length, candidate_count, True))
+
+    chunk_count = max(1, math.ceil(text_length / max(1, CHUNK_MAX_CHARS - CHUNK_OVERLAP_CHARS)))
+    chunk_length = min(text_length, CHUNK_MAX_CHARS)
+    chunk_in, chunk_out, chunk_seconds = _estimate_call(template, chunk_length, None, False)
+    chunked = AnalysisPlan(
+        STRATEGY_CHUNKED, chunk_in * chunk_count, chunk_out * chunk_count,
+        chunk_seconds * math.ceil(chunk_count / CHUNK_MAX_CONCURRENCY), chunk_count,
+    )
+
+    output_limit = 0.8 * MODEL_MAX_OUTPUT_TOKENS
+    one_call = trimmed if allow_trimmed else single # The cheapest single call allowed
+    if chunk_count > 1 and (text_length > CHUNKED_ANALYSIS_THRESHOLD_CHARS or one_call.output_tokens > output_limit):
+        return chunked
+    if single.estimated_seconds <= latency_budget_seconds and single.output_tokens <= output_limit:
+        return single
+    if one_call.estimated_seconds <= latency_budget_seconds or chunk_count == 1:
+        return one_call
+    return chunked if chunked.estimated_seconds < one_call.estimated_seconds else one_call
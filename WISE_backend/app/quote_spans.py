@@ -0,0 +1,128 @@
+# WISE_backend/app/quote_spans.py
+
+"""
+Maps tactic quotes returned by the model to character offsets in the source text.
+
+DocumentIndex tokenizes the document once (lowercased word tokens, so
+whitespace, punctuation and case differences don't matter) and indexes every
+token trigram. A quote is then located by a trigram lookup plus verification,
+falling back to diagonal voting over its trigrams when the model paraphrased,
+trimmed or elided ("...") part of the quote.
+"""
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"\w+")
+_ELLIPSIS_RE = re.compile(r"\.\s*\.\s*\.|\u2026|\[\.\.\.\]")
+
+FUZZY_MIN_SCORE = 0.5 # Share of the quote's trigrams that must be found on one alignment
+FUZZY_UNIGRAM_MIN_SCORE = 0.6 # Stricter, since single words match by chance far more often
+ELIDED_MAX_GAP_CHARS = 5000 # How far apart the parts of an elided quote ("a ... b") may be
+MAX_POSITIONS_PER_GRAM = 64 # Very common n-grams carry little signal; cap the work they cause
+DIAGONAL_TOLERANCE = 3 # Token shift allowed for small insertions/deletions inside a quote
+
+
+@dataclass
+class Span:
+    start: int
+    end: int
+    score: float # 1.0 for an exact (normalized) match
+
+
+class DocumentIndex:
+    """Token n-gram index of one document. Build once per document, then resolve many quotes."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens: List[str] = []
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        for match in _TOKEN_RE.finditer(text):
+            self.tokens.append(match.group().lower())
+            self.starts.append(match.start())
+            self.ends.append(match.end())
+        self._trigrams: Dict[Tuple[str, str, str], List[int]] = defaultdict(list)
+        self._unigrams: Dict[str, List[int]] = defaultdict(list)
+        tokens = self.tokens
+        for position, token in enumerate(tokens):
+            self._unigrams[token].append(position)
+        for position in range(len(tokens) - 2):
+            self._trigrams[(tokens[position], tokens[position + 1], tokens[position + 2])].append(position)
+
+    def _span(self, first_token: int, last_token: int, score: float) -> Span:
+        return Span(self.starts[first_token], self.ends[last_token], round(score, 3))
+
+    def _exact(self, quote_tokens: List[str]) -> Optional[Span]:
+        length = len(quote_tokens)
+        if length >= 3:
+            positions = self._trigrams.get(tuple(quote_tokens[:3]), ())
+        else:
+            positions = self._unigrams.get(quote_tokens[0], ())
+        for position in positions:
+            if self.tokens[position:position + length] == quote_tokens:
+                return self._span(position, position + length - 1, 1.0)
+        return None
+
+    def _fuzzy(self, quote_tokens: List[str], n: int) -> Optional[Span]:
+        if len(quote_tokens) < n:
+            return None
+        grams = len(quote_tokens) - n + 1
+        # Each matching n-gram votes for the document offset the quote would start at
+        votes: Dict[int, List[Tuple[int, int]]] = defaultdict(list) # offset -> [(quote pos, doc pos)]
+        for i in range(grams):
+            if n == 3:
+                positions = self._trigrams.get((quote_tokens[i], quote_tokens[i + 1], quote_tokens[i + 2]), ())
+            else:
+                positions = self._unigrams.get(quote_tokens[i], ())
+            for position in positions[:MAX_POSITIONS_PER_GRAM]:
+                votes[position - i].append((i, position))
+        if not votes:
+            return None
+
+        best_hits: List[Tuple[int, int]] = []
+        best_quote_positions = 0
+        for offset in votes:
+            hits = [hit for shift in range(-DIAGONAL_TOLERANCE, DIAGONAL_TOLERANCE + 1)
+                    for hit in votes.get(offset + shift, ())]
+            quote_positions = len({i for i, _ in hits})
+            if quote_positions > best_quote_positions:
+                best_hits, best_quote_positions = hits, quote_positions
+        score = best_quote_positions / grams
+        if score < (FUZZY_MIN_SCORE if n == 3 else FUZZY_UNIGRAM_MIN_SCORE) or best_quote_positions < min(grams, 2):
+            return None
+        first = min(position for _, position in best_hits)
+        last = max(position for _, position in best_hits) + n - 1
+        return self._span(first, last, score)
+
+    def _resolve_part(self, quote: str) -> Optional[Span]:
+        quote_tokens = [token.lower() for token in _TOKEN_RE.findall(quote)]
+        if not quote_tokens:
+            return None
+        return self._exact(quote_tokens) or self._fuzzy(quote_tokens, 3) or self._fuzzy(quote_tokens, 1)
+
+    def resolve(self, quote: str) -> Optional[Span]:
+        """Returns the best span for quote, or None if it can't be located confidently."""
+        if not quote or not self.tokens:
+            return None
+        parts = [part for part in _ELLIPSIS_RE.split(quote) if _TOKEN_RE.search(part)]
+        if len(parts) <= 1:
+            return self._resolve_part(quote)
+        # Elided quote: locate the first and last parts and span everything between them
+        first, last = self._resolve_part(parts[0]), self._resolve_part(parts[-1])
+        if first is None or last is None:
+            return first or last
+        if first.start <= last.start and last.start - first.end <= ELIDED_MAX_GAP_CHARS:
+            return Span(first.start, last.end, round(min(first.score, last.score) * 0.95, 3))
+        return first
+
+
+def add_quote_spans(tactics: List[dict], index: DocumentIndex) -> List[dict]:
+    """Sets 'quoteSpan' ({start, end, matchScore} or None) on each tactic dict in place."""
+    for tactic in tactics:
+        span = index.resolve(tactic.get('quote', ''))
+        tactic['quoteSpan'] = (
+            {'start': span.start, 'end': span.end, 'matchScore': span.score} if span is not None else None
+        )
+    return tactics
@@ -0,0 +1,262 @@
+# WISE_backend/app/result_cache.py
+
+"""
+Content-addressed cache for analysis results.
+
+Entries are keyed on a hash of the normalized document text, the model name
+and the prompt version. The user's API key is never part of the key or the
+stored value. A bounded in-memory LRU is always used; an optional SQLite tier
+keeps results across restarts. Concurrent identical submissions share a single
+in-flight analysis instead of each paying for a model call.
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.constants import (
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_MAX_BYTES,
+    RESULT_CACHE_TTL_SECONDS,
+    RESULT_CACHE_DB_PATH,
+    RESULT_CACHE_DB_MAX_ENTRIES,
+)
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes text so trivially different copies of a document share a cache key."""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip()
+
+
+def make_cache_key(text: str, model_name: str, prompt_version: str) -> str:
+    """Builds the cache key for a document. Never pass anything derived from the API key here."""
+    digest = hashlib.sha256()
+    for part in (model_name, prompt_version, normalize_text(text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class _SqliteTier:
+    """Small persistent tier. All access is serialized through a lock; calls are short."""
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, payload TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0], row[1]
+
+    def set(self, key: str, payload: str, expires_at: float) -> int:
+        """Stores an entry and returns how many entries were evicted to make room."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, payload, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, now),
+            )
+            expired = self._conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,)).rowcount
+            overflow = self._conn.execute(
+                "DELETE FROM results WHERE key IN ("
+                "SELECT key FROM results ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self._conn.commit()
+            return max(expired, 0) + max(overflow, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+
+class ResultCache:
+    """Bounded LRU of serialized analysis results with TTL, size limits and request coalescing."""
+
+    def __init__(
+        self,
+        max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES,
+        ttl_seconds: float = RESULT_CACHE_TTL_SECONDS,
+        db_path: str = RESULT_CACHE_DB_PATH,
+        db_max_entries: int = RESULT_CACHE_DB_MAX_ENTRIES,
+        enabled: bool = RESULT_CACHE_ENABLED,
+    ):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # key -> (expires_at, JSON payload). Payloads are stored serialized so callers
+        # always receive an independent copy and the byte size is known up front.
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._disk = _SqliteTier(db_path, db_max_entries) if (enabled and db_path) else None
+        self.stats = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    # --- Memory tier ---
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at <= time.time():
+            self._remove(key)
+            self.stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return payload
+
+    def _memory_set(self, key: str, payload: str, expires_at: float) -> None:
+        if len(payload) > self.max_bytes:
+            return # Never let a single oversized result flush the whole cache
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, payload)
+        self._bytes += len(payload)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.stats["evictions"] += 1
+
+    def _remove(self, key: str) -> None:
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    # --- Public API ---
+    def get(self, key: str) -> Optional[dict]:
+        """Returns a cached result from memory only, or None."""
+        if not self.enabled:
+            return None
+        payload = self._memory_get(key)
+        if payload is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return json.loads(payload)
+
+    def contains(self, key: str) -> bool:
+        """Whether the memory tier holds a live entry for key. Doesn't count as a hit or miss."""
+        entry = self._entries.get(key) if self.enabled else None
+        return entry is not None and entry[0] > time.time()
+
+    async def put(self, key: str, value: dict) -> None:
+        """Stores a result computed outside get_or_compute (e.g. by the streaming endpoint)."""
+        if not self.enabled:
+            return
+        payload = json.dumps(value)
+        expires_at = time.time() + self.ttl_seconds
+        self._memory_set(key, payload, expires_at)
+        if self._disk is not None:
+            self.stats["evictions"] += await asyncio.to_thread(self._disk.set, key, payload, expires_at)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[dict]],
+                             store: Optional[Callable[[dict], bool]] = None) -> dict:
+        """
+        Returns the cached result for key, joins an identical in-flight computation,
+        or runs compute() and caches its result. Failures are never cached, nor are
+        results for which store(result) is false (they are still shared with waiters).
+        """
+        if not self.enabled:
+            return await compute()
+
+        payload = self._memory_get(key)
+        if payload is not None:
+            self.stats["hits"] += 1
+            return json.loads(payload)
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            await asyncio.wait({pending})
+            if not pending.cancelled() and pending.exception() is None:
+                return json.loads(pending.result())
+            # The leading request failed or was abandoned (e.g. its API key was rejected).
+            # Errors may be specific to that caller, so run our own analysis instead.
+            return await compute()
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            if self._disk is not None:
+                disk_entry = await asyncio.to_thread(self._disk.get, key)
+                if disk_entry is not None:
+                    payload, expires_at = disk_entry
+                    self.stats["disk_hits"] += 1
+                    self._memory_set(key, payload, expires_at)
+                    future.set_result(payload)
+                    return json.loads(payload)
+
+            self.stats["misses"] += 1
+            result = await compute()
+            payload = json.dumps(result)
+            if store is None or store(result):
+                expires_at = time.time() + self.ttl_seconds
+                self._memory_set(key, payload, expires_at)
+                if self._disk is not None:
+                    self.stats["evictions"] += await asyncio.to_thread(self._disk.set, key, payload, expires_at)
+            future.set_result(payload)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception() # Mark as retrieved; waiters handle failure themselves
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        if self._disk is not None:
+            self._disk.clear()
+
+    def snapshot_stats(self) -> dict:
+        """Counters plus current occupancy, safe to expose publicly (no keys or content)."""
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "in_flight": len(self._in_flight),
+            "enabled": self.enabled,
+            "disk_enabled": self._disk is not None,
+        }
+
+
+# Shared process-wide instance used by the analysis pipeline
+result_cache = ResultCache()
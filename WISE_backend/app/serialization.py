@@ -0,0 +1,42 @@
+# WISE_backend/app/serialization.py
+
+"""
+JSON encoding of API responses.
+
+dumps() uses orjson when it is installed (several times faster than the
+standard library on result-sized documents) and falls back to json.
+FastJSONResponse is the app's default response class. Analysis results skip
+FastAPI's jsonable_encoder walk entirely: they are validated against
+FinalAnalysisResult and serialized by pydantic-core in one step (see
+analysis_module.render_result), then sent as JSONBytesResponse.
+"""
+import json
+from typing import Any
+
+from starlette.responses import JSONResponse, Response
+
+try: # Optional: the standard library encoder is used when orjson isn't installed
+    import orjson
+except ImportError:
+    orjson = None
+
+MEDIA_TYPE_JSON = "application/json"
+
+
+def dumps(value: Any) -> bytes:
+    """Compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps()."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class JSONBytesResponse(Response):
+    """A body that is already serialized JSON."""
+    media_type = MEDIA_TYPE_JSON
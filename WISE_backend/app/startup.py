@@ -0,0 +1,92 @@
+# WISE_backend/app/startup.py
+
+"""
+Cold-start report and background warm-up.
+
+On a scale-to-zero host every cold start is paid for by a waiting user, so
+the import path is kept short:
+  * the GenAI SDK is imported by the first client created (app.client_pool);
+  * the tactic payloads are precompressed by the build step (app.knowledge);
+  * static assets are compressed when first requested (app.static_files).
+Once the app has started, and /health is already being answered, warm_up()
+runs those deferred steps in a worker thread, so the first analysis does not
+pay for them either.
+
+startup_report records how long each import and init phase took and when
+the milestones (ready, first /health, first analysis, warm) were reached,
+measured from process start. It is printed once warm-up finishes and is
+served at GET /api/startup.
+"""
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+
+def _process_age_seconds() -> float:
+    """Seconds since the process was started (Linux), so interpreter startup is included; 0.0 elsewhere."""
+    try:
+        with open("/proc/self/stat", "rb") as f:
+            start_ticks = int(f.read().rsplit(b")", 1)[1].split()[19])
+        with open("/proc/uptime", "rb") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class StartupReport:
+    """Durations of startup phases and times of the first milestones, in seconds."""
+
+    def __init__(self):
+        self._origin = time.monotonic() - _process_age_seconds()
+        self.phases: Dict[str, float] = {}
+        self.milestones: Dict[str, float] = {}
+        self.milestone("imports_started")
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def milestone(self, name: str) -> None:
+        """Records the first time a milestone is reached; later calls are no-ops."""
+        if name not in self.milestones:
+            self.milestones[name] = time.monotonic() - self._origin
+
+    def snapshot(self) -> dict:
+        return {
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "milestones": {name: round(seconds, 4) for name, seconds in self.milestones.items()},
+        }
+
+    def snapshot_stats(self) -> dict:
+        """Flat gauges for the metrics registry."""
+        stats = {f"phase_{name}_seconds": seconds for name, seconds in self.phases.items()}
+        stats.update({f"{name}_seconds": seconds for name, seconds in self.milestones.items()})
+        return stats
+
+    def log(self) -> None:
+        phases = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases.items())
+        milestones = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.milestones.items())
+        print(f"Startup report: {milestones}. Phases: {phases}.")
+
+
+async def warm_up(steps: List[Tuple[str, Callable[[], None]]]) -> None:
+    """Runs the deferred init steps one by one off the event loop. A failed step is only logged."""
+    for name, step in steps:
+        try:
+            with startup_report.phase(f"warm_{name}"):
+                await asyncio.to_thread(step)
+        except Exception as e:
+            print(f"Warning: Startup warm-up step '{name}' failed: {e}")
+    startup_report.milestone("warm")
+    startup_report.log()
+
+
+# Shared process-wide report; created by the first import in app.main
+startup_report = StartupReport()
@@ -0,0 +1,206 @@
+# WISE_backend/app/static_files.py
+
+"""
+Cache-friendly serving of the React build.
+
+PrecompressedStaticFiles indexes the build directory in the background after
+startup (see app.startup), or each file on its first request. Each text asset
+(js, css, html, json, svg, ...) gets brotli and gzip variants. They come from
+.br/.gz files written at build time (python -m app.static_files <dir>), or
+are compressed into memory when indexed. Brotli needs the optional brotli
+package. Responses negotiate Accept-Encoding,
+carry a strong ETag derived from the file content and answer conditional
+requests with 304. Content-hashed bundles such as main.0673bd11.js are
+cached as immutable for a year. Everything else, notably index.html, is
+revalidated on each use, so a new deploy is picked up at once. Source maps
+are not served unless enabled.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+import sys
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional, Union
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from app.compression import ENCODING_BROTLI, ENCODING_GZIP, brotli_compress, negotiate_encoding
+from app.constants import (
+    STATIC_SERVE_SOURCE_MAPS,
+    STATIC_GZIP_LEVEL,
+    STATIC_BROTLI_QUALITY,
+    GZIP_MIN_BYTES,
+)
+
+COMPRESSIBLE_EXTENSIONS = (".js", ".css", ".html", ".json", ".svg", ".txt", ".map", ".ico", ".xml", ".webmanifest")
+PRECOMPRESSED_SUFFIXES = {ENCODING_BROTLI: ".br", ENCODING_GZIP: ".gz"}
+ENCODING_PREFERENCE = (ENCODING_BROTLI, ENCODING_GZIP)
+# Build tools put a content hash in the name (main.0673bd11.js, 453.28ff506c.chunk.js), so it never changes
+HASHED_ASSET_RE = re.compile(r"\.[0-9a-f]{8,}(?:\.chunk)?\.[A-Za-z0-9]+$")
+CACHE_CONTROL_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_CONTROL_REVALIDATE = "no-cache"
+MIN_COMPRESSION_SAVING = 0.9 # Keep a variant only if it is at most this fraction of the original
+
+
+@dataclass
+class _Asset:
+    size: int
+    mtime: float
+    etag: str
+    media_type: str
+    cache_control: str
+    variants: Dict[str, Union[bytes, str]] = field(default_factory=dict) # encoding -> bytes in memory, or a file path
+
+
+def _is_compressible(path: str) -> bool:
+    return path.endswith(COMPRESSIBLE_EXTENSIONS)
+
+
+def _compress(data: bytes, encoding: str, build_time: bool) -> Optional[bytes]:
+    if encoding == ENCODING_GZIP:
+        return gzip.compress(data, compresslevel=9 if build_time else STATIC_GZIP_LEVEL, mtime=0)
+    return brotli_compress(data, 11 if build_time else STATIC_BROTLI_QUALITY)
+
+
+def _load_asset(full_path: str, stat_result: os.stat_result) -> _Asset:
+    with open(full_path, "rb") as f:
+        data = f.read()
+    asset = _Asset(
+        size=stat_result.st_size,
+        mtime=stat_result.st_mtime,
+        etag=f'"{hashlib.sha256(data).hexdigest()[:32]}"',
+        media_type=mimetypes.guess_type(full_path)[0] or "application/octet-stream",
+        cache_control=CACHE_CONTROL_IMMUTABLE if HASHED_ASSET_RE.search(full_path) else CACHE_CONTROL_REVALIDATE,
+    )
+    if not _is_compressible(full_path) or len(data) < GZIP_MIN_BYTES:
+        return asset
+    for encoding in ENCODING_PREFERENCE:
+        sibling = full_path + PRECOMPRESSED_SUFFIXES[encoding]
+        try:
+            if os.stat(sibling).st_mtime >= stat_result.st_mtime: # Written by the build step for this version
+                asset.variants[encoding] = sibling
+                continue
+        except FileNotFoundError:
+            pass
+        compressed = _compress(data, encoding, build_time=False)
+        if compressed is not None and len(compressed) <= MIN_COMPRESSION_SAVING * len(data):
+            asset.variants[encoding] = compressed
+    return asset
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires."""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def _not_modified(request_headers: Headers, asset: _Asset) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None: # Takes precedence over If-Modified-Since (RFC 9110)
+        return etag_matches(if_none_match, asset.etag)
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(asset.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            pass
+    return False
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles with precompressed variants, strong ETags and immutable caching of hashed assets."""
+
+    def __init__(self, *, directory: str, serve_source_maps: bool = STATIC_SERVE_SOURCE_MAPS, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.serve_source_maps = serve_source_maps
+        self._assets: Dict[str, _Asset] = {}
+
+    def warm_up(self) -> None:
+        """Hashes and compresses every asset ahead of its first request; called off the event loop at startup."""
+        compressed = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                full_path = os.path.realpath(os.path.join(root, name))
+                if name.endswith(tuple(PRECOMPRESSED_SUFFIXES.values())) or not self._servable(full_path):
+                    continue
+                compressed += bool(self._asset(full_path, os.stat(full_path)).variants)
+        print(f"Indexed {len(self._assets)} static file(s), {compressed} with compressed variants.")
+
+    def _servable(self, full_path: str) -> bool:
+        return self.serve_source_maps or not full_path.endswith(".map")
+
+    def _asset(self, full_path: str, stat_result: os.stat_result) -> _Asset:
+        asset = self._assets.get(full_path)
+        if asset is None or asset.size != stat_result.st_size or asset.mtime != stat_result.st_mtime:
+            asset = self._assets[full_path] = _load_asset(full_path, stat_result) # Not warmed yet, or changed since
+        return asset
+
+    def lookup_path(self, path: str):
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is not None and stat.S_ISREG(stat_result.st_mode) and self._servable(full_path):
+            # StaticFiles runs lookups in a worker thread, so indexing a file here never blocks the event loop
+            self._asset(full_path, stat_result)
+        return full_path, stat_result
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        full_path = os.path.realpath(full_path)
+        if not self._servable(full_path):
+            raise HTTPException(status_code=404)
+        asset = self._asset(full_path, stat_result)
+        request_headers = Headers(scope=scope)
+        headers = {
+            "etag": asset.etag,
+            "cache-control": asset.cache_control,
+            "last-modified": formatdate(asset.mtime, usegmt=True),
+        }
+        if asset.variants:
+            headers["vary"] = "Accept-Encoding"
+        if _not_modified(request_headers, asset):
+            return Response(status_code=304, headers=headers)
+
+        encoding = None
+        if "range" not in request_headers: # Byte ranges refer to the identity encoding
+            encoding = negotiate_encoding(request_headers.get("accept-encoding", ""),
+                                          [coding for coding in ENCODING_PREFERENCE if coding in asset.variants])
+        if encoding is None:
+            return FileResponse(full_path, status_code=status_code, headers=headers, media_type=asset.media_type,
+                                stat_result=stat_result)
+        headers["content-encoding"] = encoding
+        variant = asset.variants[encoding]
+        if isinstance(variant, bytes):
+            return Response(variant, status_code=status_code, headers=headers, media_type=asset.media_type)
+        return FileResponse(variant, status_code=status_code, headers=headers, media_type=asset.media_type)
+
+
+def precompress_directory(directory: str) -> int:
+    """Writes .br (if brotli is installed) and .gz files next to each compressible asset; run after the UI build."""
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            full_path = os.path.join(root, name)
+            if not _is_compressible(full_path) or not stat.S_ISREG(os.stat(full_path).st_mode):
+                continue
+            with open(full_path, "rb") as f:
+                data = f.read()
+            if len(data) < GZIP_MIN_BYTES:
+                continue
+            for encoding in ENCODING_PREFERENCE:
+                compressed = _compress(data, encoding, build_time=True)
+                if compressed is not None and len(compressed) <= MIN_COMPRESSION_SAVING * len(data):
+                    with open(full_path + PRECOMPRESSED_SUFFIXES[encoding], "wb") as f:
+                        f.write(compressed)
+                    written += 1
+    return written
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "static")
+    print(f"Wrote {precompress_directory(target)} precompressed file(s) under {target}.")
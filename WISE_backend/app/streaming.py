@@ -0,0 +1,89 @@
+# WISE_backend/app/streaming.py
+
+"""
+Incremental parsing of the streamed structured-JSON analysis response.
+
+The model streams one JSON document (AnalysisResultFromAPI) in arbitrary text
+fragments. JSONStreamScanner consumes those fragments and reports the root
+'metadata' object and each element of the root 'tactics' array as soon as its
+closing brace arrives, so they can be pushed to the client before the rest of
+the document has been generated.
+"""
+import json
+from typing import List, Optional, Tuple
+
+from app.serialization import dumps
+
+# Root-level keys whose values are reported as soon as they are complete
+STREAMED_OBJECT_KEYS = ("metadata",)
+STREAMED_ARRAY_KEYS = ("tactics",)
+
+
+class JSONStreamScanner:
+    """Single-pass scanner over a growing JSON text. Each character is inspected once."""
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._stack: List[str] = [] # Open containers: '{' or '['
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_root_string: Optional[str] = None
+        self._root_key: Optional[str] = None
+        self._capture_start: Optional[int] = None
+        self._capture_depth = 0
+
+    def feed(self, fragment: str) -> List[Tuple[str, dict]]:
+        """Appends a fragment and returns (key, value) pairs completed by it."""
+        self.buffer += fragment
+        completed: List[Tuple[str, dict]] = []
+        buf = self.buffer
+        for i in range(self._pos, len(buf)):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_root_string = buf[self._string_start:i + 1]
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":" and len(self._stack) == 1 and self._last_root_string is not None:
+                self._root_key = json.loads(self._last_root_string)
+            elif ch == "," and len(self._stack) == 1:
+                self._root_key = None
+                self._last_root_string = None
+            elif ch in "{[":
+                if ch == "{" and self._capture_start is None and self._should_capture():
+                    self._capture_start = i
+                    self._capture_depth = len(self._stack)
+                self._stack.append(ch)
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if self._capture_start is not None and len(self._stack) == self._capture_depth:
+                    completed.append((self._root_key, json.loads(buf[self._capture_start:i + 1])))
+                    self._capture_start = None
+        self._pos = len(buf)
+        return completed
+
+    def _should_capture(self) -> bool:
+        if self._root_key in STREAMED_OBJECT_KEYS:
+            return self._stack == ["{"]
+        if self._root_key in STREAMED_ARRAY_KEYS:
+            return self._stack == ["{", "["]
+        return False
+
+
+def format_event(event: str, data, media_type: str) -> bytes:
+    """Serializes one progress event as an SSE frame or an NDJSON line. data may already be encoded JSON (bytes)."""
+    payload = data if isinstance(data, bytes) else dumps(data)
+    if media_type == "text/event-stream":
+        return b"event: " + event.encode("utf-8") + b"\ndata: " + payload + b"\n\n"
+    return b'{"event":' + dumps(event) + b',"data":' + payload + b"}\n"
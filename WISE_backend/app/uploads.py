@@ -0,0 +1,104 @@
+# WISE_backend/app/uploads.py
+
+"""
+Upload size enforcement.
+
+UploadSizeLimitMiddleware rejects oversized request bodies with 413 before
+they are parsed: immediately when Content-Length is too large, or as soon as
+the streamed body crosses the limit for chunked uploads. read_upload_capped
+then enforces the exact per-file cap while reading the parsed upload in chunks;
+iter_upload_capped does the same for uploads that are processed as they are read.
+"""
+from typing import AsyncIterator, Dict
+
+from fastapi import HTTPException, UploadFile
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.constants import UPLOAD_READ_CHUNK_BYTES, ERROR_UPLOAD_TOO_LARGE
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimitMiddleware:
+    """Pure ASGI middleware applying a body size limit to selected POST paths."""
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits # path -> max request body bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = self.limits.get(scope.get("path", "")) if scope["type"] == "http" and scope.get("method") == "POST" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(scope, receive, send, limit)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if response_started:
+                raise
+            await self._reject(scope, receive, send, limit)
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send, limit: int) -> None:
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": ERROR_UPLOAD_TOO_LARGE.format(limit)},
+            headers={"Connection": "close"},
+        )
+        await response(scope, receive, send)
+
+
+async def read_upload_capped(file: UploadFile, max_bytes: int) -> bytes:
+    """Reads an upload in chunks, raising 413 as soon as it exceeds max_bytes."""
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=ERROR_UPLOAD_TOO_LARGE.format(max_bytes))
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_READ_CHUNK_BYTES)
+        if not chunk:
+            return bytes(buffer)
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise HTTPException(status_code=413, detail=ERROR_UPLOAD_TOO_LARGE.format(max_bytes))
+
+
+async def iter_upload_capped(file: UploadFile, max_bytes: int) -> AsyncIterator[bytes]:
+    """Yields an upload in chunks, raising 413 as soon as it exceeds max_bytes."""
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=ERROR_UPLOAD_TOO_LARGE.format(max_bytes))
+    received = 0
+    while True:
+        chunk = await file.read(UPLOAD_READ_CHUNK_BYTES)
+        if not chunk:
+            return
+        received += len(chunk)
+        if received > max_bytes:
+            raise HTTPException(status_code=413, detail=ERROR_UPLOAD_TOO_LARGE.format(max_bytes))
+        yield chunk
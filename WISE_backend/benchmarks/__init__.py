@@ -0,0 +1 @@
+# WISE_backend/benchmarks/__init__.py
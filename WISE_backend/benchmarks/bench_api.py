@@ -0,0 +1,181 @@
+# WISE_backend/benchmarks/bench_api.py
+
+"""
+Load test of /api/analyze (or /api/analyze/stream) running in-process against
+the local fake Gemini server, across concurrency levels and file types/sizes.
+
+Reports p50/p95/p99 latency, throughput, error counts by status and the mean
+of each Server-Timing stage. With --stream and --transport http (the ASGI
+test transport buffers whole responses) it also reports time to first tactic.
+The result cache is disabled unless --with-cache is given, so every request
+pays for the full pipeline. Admission control is off unless --with-admission
+is given: all benchmark requests share one API key and would otherwise be
+held to the per-key limit.
+
+Usage (from WISE_backend):
+    python -m benchmarks.bench_api --output before.json
+    python -m benchmarks.bench_api --concurrency 1 16 64 --files txt:5000 docx:300000 --requests 100
+    python -m benchmarks.bench_api --stream --transport http --error-rate 0.05 --malformed-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.documents import MAKERS, CONTENT_TYPES
+from benchmarks.fake_gemini import FakeGeminiConfig, run_fake_gemini_server, serve_in_thread
+from benchmarks.results import latency_summary, write_results
+
+API_KEY = "benchmark-key" # Any non-empty key is accepted by the fake server
+
+
+def parse_file_spec(spec: str) -> Tuple[str, int]:
+    """'docx:200000' -> ('docx', 200000)."""
+    kind, _, size = spec.partition(":")
+    if kind not in MAKERS:
+        raise argparse.ArgumentTypeError(f"Unknown file kind '{kind}' (choose from {', '.join(MAKERS)})")
+    return kind, int(size or 5000)
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    stages = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            if param.startswith("dur="):
+                stages[name] = float(param[4:])
+    return stages
+
+
+async def _one_request(client: httpx.AsyncClient, path: str, payload: bytes, filename: str, content_type: str,
+                       stream: bool) -> dict:
+    files = {"file": (filename, payload, content_type)}
+    data = {"user_api_key": API_KEY}
+    started = time.perf_counter()
+    if not stream:
+        response = await client.post(path, files=files, data=data)
+        return {
+            "latency": time.perf_counter() - started,
+            "status": str(response.status_code),
+            "stages": parse_server_timing(response.headers.get("server-timing")),
+        }
+
+    first_tactic = None
+    status = None
+    async with client.stream("POST", path, files=files, data=data) as response:
+        status = str(response.status_code)
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            event = json.loads(line).get("event")
+            if event == "tactic" and first_tactic is None:
+                first_tactic = time.perf_counter() - started
+            elif event == "error":
+                status = "error_event"
+    return {"latency": time.perf_counter() - started, "status": status, "first_tactic": first_tactic,
+            "stages": parse_server_timing(response.headers.get("server-timing"))}
+
+
+async def run_scenario(client: httpx.AsyncClient, kind: str, size: int, concurrency: int, requests: int,
+                       stream: bool) -> dict:
+    payload = MAKERS[kind](size)
+    path = "/api/analyze/stream" if stream else "/api/analyze"
+    filename = f"benchmark.{kind}"
+    gate = asyncio.Semaphore(concurrency)
+    samples: List[dict] = []
+
+    async def worker():
+        async with gate:
+            samples.append(await _one_request(client, path, payload, filename, CONTENT_TYPES[kind], stream))
+
+    await _one_request(client, path, payload, filename, CONTENT_TYPES[kind], stream) # Warm-up (pools, imports)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    statuses = Counter(sample["status"] for sample in samples)
+    ok = [sample for sample in samples if sample["status"] == "200"]
+    stage_totals: Dict[str, List[float]] = defaultdict(list)
+    for sample in ok:
+        for name, duration in sample["stages"].items():
+            stage_totals[name].append(duration)
+    result = {
+        "name": f"{path}/{kind}-{size}/c{concurrency}",
+        "endpoint": path,
+        "file_kind": kind,
+        "file_bytes": len(payload),
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": requests - len(ok),
+        "statuses": dict(statuses),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        **latency_summary([sample["latency"] for sample in ok]),
+        "stage_mean_ms": {name: round(sum(values) / len(values), 2) for name, values in stage_totals.items()},
+    }
+    first_tactics = [sample["first_tactic"] for sample in ok if sample.get("first_tactic") is not None]
+    if first_tactics:
+        result.update(latency_summary(first_tactics, prefix="first_tactic_"))
+    return result
+
+
+async def main(args) -> List[dict]:
+    # Imported here so WISE_* environment overrides set by the caller apply
+    from app.main import app
+    from app.client_pool import client_pool
+    from app.result_cache import result_cache
+    from app.admission import admission_controller
+
+    result_cache.enabled = args.with_cache
+    admission_controller.enabled = args.with_admission
+    fake_config = FakeGeminiConfig(
+        latency_seconds=args.latency, latency_jitter_seconds=args.jitter, tactic_count=args.tactics,
+        error_rate=args.error_rate, error_status=args.error_status, malformed_rate=args.malformed_rate,
+    )
+    results = []
+    with run_fake_gemini_server(fake_config) as (fake_url, _):
+        client_pool.base_url = fake_url
+        server = serve_in_thread(app) if args.transport == "http" else nullcontext(None)
+        with server as app_url:
+            if app_url:
+                client = httpx.AsyncClient(base_url=app_url, timeout=300,
+                                           limits=httpx.Limits(max_connections=max(args.concurrency)))
+            else:
+                client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300)
+            async with client:
+                for kind, size in args.files:
+                    for concurrency in args.concurrency:
+                        result = await run_scenario(client, kind, size, concurrency, args.requests, args.stream)
+                        print(f"{result['name']}: p50={result.get('p50_ms')}ms p95={result.get('p95_ms')}ms "
+                              f"{result['throughput_rps']} req/s, {result['errors']} errors", flush=True)
+                        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=parse_file_spec, nargs="+",
+                        default=[("txt", 5000), ("md", 20000), ("docx", 150000)],
+                        help="kind:chars, kind in txt/md/docx")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=50, help="Requests per scenario")
+    parser.add_argument("--stream", action="store_true", help="Benchmark /api/analyze/stream")
+    parser.add_argument("--transport", choices=["asgi", "http"], default="asgi",
+                        help="asgi: in-memory transport; http: uvicorn on a local port (needed for first-tactic timing)")
+    parser.add_argument("--with-cache", action="store_true", help="Keep the result cache enabled")
+    parser.add_argument("--with-admission", action="store_true", help="Keep admission control enabled")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra uniform upstream latency in seconds")
+    parser.add_argument("--tactics", type=int, default=6, help="Tactics per fake response")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+    results = asyncio.run(main(args))
+    write_results("api", results, args.output, **{k: v for k, v in vars(args).items() if k != "output"})
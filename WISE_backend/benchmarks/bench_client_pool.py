@@ -0,0 +1,80 @@
+# WISE_backend/benchmarks/bench_client_pool.py
+
+"""
+Throughput of per-request clients + asyncio.to_thread (the previous call path)
+versus pooled clients on the SDK's native async surface, against the local
+fake Gemini server.
+
+Usage (from WISE_backend):
+    python -m benchmarks.bench_client_pool --requests 400 --concurrency 100
+"""
+import argparse
+import asyncio
+import time
+
+from google import genai
+
+from app.client_pool import GenAIClientPool
+from app.constants import GEMINI_MODEL_NAME
+from benchmarks.fake_gemini import FakeGeminiConfig, run_fake_gemini_server
+from benchmarks.results import latency_summary, write_results
+
+CONTENTS = ["Benchmark prompt"]
+
+
+async def _run(label: str, call, requests: int, concurrency: int, keys: int) -> dict:
+    gate = asyncio.Semaphore(concurrency) # Simulated concurrent HTTP requests to our API
+    latencies = []
+
+    async def one(i: int):
+        async with gate:
+            started = time.perf_counter()
+            await call(f"bench-key-{i % keys}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "name": label,
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        **latency_summary(latencies),
+    }
+
+
+async def main(args) -> list:
+    config = FakeGeminiConfig(latency_seconds=args.latency)
+    with run_fake_gemini_server(config) as (base_url, _):
+        http_options = {"base_url": base_url}
+
+        async def per_request_client(api_key: str):
+            client = genai.Client(api_key=api_key, http_options=http_options)
+            await asyncio.to_thread(client.models.generate_content, model=GEMINI_MODEL_NAME, contents=CONTENTS)
+
+        pool = GenAIClientPool(base_url=base_url, max_concurrent_calls=args.concurrency)
+
+        async def pooled_async_client(api_key: str):
+            client = pool.get_client(api_key)
+            async with pool.call_slot():
+                await client.aio.models.generate_content(model=GEMINI_MODEL_NAME, contents=CONTENTS)
+
+        results = [
+            await _run("per_request_client_to_thread", per_request_client, args.requests, args.concurrency, args.keys),
+            await _run("pooled_native_async", pooled_async_client, args.requests, args.concurrency, args.keys),
+        ]
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--keys", type=int, default=4, help="Distinct API keys spread across requests")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake upstream latency in seconds")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+    results = asyncio.run(main(args))
+    write_results("client_pool", results, args.output, **{k: v for k, v in vars(args).items() if k != "output"})
@@ -0,0 +1,84 @@
+# WISE_backend/benchmarks/bench_micro.py
+
+"""
+Microbenchmarks for the CPU-bound steps around the model call: text
+extraction (.txt/.md decode, streaming .docx parse) and the
+manipulationByCategory aggregation in finalize_result. Nothing here touches
+the network.
+
+Usage (from WISE_backend):
+    python -m benchmarks.bench_micro --output micro.json
+"""
+import argparse
+import statistics
+import time
+from typing import Callable, List
+
+from app.analysis_module import finalize_result
+from app.extraction import extract_text
+from benchmarks.documents import MAKERS, CONTENT_TYPES
+from benchmarks.fake_gemini import sample_analysis
+from benchmarks.results import write_results
+
+
+def measure(name: str, fn: Callable[[], object], repeat: int, min_seconds: float = 0.2, **info) -> dict:
+    """Times fn in batches sized to run at least min_seconds; reports per-call min/median over repeat batches."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - started >= min_seconds / 10 or number >= 1_000_000:
+            break
+        number *= 10
+    per_call = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - started) / number)
+    return {
+        "name": name,
+        **info,
+        "calls_per_batch": number,
+        "min_us": round(min(per_call) * 1e6, 2),
+        "median_us": round(statistics.median(per_call) * 1e6, 2),
+    }
+
+
+def bench_extraction(sizes: List[int], repeat: int) -> List[dict]:
+    results = []
+    for kind in MAKERS:
+        for size in sizes:
+            payload = MAKERS[kind](size)
+            filename = f"benchmark.{kind}"
+            results.append(measure(
+                f"extract/{kind}-{size}", lambda: extract_text(payload, filename, CONTENT_TYPES[kind]), repeat,
+                file_bytes=len(payload),
+            ))
+    return results
+
+
+def bench_aggregation(tactic_counts: List[int], repeat: int) -> List[dict]:
+    results = []
+    for count in tactic_counts:
+        template = sample_analysis(count)
+        # finalize_result mutates its argument, so each call gets its own shallow copy of the mutated parts
+        fresh = lambda: {**template, "metadata": dict(template["metadata"]), "tactics": template["tactics"]}
+        results.append(measure(f"finalize_result/{count}-tactics", lambda: finalize_result(fresh()), repeat,
+                               tactics=count))
+        results.append(measure(f"finalize_result_copy_baseline/{count}-tactics", fresh, repeat, tactics=count))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 200_000, 1_000_000],
+                        help="Document sizes in characters for the extraction benchmarks")
+    parser.add_argument("--tactics", type=int, nargs="+", default=[6, 60, 600],
+                        help="Tactic counts for the aggregation benchmarks")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+    results = bench_extraction(args.sizes, args.repeat) + bench_aggregation(args.tactics, args.repeat)
+    write_results("micro", results, args.output, **{k: v for k, v in vars(args).items() if k != "output"})
@@ -0,0 +1,62 @@
+# WISE_backend/benchmarks/bench_serialization.py
+
+"""
+Payload size and serialization time of analysis responses.
+
+For each tactic count, compares the previous response path (FastAPI's
+jsonable_encoder followed by json.dumps), render_result (validation against
+FinalAnalysisResult plus pydantic-core serialization) in the full and compact
+views, and dumps() on an unvalidated dict (orjson if installed, else json).
+Each result records the body size, raw and gzipped.
+
+Usage (from WISE_backend):
+    python -m benchmarks.bench_serialization --output serialization.json
+"""
+import argparse
+import gzip
+import json
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+
+from app.analysis_module import finalize_result, render_result
+from app import serialization
+from benchmarks.bench_micro import measure
+from benchmarks.fake_gemini import sample_analysis
+from benchmarks.results import write_results
+
+
+def finished_result(tactic_count: int) -> dict:
+    """A result as run_wise returns it: finalized, with a quote span per tactic."""
+    result = finalize_result(sample_analysis(tactic_count))
+    for position, tactic in enumerate(result["tactics"]):
+        tactic["quoteSpan"] = {"start": position * 100, "end": position * 100 + 45, "matchScore": 1.0}
+    return result
+
+
+def bench_serialization(tactic_counts: List[int], repeat: int) -> List[dict]:
+    encoder = "orjson" if serialization.orjson is not None else "json"
+    results = []
+    for count in tactic_counts:
+        result = finished_result(count)
+        paths = [
+            ("jsonable_encoder_baseline", lambda: json.dumps(jsonable_encoder(result)).encode("utf-8")),
+            ("render_result_full", lambda: render_result(result)),
+            ("render_result_compact", lambda: render_result(result, compact=True)),
+            (f"dumps_{encoder}_unvalidated", lambda: serialization.dumps(result)),
+        ]
+        for name, fn in paths:
+            body = fn()
+            results.append(measure(f"{name}/{count}-tactics", fn, repeat, tactics=count, bytes=len(body),
+                                   gzip_bytes=len(gzip.compress(body, compresslevel=6))))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tactics", type=int, nargs="+", default=[6, 60, 600])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+    write_results("serialization", bench_serialization(args.tactics, args.repeat), args.output,
+                  **{k: v for k, v in vars(args).items() if k != "output"})
@@ -0,0 +1,74 @@
+# WISE_backend/benchmarks/compare.py
+
+"""
+Compares two benchmark result files (e.g. from two commits) and flags
+regressions. Results are matched by name; for each shared numeric metric the
+relative change is printed. Latency metrics (*_ms, *_us) regress when they
+grow, throughput (*_rps) when it shrinks; other fields are not compared.
+
+Usage (from WISE_backend):
+    python -m benchmarks.compare before.json after.json --threshold 10
+Exits with status 1 if any metric regressed by more than --threshold percent.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Optional
+
+LOWER_IS_BETTER = ("_ms", "_us")
+HIGHER_IS_BETTER = ("_rps",)
+
+
+def load_results(path: str) -> Dict[str, dict]:
+    with open(path) as f:
+        report = json.load(f)
+    results = report["results"] if isinstance(report, dict) else report # bare lists from older runs
+    return {result.get("name") or result.get("path"): result for result in results}
+
+
+def _direction(metric: str) -> Optional[int]:
+    if metric.endswith(HIGHER_IS_BETTER):
+        return 1
+    if metric.endswith(LOWER_IS_BETTER):
+        return -1
+    return None
+
+
+def compare(before: Dict[str, dict], after: Dict[str, dict], threshold: float) -> List[dict]:
+    rows = []
+    for name in before.keys() & after.keys():
+        for metric, old in before[name].items():
+            new = after[name].get(metric)
+            direction = _direction(metric)
+            if direction is None or not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or not old:
+                continue
+            change = (new - old) / old * 100
+            rows.append({
+                "name": name, "metric": metric, "before": old, "after": new, "change_pct": round(change, 1),
+                "regression": -change * direction > threshold,
+            })
+    return sorted(rows, key=lambda row: (row["name"], row["metric"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed regression in percent")
+    parser.add_argument("--json", action="store_true", help="Print the comparison as JSON")
+    args = parser.parse_args()
+
+    before, after = load_results(args.before), load_results(args.after)
+    rows = compare(before, after, args.threshold)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        for row in rows:
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(f"{row['name']:<48} {row['metric']:<22} {row['before']:>12} -> {row['after']:>12} "
+                  f"({row['change_pct']:+.1f}%){flag}")
+        for name in sorted(before.keys() - after.keys()):
+            print(f"{name}: only in {args.before}")
+        for name in sorted(after.keys() - before.keys()):
+            print(f"{name}: only in {args.after}")
+    sys.exit(1 if any(row["regression"] for row in rows) else 0)
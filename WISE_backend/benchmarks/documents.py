@@ -0,0 +1,108 @@
+# WISE_backend/benchmarks/documents.py
+
+"""
+Deterministic synthetic documents for benchmarks: plain text, Markdown and
+.docx of a requested size. Some paragraphs contain manipulation cue phrases
+so the local pre-screen has realistic work to do.
+"""
+import io
+import random
+import zipfile
+from typing import List
+from xml.sax.saxutils import escape
+
+_WORDS = (
+    "the council said budget plan city residents new policy report school health local workers "
+    "market public community data proposal funding service committee review support change cost "
+    "families business transport housing energy water safety season members approved announced"
+).split()
+_CUES = [
+    "Everyone knows this is the only way forward.",
+    "They stole our future and we are sick and tired of it.",
+    "Act now before it's too late!",
+    "Experts agree that there is no alternative.",
+    "Either you support this or you want the city to fail.",
+    "Join the thousands of families who already signed up.",
+]
+
+
+def make_paragraphs(target_chars: int, seed: int = 0, cue_every: int = 4) -> List[str]:
+    """Paragraphs of 3-6 sentences totalling roughly target_chars characters."""
+    rng = random.Random(seed)
+    paragraphs: List[str] = []
+    total = 0
+    while total < target_chars:
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 18))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        if cue_every and len(paragraphs) % cue_every == 0:
+            sentences.insert(rng.randint(0, len(sentences)), rng.choice(_CUES))
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 1
+    return paragraphs
+
+
+def make_text(target_chars: int, seed: int = 0) -> bytes:
+    return "\n".join(make_paragraphs(target_chars, seed)).encode("utf-8")
+
+
+def make_markdown(target_chars: int, seed: int = 0) -> bytes:
+    lines = []
+    for i, paragraph in enumerate(make_paragraphs(target_chars, seed)):
+        if i % 5 == 0:
+            lines.append(f"## Section {i // 5 + 1}")
+        lines.append(f"- {paragraph}" if i % 7 == 3 else paragraph)
+    return "\n".join(lines).encode("utf-8")
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+
+def make_docx(target_chars: int, seed: int = 0) -> bytes:
+    """A minimal valid .docx; each paragraph is split into two runs and every 10th sits in a table."""
+    body = []
+    for i, paragraph in enumerate(make_paragraphs(target_chars, seed)):
+        half = len(paragraph) // 2
+        runs = "".join(f'<w:r><w:t xml:space="preserve">{escape(part)}</w:t></w:r>'
+                       for part in (paragraph[:half], paragraph[half:]))
+        xml = f"<w:p>{runs}</w:p>"
+        if i % 10 == 9:
+            xml = f"<w:tbl><w:tr><w:tc>{xml}</w:tc></w:tr></w:tbl>"
+        body.append(xml)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{"".join(body)}</w:body></w:document>'
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _RELS)
+        archive.writestr("word/document.xml", document)
+    return buffer.getvalue()
+
+
+MAKERS = {"txt": make_text, "md": make_markdown, "docx": make_docx}
+CONTENT_TYPES = {
+    "txt": "text/plain",
+    "md": "text/markdown",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
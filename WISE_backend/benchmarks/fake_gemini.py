@@ -0,0 +1,165 @@
+# WISE_backend/benchmarks/fake_gemini.py
+
+"""
+Local stand-in for the Google Generative Language API used by benchmarks.
+
+Implements the two endpoints the SDK calls for analysis
+(models/{model}:generateContent and :streamGenerateContent) and answers with
+a canned AnalysisResultFromAPI document after a configurable delay. A share
+of responses can be turned into API errors (e.g. 429/503) or malformed JSON
+to exercise the failure paths. Point the backend at it with
+WISE_GENAI_BASE_URL or GenAIClientPool(base_url=...).
+"""
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def sample_analysis(tactic_count: int = 6) -> dict:
+    """A valid AnalysisResultFromAPI payload with tactic_count tactics."""
+    intents = ["Blatant Manipulation", "Borderline Manipulation", "Legitimate Use"]
+    categories = ["Emotional Appeal", "Logical Fallacy", "Language"]
+    tactics = [
+        {
+            "id": (i % 21) + 1,
+            "name": f"Tactic {(i % 21) + 1}",
+            "category": categories[i % len(categories)],
+            "intent": intents[i % len(intents)],
+            "quote": f"Benchmark quote number {i} from the document.",
+            "explanation": "Explanation of how the tactic is used in this excerpt. " * 3,
+            "resistanceStrategy": "Pause and check the evidence behind the claim. " * 2,
+        }
+        for i in range(tactic_count)
+    ]
+    return {
+        "metadata": {
+            "author": None,
+            "date": "2025-01-01",
+            "overallIntent": "Primarily Manipulation",
+            "confidenceScore": 80,
+            "tacticDensity": "Medium",
+            "input_data_description": "Benchmark document",
+        },
+        "executive_summary": {
+            "primary_intent": "Primarily Manipulation",
+            "tactic_density": "Medium",
+            "dominant_tactics": "Tactic 1, Tactic 2",
+            "structural_bias": "One-sided framing throughout.",
+        },
+        "intentBreakdown": [{"name": name, "value": sum(t["intent"] == name for t in tactics)} for name in intents],
+        "overall_assessment": {
+            "summary_text": "The text relies on emotional framing more than evidence. " * 4,
+            "confidence_score_note": "Confidence reflects the number of clear examples.",
+        },
+        "tactics": tactics,
+        "detailed_report_sections": {
+            "confidence_levels_discussion": "Discussion of confidence levels. " * 10,
+            "context_handling": "Discussion of context handling. " * 10,
+            "persuasion_vs_manipulation_distinction": "Discussion of the distinction. " * 10,
+            "manipulative_elements_summary": "Summary of manipulative elements. " * 10,
+        },
+    }
+
+
+@dataclass
+class FakeGeminiConfig:
+    latency_seconds: float = 0.2 # Delay before the (first byte of the) response
+    latency_jitter_seconds: float = 0.0 # Uniform extra delay in [0, jitter]
+    tactic_count: int = 6
+    stream_chunk_chars: int = 80 # Size of each streamed text fragment
+    stream_interval_seconds: float = 0.01 # Delay between streamed fragments
+    error_rate: float = 0.0 # Share of requests answered with an API error
+    error_status: int = 503 # HTTP status of those errors (429, 500, 503, ...)
+    error_models: tuple = () # Only inject errors for these model names (e.g. to exercise a fallback); empty = all
+    malformed_rate: float = 0.0 # Share of requests answered with truncated, invalid JSON
+    seed: int = 0 # Seeds the error/malformed/jitter draws so runs are repeatable
+
+
+_ERROR_STATUS_NAMES = {400: "INVALID_ARGUMENT", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE", 504: "DEADLINE_EXCEEDED"}
+
+
+def _error_payload(status: int) -> dict:
+    return {"error": {"code": status, "message": "Injected by the fake Gemini server.",
+                      "status": _ERROR_STATUS_NAMES.get(status, "UNKNOWN")}}
+
+
+def _candidate_payload(text: str) -> dict:
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {"promptTokenCount": 1000, "candidatesTokenCount": len(text) // 4},
+    }
+
+
+def create_fake_gemini_app(config: FakeGeminiConfig) -> FastAPI:
+    app = FastAPI(title="Fake Gemini")
+    app.state.config = config
+    app.state.request_count = 0
+    app.state.injected = {"errors": 0, "malformed": 0}
+    rng = random.Random(config.seed)
+
+    @app.post("/{api_version}/models/{model_action}")
+    async def generate(api_version: str, model_action: str, request: Request):
+        cfg: FakeGeminiConfig = app.state.config
+        app.state.request_count += 1
+        await request.body()
+        draw = rng.random()
+        await asyncio.sleep(cfg.latency_seconds + rng.uniform(0, cfg.latency_jitter_seconds))
+
+        model = model_action.split(":")[0]
+        model_failing = not cfg.error_models or model in {name.split("/")[-1] for name in cfg.error_models}
+        if draw < cfg.error_rate and model_failing:
+            app.state.injected["errors"] += 1
+            return JSONResponse(_error_payload(cfg.error_status), status_code=cfg.error_status)
+        text = json.dumps(sample_analysis(cfg.tactic_count))
+        if cfg.error_rate <= draw < cfg.error_rate + cfg.malformed_rate:
+            app.state.injected["malformed"] += 1
+            text = text[:len(text) // 2] # Cut mid-document, as with a truncated generation
+
+        if model_action.endswith(":streamGenerateContent"):
+            async def fragments():
+                for i in range(0, len(text), cfg.stream_chunk_chars):
+                    yield f"data: {json.dumps(_candidate_payload(text[i:i + cfg.stream_chunk_chars]))}\r\n\r\n"
+                    await asyncio.sleep(cfg.stream_interval_seconds)
+            return StreamingResponse(fragments(), media_type="text/event-stream")
+        return JSONResponse(_candidate_payload(text))
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve_in_thread(app):
+    """Runs an ASGI app with uvicorn on a free local port in a background thread and yields its base URL."""
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", backlog=4096))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+@contextmanager
+def run_fake_gemini_server(config: FakeGeminiConfig = None):
+    """Runs the fake API in a background thread and yields (base URL, app)."""
+    app = create_fake_gemini_app(config or FakeGeminiConfig())
+    with serve_in_thread(app) as base_url:
+        yield base_url, app
@@ -0,0 +1,66 @@
+# WISE_backend/benchmarks/results.py
+
+"""
+Shared result format for the benchmarks, so runs from different commits can
+be diffed with benchmarks.compare:
+
+    {"benchmark": ..., "environment": {...}, "results": [{"name": ..., <metrics>}, ...]}
+"""
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+from typing import List, Optional, Sequence
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def latency_summary(latencies_seconds: List[float], prefix: str = "") -> dict:
+    """p50/p95/p99/mean/max in milliseconds."""
+    values = sorted(latencies_seconds)
+    if not values:
+        return {}
+    to_ms = lambda seconds: round(seconds * 1000, 2)
+    return {
+        f"{prefix}p50_ms": to_ms(percentile(values, 0.50)),
+        f"{prefix}p95_ms": to_ms(percentile(values, 0.95)),
+        f"{prefix}p99_ms": to_ms(percentile(values, 0.99)),
+        f"{prefix}mean_ms": to_ms(statistics.fmean(values)),
+        f"{prefix}max_ms": to_ms(values[-1]),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5, check=True).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment(**settings) -> dict:
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": settings,
+    }
+
+
+def write_results(benchmark: str, results: List[dict], output: Optional[str] = None, **settings) -> dict:
+    """Prints the results as JSON and writes them to output if given."""
+    report = {"benchmark": benchmark, "environment": environment(**settings), "results": results}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    return report